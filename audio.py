@@ -0,0 +1,283 @@
+"""
+Streaming audio output: resample and write sonified audio a block at a time,
+so that long outputs (slow speed-up factors on multi-day windows are
+gigabytes at 44.1 kHz) are produced in bounded memory.
+
+:class:`LanczosResampler` gives the same samples as
+`Trace.interpolate(method='lanczos')`, one block at a time, and
+:class:`AudioSink` writes them to a WAV (or, with the optional
+:mod:`soundfile` package, FLAC) file as they arrive. Its samples are scaled
+to the full 32-bit range either by a peak given in advance, written straight
+through, or by the peak of the whole output, found in a first pass over a
+temporary file, which gives the same file as
+`Trace.write(format='WAV', width=4, rescale=True)`.
+"""
+
+import os
+import tempfile
+import wave
+from pathlib import Path
+
+import numpy as np
+from obspy.signal.headers import clibsignal
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+BLOCK_SIZE = 2**20  # [samples] Default length of the blocks written at a time
+
+MAXINT = 2**31 - 1  # Full scale of 32-bit samples
+
+
+class LanczosResampler:
+    """
+    Lanczos resampling of data that arrives in consecutive blocks.
+
+    An output sample is computed once the `a` input samples after it have
+    arrived; the input samples needed by later outputs are kept. The
+    concatenated output is that of
+    `Trace.interpolate(sampling_rate=target_fs, method='lanczos', a=a)` on the
+    concatenated input, up to floating point rounding.
+
+    Args:
+        fs (float): Sampling rate of the input [Hz]
+        target_fs (float): Sampling rate of the output [Hz]
+        a (int): Width of the Lanczos window [input samples]
+    """
+
+    def __init__(self, fs, target_fs, a=20):
+        self.a = a
+        self.fs = fs
+        self.target_fs = target_fs
+        self.dt_factor = float(1 / target_fs) / (1 / fs)  # As obspy computes it
+        self.buffer = np.empty(0)
+        self.buffer_off = 0  # Input index of the first buffered sample
+        self.next_out = 0  # Output index of the next sample to compute
+
+    def __call__(self, block):
+        """
+        Add the next block of input samples.
+
+        Args:
+            block (:class:`~numpy.ndarray`): 1-D array following the previous
+                block without a gap
+
+        Returns:
+            :class:`~numpy.ndarray` with the output samples that could be
+            computed so far (possibly empty)
+        """
+
+        self.buffer = np.concatenate([self.buffer, np.asarray(block, dtype=np.float64)])
+        last = self.buffer_off + self.buffer.size - 1 - self.a  # Fully supported
+        return self._emit(int(np.floor(last / self.dt_factor)) + 1)
+
+    def flush(self):
+        """
+        Compute the remaining output samples after the last block.
+
+        Returns:
+            :class:`~numpy.ndarray`
+        """
+
+        # Number of output samples as in Trace.interpolate()
+        duration = (self.buffer_off + self.buffer.size - 1) / self.fs
+        return self._emit(int(np.floor(duration / (1 / self.target_fs))) + 1)
+
+    def _emit(self, stop):
+        """
+        Compute the output samples up to (not including) index `stop`.
+        """
+
+        num_out = stop - self.next_out
+        if num_out <= 0 or not self.buffer.size:
+            return np.empty(0)
+        out = np.zeros(num_out)
+        # The C routine behind obspy's lanczos_interpolation(), which would
+        # reject the last sample of a block by a rounding error
+        clibsignal.lanczos_resample(
+            self.buffer,
+            out,
+            self.dt_factor,
+            self.next_out * self.dt_factor - self.buffer_off,
+            self.buffer.size,
+            num_out,
+            int(self.a),
+            0,  # Lanczos window
+        )
+        self.next_out = stop
+
+        # Keep the input samples within reach of the next output sample
+        keep_from = max(int(np.floor(stop * self.dt_factor)) - self.a, self.buffer_off)
+        self.buffer = self.buffer[keep_from - self.buffer_off:]
+        self.buffer_off = keep_from
+        return out
+
+
+class AudioSink:
+    """
+    Audio file written a block at a time. Use as a context manager, or call
+    :meth:`close` after the last block.
+
+    Args:
+        audio_file (str or :class:`~pathlib.Path`): Output file; `.wav` for a
+            32-bit WAV or `.flac` for a 24-bit FLAC file (which needs the
+            :mod:`soundfile` package)
+        samplerate (int): Sample rate of the file [Hz]
+        channels (int): Number of channels; blocks then have shape
+            (samples, channels)
+        peak (float): Absolute value scaled to full scale. If `None`, the
+            blocks go to a temporary file and are scaled by the peak of the
+            whole output when the sink is closed
+    """
+
+    def __init__(self, audio_file, samplerate, channels=1, peak=None):
+        self.audio_file = Path(str(audio_file))
+        self.format = self.audio_file.suffix.lstrip('.').upper()
+        if self.format not in ('WAV', 'FLAC'):
+            raise ValueError(f'Unsupported audio format {self.format!r}; use .wav or .flac')
+        if self.format == 'FLAC' and soundfile is None:
+            raise ImportError('Writing FLAC files requires the soundfile package')
+        self.samplerate = samplerate
+        self.channels = channels
+        self.peak = peak
+        self.max_abs = 0.0
+        self._file = None
+        if peak is None:
+            self._temp = tempfile.NamedTemporaryFile(
+                dir=self.audio_file.parent, suffix='.f64', delete=False
+            )
+        else:
+            self._temp = None
+            self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+
+    def write(self, block):
+        """
+        Add the next block of samples.
+
+        Args:
+            block (:class:`~numpy.ndarray`): Samples, 1-D for a single channel
+                or of shape (samples, channels)
+        """
+
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self.channels)
+        if not block.size:
+            return
+        self.max_abs = max(self.max_abs, np.abs(block).max())
+        if self._temp is not None:
+            self._temp.write(block.tobytes())
+        else:
+            self._write_frames(block / self.peak * MAXINT)
+
+    def close(self):
+        """
+        Finish the file: scale and write the buffered samples (if no peak was
+        given) and close it.
+
+        Returns:
+            :class:`~pathlib.Path` of the audio file
+        """
+
+        if self._temp is not None:
+            self._temp.close()
+            self.peak = self.max_abs or 1.0
+            self._open()
+            if os.path.getsize(self._temp.name):
+                samples = np.memmap(self._temp.name, dtype=np.float64, mode='r')
+                samples = samples.reshape(-1, self.channels)
+                for i in range(0, samples.shape[0], BLOCK_SIZE):
+                    self._write_frames(samples[i:i + BLOCK_SIZE] / self.peak * MAXINT)
+                del samples
+            os.remove(self._temp.name)
+            self._temp = None
+        elif self.max_abs > self.peak * (1 + 1e-9):  # Beyond rounding
+            print(f'Audio clipped: peak {self.max_abs:g} above the given {self.peak:g}')
+        self._file.close()
+        return self.audio_file
+
+    def _open(self):
+        if self.format == 'WAV':
+            self._file = wave.open(str(self.audio_file), 'wb')
+            self._file.setnchannels(self.channels)
+            self._file.setsampwidth(4)
+            self._file.setframerate(self.samplerate)
+        else:
+            self._file = soundfile.SoundFile(
+                str(self.audio_file),
+                'w',
+                samplerate=self.samplerate,
+                channels=self.channels,
+                format='FLAC',
+                subtype='PCM_24',
+            )
+
+    def _write_frames(self, frames):
+        """
+        Write frames already scaled to the 32-bit range, clipping any beyond.
+        """
+
+        frames = np.clip(frames, -MAXINT, MAXINT).astype(np.int32)
+        if self.format == 'WAV':
+            self._file.writeframes(frames.astype('<i4').tobytes())
+        else:
+            self._file.write(frames)
+
+    def _abort(self):
+        if self._temp is not None:
+            self._temp.close()
+            os.remove(self._temp.name)
+        if self._file is not None:
+            self._file.close()
+
+
+def write_audio(channels, fs, target_fs, audio_file, samplerate, peak=None,
+                block_size=BLOCK_SIZE):
+    """
+    Resample one or more channels and write them to an audio file, a block at
+    a time. Channels of different lengths are cut to the shortest output.
+
+    Args:
+        channels (list): 1-D :class:`~numpy.ndarray` of each channel, sampled
+            at `fs`
+        fs (float): Sampling rate of the data [Hz]
+        target_fs (float): Sampling rate to resample to [Hz]; the data is then
+            played back at `samplerate`
+        audio_file (str or :class:`~pathlib.Path`): See docstring for
+            :class:`AudioSink`
+        samplerate (int): Sample rate of the file [Hz]
+        peak (float): See docstring for :class:`AudioSink`
+        block_size (int): Input samples resampled at a time
+
+    Returns:
+        :class:`~pathlib.Path` of the audio file
+    """
+
+    resamplers = [LanczosResampler(fs, target_fs) for _ in channels]
+    pending = [np.empty(0) for _ in channels]
+    num_in = max(data.size for data in channels)
+
+    with AudioSink(audio_file, samplerate, channels=len(channels), peak=peak) as sink:
+        for i in range(0, num_in + 1, block_size):
+            last = i + block_size > num_in
+            for j, (data, resampler) in enumerate(zip(channels, resamplers)):
+                out = resampler(data[i:i + block_size])
+                if last:
+                    out = np.concatenate([out, resampler.flush()])
+                pending[j] = np.concatenate([pending[j], out])
+            # Write what all channels have; the rest waits for the next block
+            num_out = min(p.size for p in pending)
+            sink.write(np.column_stack([p[:num_out] for p in pending]))
+            pending = [p[num_out:] for p in pending]
+            if last:
+                break
+    return Path(str(audio_file))
@@ -0,0 +1,377 @@
+"""
+Sonify many consecutive (or overlapping) time windows of a data folder in a
+single sweep.
+
+Instead of calling :func:`~sonify_input.sonify_input` from scratch for every
+window, which re-reads the files and re-filters the data shared by adjacent
+windows, :func:`iter_windows` reads the files one at a time and keeps a
+rolling buffer of filtered samples and spectrogram columns. Moving to the
+next window drops the oldest data and adds the newest, so every sample is
+read, filtered and transformed about once.
+"""
+
+import os
+import tempfile
+import warnings
+from pathlib import Path
+
+import numpy as np
+from obspy import Trace
+
+from filtering import filter_data
+from sonify_input import (
+    PAD,
+    PREFILTER_STAGES,
+    QUALITY_PRESETS,
+    RENDERERS,
+    _IncrementalSpectrogram,
+    _bandpass_corners,
+    _ffmpeg_combine,
+    _make_audio,
+    _output_stem,
+)
+from spectral import stft_params
+from utils import read_data_file
+
+
+def iter_windows(
+    path_data,
+    format_in,
+    starttime,
+    endtime,
+    window,
+    step=None,
+    freqmin=None,
+    freqmax=None,
+    speed_up_factor=200,
+    spec_win_dur=5,
+    margin=PAD,
+    stages=None,
+    quality='publication',
+    masked=False,
+):
+    """
+    Iterate over the filtered data and spectrogram of consecutive windows.
+
+    The data is filtered with the same stages as
+    :func:`~sonify_input.sonify_input` (zero-phase), a chunk at a time. Each
+    chunk is filtered together with `margin` seconds of data on either side,
+    which are discarded afterwards, so the result is the same as filtering the
+    whole sweep at once up to the (negligible) filter response beyond
+    `margin`. This needs the data of the next `margin` seconds, so the files
+    are read a little ahead of the window being finished.
+
+    The spectrogram columns are computed on one time grid for the whole sweep
+    (see :class:`~sonify_input._IncrementalSpectrogram`), in steps of the
+    column spacing from `starttime` even if the data starts later; each window
+    gets the columns that lie entirely inside it.
+
+    Args:
+        path_data (str): Path to data files. Files are read in name order, as
+            in :func:`~utils.read_data_from_folder`, and must be in time order
+        format_in (str): Format of data files
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start of the
+            first window
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): No window
+            starts at or after this time
+        window (int or float): Duration of each window [s]
+        step (int or float): Time between the starts of consecutive windows
+            [s] (defaults to `window`, i.e. back-to-back windows)
+        freqmin (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        freqmax (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        speed_up_factor (int): Used for the default bandpass corners
+        spec_win_dur (int or float): Duration of spectrogram window [s], or
+            `None` to skip the spectrogram
+        margin (int or float): Extra data filtered on either side of a chunk
+            [s]
+        stages (list): Filter stages (see :func:`~filtering.chain_sos`) to
+            apply instead of those of :func:`~sonify_input.sonify_input`
+        quality (str): See docstring for :func:`~sonify_input.sonify_input`;
+            sets the spectrogram zero-padding and overlap
+        masked (bool): If `True`, the data of each window is a
+            :class:`~numpy.ma.MaskedArray` with the samples filled in for gaps
+            masked, as after merging a Stream without `fill_value`
+
+    Yields:
+        Tuple of (`win_start`, `win_end`, `tr`, `spec`) with the window times,
+        the filtered :class:`~obspy.core.trace.Trace` of the window and its
+        spectrogram as returned by :func:`~sonify_input._compute_spectrogram`
+        (or `None`). Gaps between files are filled with zeros, so only windows
+        before the first or after the last data are skipped with a warning
+    """
+
+    step = step or window
+    files = iter(_data_files(path_data))
+    tr_id, fs, t0, margin_npts = None, None, None, None
+    raw, raw_off = np.empty(0), 0  # Unfiltered samples, from sample raw_off
+    filt, filt_off = np.empty(0), 0  # Finished (filtered) samples
+    # Whether each sample of the buffers is data rather than a filled gap
+    raw_cov, filt_cov = np.empty(0, dtype=bool), np.empty(0, dtype=bool)
+    spec, spec_skip = None, 0  # Samples to leave out of the spectrogram
+    exhausted = False
+
+    def _index(time):
+        return int(round((time - t0) * fs))  # Sample index relative to t0
+
+    win_start = starttime
+    while win_start < endtime:
+        win_end = win_start + window
+
+        # Read files until the window plus the look-ahead margin is covered
+        while not exhausted and (t0 is None or raw_off + raw.size <= _index(win_end + margin)):
+            file = next(files, None)
+            if file is None:
+                exhausted = True
+                break
+            try:
+                st = read_data_file(file, format_in)
+            except Exception as e:
+                print('Can not read %s (%s: %s)' % (file, type(e).__name__, e))
+                continue
+            if tr_id is None:
+                tr_id = st[0].id
+                fs = st[0].stats.sampling_rate
+                t0 = st[0].stats.starttime
+                stats = st[0].stats.copy()
+                if stages is None:
+                    freq_lim = _bandpass_corners(st[0], freqmin, freqmax, speed_up_factor)
+                    stages = PREFILTER_STAGES + [('bandpass', freq_lim, 4)]
+                    print(f'Applying {freq_lim[0]:g}–{freq_lim[1]:g} Hz bandpass')
+                filt_off = max(0, _index(starttime))
+                margin_npts = int(margin * fs)
+                if spec_win_dur:
+                    nperseg, noverlap, _ = stft_params(
+                        fs,
+                        spec_win_dur,
+                        zero_pad=QUALITY_PRESETS[quality]['zero_pad'],
+                        overlap=QUALITY_PRESETS[quality]['overlap'],
+                    )
+                    # Keep the columns on the grid from starttime
+                    spec_skip = max(-_index(starttime), 0) % (nperseg - noverlap)
+                    spec = _IncrementalSpectrogram(
+                        fs, spec_win_dur, t0 + (filt_off + spec_skip) / fs, quality=quality
+                    )
+            for tr in st.select(id=tr_id):
+                start = _index(tr.stats.starttime)
+                if not raw.size:
+                    # Everything before was dropped (e.g. the sweep starts in a
+                    # gap), so restart the buffer where the next samples to
+                    # filter need it and zero-fill up to the new data
+                    raw_off = min(start, max(filt_off + filt.size - margin_npts, 0))
+                new = np.asarray(tr.data, dtype=np.float64)
+                raw_cov, _ = _append(raw_cov, raw_off, np.ones(new.size, dtype=bool), start)
+                raw, raw_off = _append(raw, raw_off, new, start)
+            # Data before the first window (less the margin) is never needed
+            raw_cov, _ = _drop(raw_cov, raw_off, filt_off - margin_npts)
+            raw, raw_off = _drop(raw, raw_off, filt_off - margin_npts)
+
+        if t0 is None:
+            break  # No data at all
+
+        # Filter the new part of the window, with margins on either side
+        done = filt_off + filt.size
+        target = min(_index(win_end) + 1, raw_off + raw.size)
+        if target > done:
+            lo = max(done - margin_npts, raw_off)
+            hi = min(target + margin_npts, raw_off + raw.size)
+            new = filter_data(raw[lo - raw_off:hi - raw_off], fs, stages)[done - lo:target - lo]
+            filt = np.concatenate([filt, new])
+            filt_cov = np.concatenate([filt_cov, raw_cov[done - raw_off:target - raw_off]])
+            if spec is not None:
+                spec.extend(new[spec_skip:])
+                spec_skip = max(spec_skip - new.size, 0)
+            raw_cov, _ = _drop(raw_cov, raw_off, target - margin_npts)
+            raw, raw_off = _drop(raw, raw_off, target - margin_npts)
+
+        # Cut the window from the rolling buffer
+        i0 = max(_index(win_start), filt_off)
+        i1 = min(_index(win_end) + 1, filt_off + filt.size)
+        if i1 - i0 > 0:
+            stats.starttime = t0 + i0 / fs
+            stats.npts = i1 - i0
+            data = filt[i0 - filt_off:i1 - filt_off].copy()
+            if masked:
+                data = np.ma.masked_array(data, mask=~filt_cov[i0 - filt_off:i1 - filt_off])
+            tr_win = Trace(data=data, header=stats.copy())
+            win_spec = spec.between(win_start, win_end) if spec is not None else None
+            yield win_start, win_end, tr_win, win_spec
+        else:
+            warnings.warn(f'No data between {win_start} and {win_end}. Skipping!')
+
+        # Drop what the next window does not need
+        win_start += step
+        keep_from = _index(win_start)
+        if keep_from > filt_off:
+            filt_cov, _ = _drop(filt_cov, filt_off, keep_from)
+            filt, filt_off = _drop(filt, filt_off, keep_from)
+            if spec is not None:
+                spec.drop_before(win_start)
+
+
+def sonify_windows(
+    path_data,
+    format_in,
+    starttime,
+    endtime,
+    window,
+    step=None,
+    freqmin=None,
+    freqmax=None,
+    speed_up_factor=200,
+    fps=None,
+    resolution=None,
+    output_dir=None,
+    spec_win_dur=5,
+    db_lim='smart',
+    log=False,
+    audio_only=False,
+    renderer='matplotlib',
+    quality='publication',
+):
+    r"""
+    Produce the animated spectrogram (or only the audio) of every window of a
+    sweep, reusing the data shared by adjacent windows; see
+    :func:`iter_windows`. The outputs are named as those of
+    :func:`~sonify_input.sonify_input`.
+
+    Args:
+        path_data (str): See docstring for :func:`iter_windows`
+        format_in (str): Format of data files
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): See
+            docstring for :func:`iter_windows`
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): See docstring
+            for :func:`iter_windows`
+        window (int or float): Duration of each window [s]
+        step (int or float): See docstring for :func:`iter_windows`
+        freqmin (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        freqmax (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        speed_up_factor (int): See docstring for
+            :func:`~sonify_input.sonify_input`
+        fps (int): See docstring for :func:`~sonify_input.sonify_input`
+        resolution (str): See docstring for :func:`~sonify_input.sonify_input`
+        output_dir (str or :class:`~pathlib.Path`): Directory where output files
+            should be saved (defaults to :meth:`~pathlib.Path.cwd`)
+        spec_win_dur (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        db_lim (tuple or str): See docstring for
+            :func:`~sonify_input.sonify_input`
+        log (bool): See docstring for :func:`~sonify_input.sonify_input`
+        audio_only (bool): See docstring for
+            :func:`~sonify_input.sonify_input`
+        renderer (str): See docstring for :func:`~sonify_input.sonify_input`
+        quality (str): See docstring for :func:`~sonify_input.sonify_input`
+
+    Returns:
+        List of :class:`~pathlib.Path` of the output files, one per window
+        with data
+    """
+
+    # Capture args and format as string to store in movie metadata
+    key_value_pairs = [f'{k}={repr(v)}' for k, v in locals().items()]
+    call_str = 'sonify_windows({})'.format(', '.join(key_value_pairs))
+
+    if renderer not in RENDERERS:
+        raise ValueError(f'Renderer must be one of {list(RENDERERS)}')
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f'Quality must be one of {list(QUALITY_PRESETS)}')
+    fps = fps or QUALITY_PRESETS[quality]['fps']
+    resolution = resolution or QUALITY_PRESETS[quality]['resolution']
+
+    # Use current working directory if none provided
+    if not output_dir:
+        output_dir = Path().cwd()
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+    output_dir = Path(str(output_dir)).expanduser().resolve()
+
+    output_files = []
+    for win_start, win_end, tr, spec in iter_windows(
+        path_data,
+        format_in,
+        starttime,
+        endtime,
+        window,
+        step=step,
+        freqmin=freqmin,
+        freqmax=freqmax,
+        speed_up_factor=speed_up_factor,
+        spec_win_dur=spec_win_dur,
+        quality=quality,
+    ):
+        stem = _output_stem(tr, speed_up_factor)
+        audio_file = output_dir / f'{stem}.wav'
+        _make_audio(tr, speed_up_factor, audio_file)
+        if audio_only:
+            output_files.append(audio_file)
+            continue
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            video_file = Path(temp_dir) / '47.mp4'
+            RENDERERS[renderer](
+                [tr],
+                tr,
+                win_start,
+                win_end,
+                True,
+                1,
+                spec_win_dur,
+                db_lim,
+                _bandpass_corners(tr, freqmin, freqmax, speed_up_factor),
+                log,
+                False,
+                resolution,
+                fps,
+                speed_up_factor,
+                video_file,
+                specs=[spec],
+                quality=quality,
+            )
+            output_file = output_dir / f'{stem}.mp4'
+            _ffmpeg_combine(audio_file, video_file, output_file, call_str)
+        output_files.append(output_file)
+
+    return output_files
+
+
+def _data_files(path_data):
+    """
+    Data files of a folder in name order.
+    """
+
+    files = [os.path.join(path_data, name) for name in sorted(os.listdir(path_data))]
+    return [file for file in files if os.path.isfile(file)]
+
+
+def _append(data, offset, new, start):
+    """
+    Append samples starting at sample index `start` to a buffer starting at
+    sample index `offset` (an empty buffer too). Gaps are filled with zeros
+    (`False` for a boolean buffer) and overlapping samples are dropped, as
+    when merging.
+
+    Returns:
+        Tuple of (`data`, `offset`) of the extended buffer
+    """
+
+    gap = start - (offset + data.size)
+    if gap < 0:
+        new = new[-gap:]
+    elif gap:
+        new = np.concatenate([np.zeros(gap, dtype=new.dtype), new])
+    return np.concatenate([data, new]), offset
+
+
+def _drop(data, offset, keep_from):
+    """
+    Drop the samples of a buffer before sample index `keep_from`.
+
+    Returns:
+        Tuple of (`data`, `offset`) of the remaining buffer
+    """
+
+    num_drop = min(max(keep_from - offset, 0), data.size)
+    return data[num_drop:], offset + num_drop
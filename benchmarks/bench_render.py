@@ -0,0 +1,235 @@
+"""
+Benchmark the Matplotlib renderer of sonify_input on synthetic data: the time
+to build the figure, to draw each frame and to encode the frames, for every
+duration of the animated data, resolution, spectrogram window length and
+quality preset (which sets the spectrogram shading). The figure is built with
+the same arguments as in :func:`~sonify_input.sonify_input`. Results are
+written to JSON and can be compared with an earlier run, so that renderer
+changes can be judged on numbers.
+
+The frames are drawn as :class:`~matplotlib.animation.FuncAnimation` saves
+them (the update function of the animation, then a raw RGBA
+:meth:`~matplotlib.figure.Figure.savefig`) and encoded with the arguments
+Matplotlib passes to FFmpeg, but in two separate steps so that both are timed.
+
+Usage (from the repository root):
+
+    python benchmarks/bench_render.py --output baseline.json
+    python benchmarks/bench_render.py --baseline baseline.json --output new.json
+    python benchmarks/bench_render.py --durations 600 3600 --output long.json
+"""
+
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+from obspy import Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sonify_input import (  # noqa: E402
+    FIGURE_WIDTH,
+    PAD,
+    QUALITY_PRESETS,
+    RESOLUTIONS,
+    _bandpass_corners,
+    _compute_spectrogram,
+    _frame_updater,
+    _spectrogram_stack,
+)
+
+STARTTIME = UTCDateTime(2021, 10, 9, 12)
+SPEED_UP_FACTOR = 200  # Default of sonify_input, sets the bandpass corners
+
+# Waveform and spectrogram arguments as set by sonify_input
+IS_INFRASOUND = True
+RESCALE = 1  # No conversion
+REF_VAL = 1
+
+
+def synthetic_trace(duration, fs, seed=0):
+    """
+    Make a trace of noise with a rising chirp, starting
+    :data:`~sonify_input.PAD` before `STARTTIME` and ending `PAD` after its
+    end, like the data read by :func:`~sonify_input.sonify_input`.
+
+    Args:
+        duration (int or float): Duration of the animated interval [s]
+        fs (int or float): Sampling rate [Hz]
+        seed (int): Seed of the noise
+
+    Returns:
+        :class:`~obspy.core.trace.Trace`
+    """
+
+    t = np.arange(int((duration + 2 * PAD) * fs)) / fs
+    freq = 0.05 * fs + 0.3 * fs * t / t[-1]
+    data = np.random.default_rng(seed).normal(0, 1, t.size)
+    data += 5 * np.sin(2 * np.pi * np.cumsum(freq) / fs) * np.hanning(t.size)
+    header = dict(network='XX', station='SYN', channel='HHZ', sampling_rate=fs,
+                  starttime=STARTTIME - PAD)
+    return Trace(data=data, header=header)
+
+
+def bench_case(tr, duration, resolution, spec_win_dur, quality, num_frames, out_dir):
+    """
+    Time one renderer configuration.
+
+    Returns:
+        dict of the figure construction time [s], the median time to draw a
+        frame [s], the time to encode a frame [s] and the resulting frames
+        per second
+    """
+
+    starttime, endtime = STARTTIME, STARTTIME + duration
+    dpi = RESOLUTIONS[resolution][0] / FIGURE_WIDTH
+    specs = [_compute_spectrogram(tr, spec_win_dur, REF_VAL, quality)]
+    freq_lim = _bandpass_corners(tr, None, None, SPEED_UP_FACTOR)
+
+    with matplotlib.rc_context(
+        {'font.sans-serif': 'Tex Gyre Heros', 'mathtext.fontset': 'custom'}
+    ):
+        t = time.perf_counter()
+        fig, *fargs = _spectrogram_stack(
+            [tr], starttime, endtime, IS_INFRASOUND, RESCALE, spec_win_dur, 'smart',
+            freq_lim, False, False, resolution, specs=specs, quality=quality,
+        )
+        fig.canvas.draw()  # Layout and text are only resolved on the first draw
+        construct = time.perf_counter() - t
+
+        times = np.array([starttime + duration * (i + 0.5) / num_frames
+                          for i in range(num_frames)])
+        update = _frame_updater([tr], times, RESCALE)
+        frames, draw = [], []
+        for i in range(num_frames):
+            t = time.perf_counter()
+            update(i, *fargs)
+            buf = io.BytesIO()
+            fig.savefig(buf, format='rgba', dpi=dpi)
+            draw.append(time.perf_counter() - t)
+            frames.append(buf.getvalue())
+
+    width = int(round(fig.get_figwidth() * dpi))
+    height = len(frames[0]) // (4 * width)
+    encoder_preset = QUALITY_PRESETS[quality]['encoder_preset']
+    args = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-vcodec', 'rawvideo',
+            '-s', f'{width}x{height}', '-pix_fmt', 'rgba', '-framerate', '1', '-i', 'pipe:',
+            '-vcodec', 'h264', '-pix_fmt', 'yuv420p']
+    if encoder_preset:
+        args += ['-preset', encoder_preset]
+    # x264 needs even dimensions; Matplotlib adjusts the figure size for this
+    args += ['-vf', 'crop=trunc(iw/2)*2:trunc(ih/2)*2', str(Path(out_dir) / 'bench.mp4')]
+    t = time.perf_counter()
+    subprocess.run(args, input=b''.join(frames), check=True)
+    encode = (time.perf_counter() - t) / num_frames
+
+    draw = float(np.median(draw))
+    return dict(
+        construct_s=construct,
+        draw_s=draw,
+        encode_s=encode,
+        fps=1 / (draw + encode),
+        size=[width, height],
+        shading=QUALITY_PRESETS[quality]['shading'],
+    )
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change of each timing relative to a baseline.
+
+    Returns:
+        List of the (case, timing) pairs more than `tolerance` slower
+    """
+
+    slower = []
+    print(f'\n{"case":40} {"timing":12} {"baseline":>10} {"now":>10} {"change":>8}')
+    for case, timings in results['cases'].items():
+        if case not in baseline['cases']:
+            continue
+        for key in 'construct_s', 'draw_s', 'encode_s':
+            old, new = baseline['cases'][case][key], timings[key]
+            change = new / old - 1
+            flag = ''
+            if change > tolerance:
+                slower.append((case, key))
+                flag = '  slower'
+            print(f'{case:40} {key:12} {old:10.4f} {new:10.4f} {change:+8.1%}{flag}')
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--resolutions', nargs='+', default=list(RESOLUTIONS), choices=RESOLUTIONS.keys()
+    )
+    parser.add_argument('--spec_win_durs', nargs='+', default=[5], type=float)
+    parser.add_argument(
+        '--qualities', nargs='+', default=list(QUALITY_PRESETS),
+        choices=QUALITY_PRESETS.keys(),
+    )
+    parser.add_argument('--frames', default=5, type=int, help='frames drawn per case')
+    parser.add_argument(
+        '--durations', nargs='+', default=[600], type=float,
+        help='animated intervals of the data [s]',
+    )
+    parser.add_argument('--fs', default=100, type=float, help='sampling rate of the data [Hz]')
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare with')
+    parser.add_argument(
+        '--tolerance', default=0.1, type=float,
+        help='fraction by which a timing may exceed the baseline',
+    )
+    args = parser.parse_args()
+
+    results = dict(
+        meta=dict(
+            python=platform.python_version(),
+            matplotlib=matplotlib.__version__,
+            numpy=np.__version__,
+            machine=platform.machine(),
+            processor=platform.processor(),
+            frames=args.frames,
+            fs=args.fs,
+        ),
+        cases={},
+    )
+    print(f'{"case":40} {"shading":8} {"construct":>10} {"draw":>9} {"encode":>9} {"fps":>7}')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for duration in args.durations:
+            tr = synthetic_trace(duration, args.fs)
+            for resolution in args.resolutions:
+                for spec_win_dur in args.spec_win_durs:
+                    for quality in args.qualities:
+                        case = f'{duration:g}s/{resolution}/{spec_win_dur:g}s/{quality}'
+                        r = bench_case(tr, duration, resolution, spec_win_dur, quality,
+                                       args.frames, temp_dir)
+                        results['cases'][case] = dict(duration=duration, **r)
+                        print(f'{case:40} {r["shading"]:8} {r["construct_s"]:8.3f} s '
+                              f'{r["draw_s"]:7.3f} s {r["encode_s"]:7.3f} s {r["fps"]:7.2f}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'] != results['meta']:
+            print('\nWarning: the baseline was run with other settings or software:')
+            print(f'  {baseline["meta"]}')
+        slower = compare(results, baseline, args.tolerance)
+        if slower:
+            print(f'\n{len(slower)} timings are more than {args.tolerance:.0%} slower')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Compare the float32 and float64 data paths of sonify_input: accuracy of the
+filtered data, spectrogram and audio, and the time and memory of each stage.
+
+Usage (from the repository root):
+
+    python benchmarks/precision.py <path_data> <format_in> <starttime> <endtime>
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from obspy import UTCDateTime
+from scipy.io import wavfile
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from filtering import filter_traces  # noqa: E402
+from sonify_input import (  # noqa: E402
+    PREFILTER_STAGES,
+    PRECISIONS,
+    _bandpass_corners,
+    _compute_spectrogram,
+    _load_trace,
+    _make_audio,
+    sonify_input,
+)
+
+
+def run_stages(path_data, format_in, starttime, endtime, precision, freqmin,
+               freqmax, speed_up_factor, spec_win_dur, output_dir):
+    """
+    Run the stages of sonify_input one by one, timing each and tracking the
+    peak memory they allocate.
+
+    Returns:
+        Tuple of (`results`, `stats`) with the filtered data, spectrogram and
+        audio samples, and per stage the (time [s], peak memory [MB])
+    """
+
+    stats = {}
+
+    def _measure(name, func, *args, **kwargs):
+        tracemalloc.start()
+        t = time.perf_counter()
+        out = func(*args, **kwargs)
+        elapsed = time.perf_counter() - t
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        stats[name] = elapsed, peak
+        return out
+
+    tr = _measure(
+        'read', _load_trace, path_data, format_in, starttime, endtime,
+        dtype=PRECISIONS[precision],
+    )
+    corners = _bandpass_corners(tr, freqmin, freqmax, speed_up_factor)
+    _measure('filter', filter_traces, [tr], PREFILTER_STAGES + [('bandpass', corners, 4)])
+    tr_trim = tr.slice(starttime, endtime)
+    f, t_mpl, sxx_db = _measure('spectrogram', _compute_spectrogram, tr, spec_win_dur, 1)
+    audio_file = Path(output_dir) / f'{precision}.wav'
+    _measure('audio', _make_audio, tr_trim, speed_up_factor, audio_file)
+    audio = wavfile.read(audio_file)[1].astype(np.float64)
+
+    results = dict(data=tr_trim.data, sxx_db=sxx_db, audio=audio)
+    return results, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path_data', help='path to data files')
+    parser.add_argument('format_in', help='format of data files, e.g. PICKLE')
+    parser.add_argument('starttime', type=UTCDateTime, help='start time (UTC)')
+    parser.add_argument('endtime', type=UTCDateTime, help='end time (UTC)')
+    parser.add_argument('--freqmin', default=None, type=float)
+    parser.add_argument('--freqmax', default=None, type=float)
+    parser.add_argument('--speed_up_factor', default=200, type=int)
+    parser.add_argument('--spec_win_dur', default=5, type=float)
+    parser.add_argument(
+        '--render',
+        action='store_true',
+        help='also time complete sonify_input runs (with video) for both precisions',
+    )
+    args = parser.parse_args()
+
+    # Warm up the file cache, so that the first run is not penalized
+    _load_trace(args.path_data, args.format_in, args.starttime, args.endtime)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        runs = {
+            precision: run_stages(
+                args.path_data, args.format_in, args.starttime, args.endtime,
+                precision, args.freqmin, args.freqmax, args.speed_up_factor,
+                args.spec_win_dur, temp_dir,
+            )
+            for precision in ('float64', 'float32')
+        }
+
+        total = {}
+        if args.render:
+            for precision in runs:
+                t = time.perf_counter()
+                sonify_input(
+                    args.path_data, args.format_in, args.starttime, args.endtime,
+                    freqmin=args.freqmin, freqmax=args.freqmax,
+                    speed_up_factor=args.speed_up_factor,
+                    spec_win_dur=args.spec_win_dur, resolution='1080p',
+                    output_dir=Path(temp_dir) / precision, renderer='ffmpeg',
+                    precision=precision,
+                )
+                total[precision] = time.perf_counter() - t
+
+    ref, ref_stats = runs['float64']
+    res, res_stats = runs['float32']
+
+    print('\nAccuracy of float32 relative to float64')
+    data_err = np.abs(res['data'] - ref['data']).max() / np.abs(ref['data']).max()
+    print(f'  Filtered data: max. error {data_err:.2e} of the peak amplitude')
+    # Only where the spectrogram is visible with the 'smart' colour limits
+    visible = ref['sxx_db'] > np.percentile(ref['sxx_db'], 20)
+    spec_err = np.abs(res['sxx_db'] - ref['sxx_db'])[visible].max()
+    print(f'  Spectrogram: max. error {spec_err:.3f} dB above the 20th percentile')
+    audio_err = np.abs(res['audio'] - ref['audio']).max() / (2**31 - 1)
+    print(f'  Audio: max. error {audio_err:.2e} of full scale '
+          f'({20 * np.log10(max(audio_err, 1e-300)):.0f} dBFS)')
+
+    print('\nStage          float64            float32')
+    for name in ref_stats:
+        (t64, m64), (t32, m32) = ref_stats[name], res_stats[name]
+        print(f'  {name:12} {t64:6.2f} s {m64:7.1f} MB  {t32:6.2f} s {m32:7.1f} MB')
+    if total:
+        print(f'  {"sonify_input":12} {total["float64"]:6.2f} s {"":10}'
+              f'{total["float32"]:6.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""
+Coverage index of data folders: which times each channel has data for, built
+from the spans of the files and updated incrementally, to plan batch runs
+before reading any data.
+
+The spans of the traces of each file are kept in a JSON cache keyed by file
+path, size and modification time, so an update only reads new or changed
+files. The spans are read with `headonly=True`, which reads only the headers
+of formats such as MiniSEED or SAC; pickled Streams (`PICKLE` and `bz2`)
+have no separate header, so each new or changed file of those formats is
+read (and unpickled) in full, once. Per channel, the spans are merged into sorted, disjoint intervals
+(counting a trace as covering one sample period past its last sample, so
+that back-to-back files merge) with a prefix sum of their durations. The
+data covered in any interval is then found with two binary searches, and
+that of every window of a sweep at once with vectorized ones.
+
+Usage:
+
+    python coverage_index.py PICKLE 2021-11-23 2021-12-01 data/Geophone_0_X --min_fraction 0.5
+"""
+
+import argparse
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+import obspy
+from obspy import UTCDateTime
+from tqdm import tqdm
+
+from utils import read_stream_bz2_pickle
+
+
+class Job(NamedTuple):
+    """
+    A render planned by :func:`plan_jobs`; the first three fields are those
+    of a job of :func:`~prefetch.sonify_jobs`.
+    """
+
+    path_data: str
+    starttime: UTCDateTime
+    endtime: UTCDateTime
+    fraction: float  # Fraction of the interval with data
+    samples: int  # Number of samples in the interval
+
+
+class _Channel:
+    """
+    Merged coverage intervals of one channel.
+    """
+
+    def __init__(self, spans):
+        spans = np.array(sorted(spans), dtype=float)  # (start, end, fs) rows
+        starts = spans[:, 0]
+        ends = spans[:, 1] + 1 / spans[:, 2]  # One sample period past the last sample
+        self.sampling_rate = np.median(spans[:, 2])
+        tol = 0.5 / self.sampling_rate
+
+        # Overlaps: where a span starts before the end of all earlier ones
+        reach = np.maximum.accumulate(ends)
+        overlap = np.minimum(ends[1:], reach[:-1]) - starts[1:]
+        self.overlaps = [
+            (starts[i + 1], starts[i + 1] + overlap[i]) for i in np.flatnonzero(overlap > tol)
+        ]
+
+        # Disjoint intervals, each starting where a span starts past the reach
+        # of the earlier ones
+        first = np.r_[True, starts[1:] > reach[:-1] + tol]
+        self.starts = starts[first]
+        self.ends = reach[np.r_[np.flatnonzero(first)[1:] - 1, ends.size - 1]]
+        self.cumsum = np.r_[0, np.cumsum(self.ends - self.starts)]
+
+    def covered(self, start, end):
+        """
+        Duration with data between `start` and `end` (timestamps; arrays of
+        the same shape or scalars) [s].
+        """
+
+        start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+        i = np.searchsorted(self.ends, start, side='right')  # First ending after start
+        j = np.searchsorted(self.starts, end, side='left')  # One past the last starting before end
+        total = self.cumsum[np.maximum(j, i)] - self.cumsum[i]
+        # Cut the first and last of these intervals to the query
+        first = self.starts[np.minimum(i, self.starts.size - 1)]
+        last = self.ends[np.maximum(j - 1, 0)]
+        total -= np.where(j > i, np.maximum(start - first, 0) + np.maximum(last - end, 0), 0)
+        return total
+
+    def gaps(self):
+        """
+        List of (`start`, `end`) timestamps between the coverage intervals.
+        """
+
+        return list(zip(self.ends[:-1], self.starts[1:]))
+
+
+class CoverageIndex:
+    """
+    Coverage of the channels of one or more data folders.
+
+    Args:
+        paths (list): Folders of data files
+        format_in (str): Format of data files (`'bz2'` for compressed pickled
+            Streams). Files of formats without separate headers, such as
+            `'PICKLE'` and `'bz2'`, are read in full to find their spans
+        cache (str): JSON file keeping the file spans between runs (none if
+            `None`); worth keeping for such formats, so that each file is
+            read only once
+    """
+
+    def __init__(self, paths, format_in, cache=None):
+        if isinstance(paths, str):
+            paths = [paths]
+        self.paths = list(paths)
+        self.format_in = format_in
+        self.cache = cache
+        self.files = {}  # Path: dict(size, mtime, spans=[[id, start, end, fs], ...])
+        if cache and os.path.exists(cache):
+            with open(cache) as f:
+                self.files = json.load(f)
+        self.channels = {}
+        self.folders = {}  # SEED id: folder
+        self.update()
+
+    def update(self):
+        """
+        Read the spans of new and changed files, forget those of removed
+        files and rebuild the index.
+
+        Returns:
+            Number of files read
+        """
+
+        listed = {}
+        for path in self.paths:
+            for name in sorted(os.listdir(path)):
+                file = os.path.join(path, name)
+                if os.path.isfile(file):
+                    listed[file] = path
+        todo = []
+        for file in listed:
+            stat = os.stat(file)
+            entry = self.files.get(file)
+            if not entry or (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime):
+                todo.append(file)
+        for file in tqdm(todo, disable=not todo):
+            stat = os.stat(file)
+            self.files[file] = dict(size=stat.st_size, mtime=stat.st_mtime, spans=self._spans(file))
+        for file in set(self.files) - set(listed):
+            del self.files[file]
+        if self.cache and todo:
+            with open(self.cache, 'w') as f:
+                json.dump(self.files, f)
+
+        spans, self.folders = {}, {}
+        for file, entry in self.files.items():
+            for tr_id, start, end, fs in entry['spans']:
+                spans.setdefault(tr_id, []).append((start, end, fs))
+                self.folders.setdefault(tr_id, listed[file])
+        self.channels = {tr_id: _Channel(s) for tr_id, s in spans.items()}
+        return len(todo)
+
+    def _spans(self, file):
+        # headonly is ignored by the formats without separate headers (e.g.
+        # PICKLE), which are read in full
+        try:
+            if self.format_in.lower() == 'bz2':
+                st = read_stream_bz2_pickle(file)
+            else:
+                st = obspy.read(file, format=self.format_in, headonly=True)
+        except Exception as e:
+            print('Can not read %s (%s: %s)' % (file, type(e).__name__, e))
+            return []
+        return [
+            [tr.id, tr.stats.starttime.timestamp, tr.stats.endtime.timestamp,
+             tr.stats.sampling_rate]
+            for tr in st
+        ]
+
+    def coverage(self, tr_id, starttime, endtime):
+        """
+        Fraction of an interval with data for a channel.
+
+        Args:
+            tr_id (str): SEED id of the channel
+            starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+            endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+
+        Returns:
+            float between 0 and 1
+        """
+
+        channel = self.channels.get(tr_id)
+        if channel is None or endtime <= starttime:
+            return 0.0
+        covered = channel.covered(starttime.timestamp, endtime.timestamp)
+        return float(covered) / (endtime - starttime)
+
+    def windows(self, tr_id, starttime, endtime, window, step=None, min_fraction=0):
+        """
+        Windows of a sweep with at least some fraction of data.
+
+        Args:
+            tr_id (str): SEED id of the channel
+            starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start of
+                the first window
+            endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): No window
+                starts at or after this time, and none ends after it
+            window (int or float): Duration of each window [s]
+            step (int or float): Time between the starts of consecutive windows
+                [s] (defaults to `window`)
+            min_fraction (float): Minimum fraction of a window with data
+
+        Returns:
+            List of (`starttime`, `endtime`, `fraction`, `samples`) tuples
+        """
+
+        channel = self.channels.get(tr_id)
+        if channel is None:
+            return []
+        starts = np.arange(starttime.timestamp, endtime.timestamp, step or window)
+        ends = np.minimum(starts + window, endtime.timestamp)
+        covered = channel.covered(starts, ends)
+        fraction = covered / (ends - starts)
+        samples = np.round(covered * channel.sampling_rate).astype(int)
+        return [
+            (UTCDateTime(starts[k]), UTCDateTime(ends[k]), fraction[k], samples[k])
+            for k in np.flatnonzero((fraction >= min_fraction) & (covered > 0))
+        ]
+
+    def summarize(self):
+        """
+        Print per channel the time span, the data covered and the gaps and
+        overlaps.
+        """
+
+        for tr_id, channel in sorted(self.channels.items()):
+            gaps = channel.gaps()
+            print(
+                f'{tr_id}: {UTCDateTime(channel.starts[0])} to {UTCDateTime(channel.ends[-1])} '
+                f'({channel.cumsum[-1] / 86400:.2f} days of data)'
+            )
+            print(
+                f'  {len(gaps)} gaps ({sum(end - start for start, end in gaps):.1f} s), '
+                f'{len(channel.overlaps)} overlaps '
+                f'({sum(end - start for start, end in channel.overlaps):.1f} s)'
+            )
+
+
+def plan_jobs(index, starttime, endtime, interval, min_fraction=0.5, step=None):
+    """
+    Plan renders of every channel of a coverage index over fixed intervals,
+    skipping those with too little data.
+
+    Args:
+        index (:class:`CoverageIndex`): Coverage of the data folders
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start of the
+            first interval
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End of the
+            last interval
+        interval (int or float): Duration of each render [s]
+        min_fraction (float): Minimum fraction of an interval with data
+        step (int or float): See docstring for :meth:`CoverageIndex.windows`
+
+    Returns:
+        List of :class:`Job`, by folder and then time
+    """
+
+    jobs = [
+        Job(index.folders[tr_id], start, end, float(fraction), int(samples))
+        for tr_id in sorted(index.channels)
+        for start, end, fraction, samples in index.windows(
+            tr_id, starttime, endtime, interval, step=step, min_fraction=min_fraction
+        )
+    ]
+    num_total = len(index.channels) * int(np.ceil((endtime - starttime) / (step or interval)))
+    print(f'{len(jobs)} of {num_total} intervals have at least {min_fraction:.0%} data')
+    return jobs
+
+
+def main():
+    """
+    This function is run when ``coverage_index.py`` is called as a script.
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Index the data coverage of one or more folders and list the intervals worth rendering.',
+        allow_abbrev=False,
+    )
+    parser.add_argument('format_in', help='format of data files, e.g. PICKLE')
+    parser.add_argument('starttime', type=UTCDateTime, help='start time (UTC)')
+    parser.add_argument('endtime', type=UTCDateTime, help='end time (UTC)')
+    parser.add_argument('path_data', nargs='+', help='folders of data files')
+    parser.add_argument(
+        '--interval', default=6 * 60 * 60, type=float, help='duration of each render [s]'
+    )
+    parser.add_argument(
+        '--min_fraction',
+        default=0.5,
+        type=float,
+        help='minimum fraction of an interval with data',
+    )
+    parser.add_argument('--cache', default=None, help='JSON file caching the file spans')
+    input_args = parser.parse_args()
+
+    index = CoverageIndex(input_args.path_data, input_args.format_in, cache=input_args.cache)
+    index.summarize()
+    for job in plan_jobs(
+        index,
+        input_args.starttime,
+        input_args.endtime,
+        input_args.interval,
+        min_fraction=input_args.min_fraction,
+    ):
+        print(f'  {job.path_data}  {job.starttime} – {job.endtime}  '
+              f'{job.fraction:6.1%}  {job.samples} samples')
+
+
+if __name__ == '__main__':
+    main()
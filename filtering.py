@@ -0,0 +1,261 @@
+"""
+Zero-phase IIR filtering with cached second-order-section designs.
+
+A filter is described by a list of stages, each a tuple
+`(btype, freqs, corners)`, e.g. `('bandstop', (49.8, 50.2), 8)` or
+`('lowpass', 88.2, 10)`. The stages are designed as Butterworth filters in
+second-order sections (the same designs as :mod:`obspy.signal.filter`),
+cached by (type, corners, sampling rate) and chained so that all of them are
+applied in a single forward and a single backward pass over the data.
+"""
+
+import warnings
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+# [samples] Length of the blocks filtered at a time, which bounds the
+# temporary memory used when filtering in place
+BLOCK_SIZE = 2**20
+
+
+@lru_cache(maxsize=None)
+def design_sos(btype, freqs, corners, fs):
+    """
+    Design a Butterworth filter in second-order sections. Designs are cached,
+    so repeated calls with the same arguments are free.
+
+    Frequencies at or above the Nyquist frequency are handled as in
+    :mod:`obspy.signal.filter`: a bandpass becomes a highpass (with a warning)
+    and a lowpass corner is clipped to the Nyquist frequency. A bandstop
+    reaching the Nyquist frequency is left out (with a warning) rather than
+    raising an error, so that e.g. the 50 Hz filter of
+    :data:`~sonify_input.PREFILTER_STAGES` can be applied to data sampled at
+    100 Hz or less, where there is no 50 Hz band to remove.
+
+    Args:
+        btype (str): One of `'bandpass'`, `'bandstop'`, `'lowpass'` or
+            `'highpass'`
+        freqs (float or tuple): Corner frequency [Hz], or (low, high) tuple of
+            corner frequencies for `'bandpass'` and `'bandstop'`
+        corners (int): Filter order
+        fs (float): Sampling rate [Hz]
+
+    Returns:
+        Read-only :class:`~numpy.ndarray` of shape (n_sections, 6), with no
+        sections for a left-out bandstop
+    """
+
+    fe = 0.5 * fs  # Nyquist frequency
+    if btype in ('bandpass', 'bandstop'):
+        low, high = freqs[0] / fe, freqs[1] / fe
+        if btype == 'bandstop' and high - 1.0 > -1e-6:
+            warnings.warn(
+                f'Selected high corner frequency ({freqs[1]}) of bandstop is at or '
+                f'above Nyquist ({fe}). Skipping the bandstop.'
+            )
+            sos = np.empty((0, 6))
+            sos.setflags(write=False)
+            return sos
+        if low > 1:
+            raise ValueError('Selected low corner frequency is above Nyquist.')
+        if high - 1.0 > -1e-6:
+            warnings.warn(
+                f'Selected high corner frequency ({freqs[1]}) of bandpass is at or '
+                f'above Nyquist ({fe}). Applying a high-pass instead.'
+            )
+            return design_sos('highpass', freqs[0], corners, fs)
+        sos = signal.iirfilter(corners, [low, high], btype=btype, ftype='butter', output='sos')
+    elif btype in ('lowpass', 'highpass'):
+        f = freqs / fe
+        if f > 1:
+            if btype == 'highpass':
+                raise ValueError('Selected corner frequency is above Nyquist.')
+            f = 1.0
+            warnings.warn(
+                'Selected corner frequency is above Nyquist. Setting Nyquist as '
+                'high corner.'
+            )
+        sos = signal.iirfilter(corners, f, btype=btype, ftype='butter', output='sos')
+    else:
+        raise ValueError(f'Unknown filter type {btype!r}')
+
+    sos.setflags(write=False)  # Shared by every caller through the cache
+    return sos
+
+
+def chain_sos(stages, fs, dtype=np.float64):
+    """
+    Cascade the second-order sections of several filter stages.
+
+    Args:
+        stages (list): List of (`btype`, `freqs`, `corners`) tuples; see
+            :func:`design_sos`
+        fs (float): Sampling rate [Hz]
+        dtype: Data type of the returned sections. Use the data type of the
+            data to be filtered so that `float32` data is filtered in `float32`
+
+    Returns:
+        :class:`~numpy.ndarray` of shape (n_sections, 6)
+    """
+
+    return np.vstack(
+        [
+            design_sos(btype, _hashable(freqs), corners, float(fs))
+            for btype, freqs, corners in stages
+        ]
+    ).astype(dtype, copy=False)
+
+
+def zerophase_sosfilt(data, sos, inplace=False, block_size=BLOCK_SIZE):
+    """
+    Filter data forwards and then backwards along its last axis (like
+    `zerophase=True` in :mod:`obspy.signal.filter`).
+
+    The data is processed in blocks with the filter state carried across
+    them, so the result is identical to filtering the whole array at once
+    while the temporary memory stays bounded by `block_size`.
+
+    Args:
+        data (:class:`~numpy.ndarray`): 1-D array, or 2-D array with one
+            channel per row
+        sos (:class:`~numpy.ndarray`): Second-order sections, e.g. from
+            :func:`chain_sos`
+        inplace (bool): If `True`, overwrite `data` (which must then be a
+            floating point array) instead of filtering a copy
+        block_size (int): Number of samples per block
+
+    Returns:
+        Filtered :class:`~numpy.ndarray` (`data` itself if `inplace`)
+    """
+
+    if inplace:
+        if not np.issubdtype(data.dtype, np.floating):
+            raise TypeError('In-place filtering needs floating point data.')
+        out = data
+    else:
+        out = np.array(data, dtype=np.result_type(data.dtype, np.float32))
+
+    if not sos.size:
+        return out
+
+    zi_shape = (sos.shape[0],) + out.shape[:-1] + (2,)
+    for view in out, out[..., ::-1]:  # Forward pass, then backward pass
+        zi = np.zeros(zi_shape, dtype=out.dtype)
+        for start in range(0, view.shape[-1], block_size):
+            block = view[..., start:start + block_size]
+            block[...], zi = signal.sosfilt(sos, block, axis=-1, zi=zi)
+
+    return out
+
+
+def filter_data(data, fs, stages, inplace=False):
+    """
+    Apply several zero-phase filter stages to data in a single pass.
+
+    Args:
+        data (:class:`~numpy.ndarray`): See :func:`zerophase_sosfilt`
+        fs (float): Sampling rate [Hz]
+        stages (list): See :func:`chain_sos`
+        inplace (bool): See :func:`zerophase_sosfilt`
+
+    Returns:
+        Filtered :class:`~numpy.ndarray`
+    """
+
+    if not stages:
+        return data if inplace else data.copy()
+    dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+    return zerophase_sosfilt(data, chain_sos(stages, fs, dtype), inplace=inplace)
+
+
+def filter_traces(traces, stages, dtype=None):
+    """
+    Apply several zero-phase filter stages to Traces in place, using each
+    Trace's own sampling rate.
+
+    Traces with the same sampling rate and number of samples are stacked into
+    a 2-D array and filtered together.
+
+    Args:
+        traces (list): :class:`~obspy.core.trace.Trace` objects (modified)
+        stages (list): See :func:`chain_sos`
+        dtype: Floating point type for the filtered data. Defaults to the data
+            type of each Trace if it is already floating point, else `float64`
+
+    Returns:
+        `traces`
+    """
+
+    groups = {}
+    for tr in traces:
+        key = (tr.stats.sampling_rate, tr.stats.npts)
+        groups.setdefault(key, []).append(tr)
+
+    for (fs, _), group in groups.items():
+        group_dtype = dtype or np.result_type(
+            *[tr.data.dtype if np.issubdtype(tr.data.dtype, np.floating) else np.float64
+              for tr in group]
+        )
+        if len(group) == 1:
+            tr = group[0]
+            tr.data = np.require(tr.data, dtype=group_dtype, requirements='W')
+            filter_data(tr.data, fs, stages, inplace=True)
+        else:
+            data = np.vstack([tr.data for tr in group]).astype(group_dtype, copy=False)
+            filter_data(data, fs, stages, inplace=True)
+            for tr, row in zip(group, data):
+                tr.data = row
+
+    return traces
+
+
+def _hashable(freqs):
+    """
+    Turn corner frequencies into a hashable cache key.
+    """
+
+    if np.ndim(freqs):
+        return tuple(float(f) for f in freqs)
+    return float(freqs)
+
+
+class CausalFilter:
+    """
+    Single-pass (causal) filter that carries its state from one block of data
+    to the next, for data that arrives in pieces. Filtering the blocks one by
+    one gives the same result as filtering their concatenation.
+
+    Unlike :func:`filter_data` this is not zero-phase, since that would need
+    the data that has not arrived yet.
+
+    Args:
+        stages (list): See :func:`chain_sos`
+        fs (float): Sampling rate [Hz]
+        dtype: Data type of the filtered data
+    """
+
+    def __init__(self, stages, fs, dtype=np.float64):
+        self.sos = chain_sos(stages, fs, dtype)
+        self.zi = None
+
+    def __call__(self, block):
+        """
+        Filter the next block of data.
+
+        Args:
+            block (:class:`~numpy.ndarray`): 1-D array with the new samples
+
+        Returns:
+            Filtered :class:`~numpy.ndarray`
+        """
+
+        block = np.asarray(block, dtype=self.sos.dtype)
+        if not block.size or not self.sos.size:
+            return block
+        if self.zi is None:
+            # Start from the steady state for the first sample to avoid a step
+            self.zi = signal.sosfilt_zi(self.sos).astype(self.sos.dtype) * block[0]
+        out, self.zi = signal.sosfilt(self.sos, block, zi=self.zi)
+        return out
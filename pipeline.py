@@ -0,0 +1,523 @@
+"""
+The steps of :func:`~sonify_input.sonify_input` as an explicit pipeline of
+stages, whose intermediate results can be reused.
+
+The stages, each with the result it produces, are:
+
+========  ==================  ================================================
+Stage     Needs               Result
+========  ==================  ================================================
+`load`                        :class:`Loaded` merged, unfiltered Traces
+`clean`   `load`              :class:`Cleaned` Traces after sensor corrections
+`filter`  `clean`             :class:`Filtered` bandpassed and trimmed Traces
+`audio`   `filter`            :class:`Audio` sonified audio file
+`stft`    `filter`            :class:`Spectrograms` of the bandpassed Traces
+`figure`  `filter`, `stft`    :class:`SpectrogramFigure` to animate
+`frames`  `filter`, `figure`  :class:`Frames` silent video file
+`mux`     `audio`, `frames`   :class:`Output` video with the soundtrack
+========  ==================  ================================================
+
+:meth:`Pipeline.run` runs the requested stages and whatever they need that
+has not been run yet. Results are kept in :attr:`Pipeline.results`, which can
+be filled in beforehand (e.g. with the `filter` result of another pipeline
+with the same data) to skip stages, and all but the figure can be pickled
+with :meth:`Pipeline.save` and restored with :meth:`Pipeline.restore`.
+
+To keep a single copy of the data, the `filter` stage works in place and
+removes the `load` and `clean` results it used up.
+
+Stages run as soon as the stages they need are done, on a pool of threads:
+once the data is filtered, the audio is written while the spectrograms are
+computed and the frames rendered, and `mux` starts as soon as both the audio
+and the frames are ready. The audio branch mostly runs in NumPy and C code
+and the rendering in FFmpeg, which release the GIL, so a render takes about
+as long as the slower branch.
+"""
+
+import os
+import pickle
+import tempfile
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import NamedTuple
+
+import matplotlib
+import matplotlib.dates as mdates
+import scipy.signal
+from obspy import UTCDateTime
+
+from filtering import filter_traces
+from qc import clean_trace
+from sonify_input import (
+    PRECISIONS,
+    PREFILTER_STAGES,
+    QUALITY_PRESETS,
+    RENDERERS,
+    _bandpass_corners,
+    _ffmpeg_combine,
+    _load_trace,
+    _make_audio,
+    _make_multichannel_audio,
+    _output_stem,
+    _spectrogram_stack,
+)
+from spectral import compute_spectrograms
+
+STAGES = ('load', 'clean', 'filter', 'audio', 'stft', 'figure', 'frames', 'mux')
+
+# Stages whose results each stage needs
+NEEDS = {
+    'load': (),
+    'clean': ('load',),
+    'filter': ('clean',),
+    'audio': ('filter',),
+    'stft': ('filter',),
+    'figure': ('filter', 'stft'),
+    'frames': ('filter', 'figure'),
+    'mux': ('audio', 'frames'),
+}
+
+
+class Loaded(NamedTuple):
+    """
+    Result of the `load` stage.
+    """
+
+    traces: list  # Merged Traces, one per path
+    starttime: UTCDateTime  # Of the animation, shifted by the UTC offset
+    endtime: UTCDateTime
+
+
+class Cleaned(NamedTuple):
+    """
+    Result of the `clean` stage.
+    """
+
+    traces: list  # Corrected Traces (not yet filtered)
+    stages: list  # Filter stages still to apply before the bandpass
+
+
+class Filtered(NamedTuple):
+    """
+    Result of the `filter` stage.
+    """
+
+    traces: list  # Bandpassed Traces
+    trims: list  # The same trimmed to the animation (views)
+    freq_lim: tuple  # Bandpass corners [Hz]
+    starttime: UTCDateTime  # As in Loaded
+    endtime: UTCDateTime
+
+
+class Audio(NamedTuple):
+    """
+    Result of the `audio` stage.
+    """
+
+    audio_file: Path
+
+
+class Spectrograms(NamedTuple):
+    """
+    Result of the `stft` stage.
+    """
+
+    specs: list  # (f, t_mpl, sxx_db) of each Trace
+
+
+class SpectrogramFigure(NamedTuple):
+    """
+    Result of the `figure` stage (not picklable; the `frames` stage animates
+    and so modifies it).
+    """
+
+    figure: tuple  # Output of sonify_input._spectrogram_stack()
+
+
+class Frames(NamedTuple):
+    """
+    Result of the `frames` stage.
+    """
+
+    video_file: Path  # Without sound, in the pipeline's temporary directory
+
+
+class Output(NamedTuple):
+    """
+    Result of the `mux` stage.
+    """
+
+    output_file: Path
+
+
+class Pipeline:
+    """
+    Stages of :func:`~sonify_input.sonify_input` for one set of arguments.
+
+    Call :meth:`close` (or use as a context manager) to remove the temporary
+    files of the `frames` stage (and of the `audio` stage for multichannel
+    audio not kept in `output_dir`).
+
+    Args:
+        path_data (str or list): See docstring for
+            :func:`~sonify_input.sonify_input`
+        format_in (str): Format of data files
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time of
+            animation (UTC)
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time of
+            animation (UTC)
+        output_dir (str or :class:`~pathlib.Path`): Directory where output
+            files should be saved (defaults to :meth:`~pathlib.Path.cwd`)
+        call_str (str): Call stored in the metadata of the output video
+            (defaults to a description of the pipeline)
+        max_workers (int): Number of stages run at a time (`1` to run them
+            one after the other)
+        **options: Any other argument of :func:`~sonify_input.sonify_input`,
+            with the same defaults
+    """
+
+    def __init__(
+        self,
+        path_data,
+        format_in,
+        starttime,
+        endtime,
+        output_dir=None,
+        call_str=None,
+        max_workers=3,
+        freqmin=None,
+        freqmax=None,
+        speed_up_factor=200,
+        fps=None,
+        resolution=None,
+        spec_win_dur=5,
+        db_lim='smart',
+        log=False,
+        utc_offset=None,
+        multichannel_wav=True,
+        renderer='matplotlib',
+        precision='float64',
+        quality='publication',
+        qc_report=None,
+    ):
+        if renderer not in RENDERERS:
+            raise ValueError(f'Renderer must be one of {list(RENDERERS)}')
+        if precision not in PRECISIONS:
+            raise ValueError(f'Precision must be one of {list(PRECISIONS)}')
+        if quality not in QUALITY_PRESETS:
+            raise ValueError(f'Quality must be one of {list(QUALITY_PRESETS)}')
+        preset = QUALITY_PRESETS[quality]
+
+        # Use current working directory if none provided
+        if not output_dir:
+            output_dir = Path().cwd()
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+        output_dir = Path(str(output_dir)).expanduser().resolve()
+        if not output_dir.is_dir():
+            raise FileNotFoundError(f'Directory {output_dir} does not exist!')
+
+        if isinstance(path_data, (str, Path)):
+            path_data = [path_data]
+        self.path_data = list(path_data)
+        self.format_in = format_in
+        self.starttime = starttime
+        self.endtime = endtime
+        self.output_dir = output_dir
+        self.call_str = call_str or f'Pipeline({self.path_data!r}, {starttime}, {endtime})'
+        self.max_workers = max_workers
+        self.freqmin = freqmin
+        self.freqmax = freqmax
+        self.speed_up_factor = speed_up_factor
+        self.fps = fps or preset['fps']
+        self.resolution = resolution or preset['resolution']
+        self.spec_win_dur = spec_win_dur
+        self.db_lim = db_lim
+        self.log = log
+        self.utc_offset = utc_offset
+        self.multichannel_wav = multichannel_wav
+        self.renderer = renderer
+        self.precision = precision
+        self.quality = quality
+        self.qc_report = qc_report
+
+        self.is_infrasound = True
+        self.rescale = 1  # No conversion
+        self.ref_val = 1
+
+        self.results = {}
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """
+        Remove the temporary files.
+        """
+
+        self.temp_dir.cleanup()
+
+    def run(self, stages=STAGES):
+        """
+        Run stages, and the stages they need, that have no result yet.
+
+        Args:
+            stages (str or tuple): Stage or stages to run; see :data:`STAGES`
+
+        Returns:
+            :attr:`results`, a dict of the result of every stage run so far
+        """
+
+        if isinstance(stages, str):
+            stages = (stages,)
+        todo = set()
+        for stage in stages:
+            if stage not in NEEDS:
+                raise ValueError(f'Stage must be one of {list(STAGES)}')
+            self._plan(stage, todo)
+
+        # Submit each stage once all it needs is done, in the order of STAGES
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while todo or running:
+                ready = [
+                    stage
+                    for stage in STAGES
+                    if stage in todo and all(need in self.results for need in NEEDS[stage])
+                ]
+                for stage in ready:
+                    todo.remove(stage)
+                    running[executor.submit(getattr(self, f'_{stage}'))] = stage
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.results[running.pop(future)] = future.result()
+        return self.results
+
+    def save(self, file, stages=None):
+        """
+        Pickle the results of stages (by default all but `figure`).
+
+        Args:
+            file (str or :class:`~pathlib.Path`): Output file
+            stages (tuple): Stages whose results to save
+        """
+
+        stages = stages or [stage for stage in self.results if stage != 'figure']
+        with open(file, 'wb') as f:
+            pickle.dump({stage: self.results[stage] for stage in stages}, f)
+
+    def restore(self, file):
+        """
+        Load results saved with :meth:`save`, so that their stages are skipped.
+
+        Args:
+            file (str or :class:`~pathlib.Path`): File written by :meth:`save`
+        """
+
+        with open(file, 'rb') as f:
+            self.results.update(pickle.load(f))
+
+    def _plan(self, stage, todo):
+        """
+        Add a stage, and the stages it needs, that have no result yet to `todo`.
+        """
+
+        if self._has(stage) or stage in todo:
+            return
+        todo.add(stage)
+        for need in NEEDS[stage]:
+            self._plan(need, todo)
+
+    def _has(self, stage):
+        """
+        Whether a stage has a result, or one that a later stage used up.
+        """
+
+        return stage in self.results or any(
+            stage in needs and self._has(later) for later, needs in NEEDS.items()
+        )
+
+    def _load(self):
+        """
+        Read, sort and merge the data files. Several paths (e.g. the X, Y and
+        Z components of a geophone) share a single timeline.
+        """
+
+        traces = [
+            _load_trace(
+                path,
+                self.format_in,
+                self.starttime,
+                self.endtime,
+                dtype=PRECISIONS[self.precision],
+            )
+            for path in self.path_data
+        ]
+        starttime, endtime = self.starttime, self.endtime
+
+        # Apply UTC offset if provided
+        if self.utc_offset is not None:
+            signed_offset = f'{self.utc_offset:{"+" if self.utc_offset else ""}g}'
+            print(f'Converting to local time using UTC offset of {signed_offset} hours')
+            utc_offset_sec = self.utc_offset * mdates.SEC_PER_HOUR
+            starttime += utc_offset_sec
+            endtime += utc_offset_sec
+            for tr_i in traces:
+                tr_i.stats.starttime += utc_offset_sec
+
+        return Loaded(traces, starttime, endtime)
+
+    def _clean(self):
+        """
+        Sensor corrections. The 50 Hz bandstop is only scheduled here, and
+        applied by the `filter` stage in the same pass as the bandpass.
+        """
+
+        traces = self.results['load'].traces
+
+        # Zero the samples flagged by the QC report, which would otherwise
+        # spread through the filters
+        if self.qc_report is not None:
+            time_shift = (self.utc_offset or 0) * mdates.SEC_PER_HOUR
+            for tr_i in traces:
+                num_zeroed = clean_trace(tr_i, self.qc_report, time_shift)
+                if num_zeroed:
+                    print(f'Zeroed {num_zeroed} samples of {tr_i.id} flagged by the QC report')
+
+        # Correct sensor response
+        correc_f = False
+        # Sensor correction parameters: coefficients of the numerator and denominator of the transfer function
+        b = [1.0000, -1.5365, 0.6507]  # Numerator
+        a = [-1.0000, 1.9388, -0.9388]  # Denominator
+        if correc_f:
+            z, p, k = scipy.signal.tf2zpk(b, a)
+            paz = {
+                'poles': p,
+                'zeros': z,
+                'gain': k,
+                'sensitivity': 1}
+            for tr_i in traces:
+                tr_i.simulate(paz_remove=paz)
+        detrend_f = False
+        if detrend_f:
+            for tr_i in traces:
+                tr_i.detrend('demean')
+
+        return Cleaned(traces, list(PREFILTER_STAGES))
+
+    def _filter(self):
+        """
+        50 Hz bandstop and bandpass in a single pass over the data, in place.
+        """
+
+        cleaned = self.results.pop('clean')
+        loaded = self.results.pop('load')
+        traces = cleaned.traces
+        freq_lim = _bandpass_corners(traces[0], self.freqmin, self.freqmax, self.speed_up_factor)
+        print(f'Applying {freq_lim[0]:g}–{freq_lim[1]:g} Hz bandpass')
+        filter_traces(traces, cleaned.stages + [('bandpass', freq_lim, 4)])
+
+        # Make trimmed versions (views of the data; nothing below modifies them)
+        trims = [tr_i.slice(loaded.starttime, loaded.endtime) for tr_i in traces]
+        return Filtered(traces, trims, freq_lim, loaded.starttime, loaded.endtime)
+
+    def _audio(self):
+        filtered = self.results['filter']
+        stem = _output_stem(filtered.traces, self.speed_up_factor)
+        if len(filtered.trims) == 1:
+            audio_file = self.output_dir / f'{stem}.wav'
+            _make_audio(filtered.trims[0], self.speed_up_factor, audio_file)
+        else:
+            # One channel per component; FFmpeg downmixes it for the soundtrack
+            if self.multichannel_wav:
+                audio_file = self.output_dir / f'{stem}.wav'
+            else:
+                audio_file = Path(self.temp_dir.name) / '47.wav'
+            _make_multichannel_audio(filtered.trims, self.speed_up_factor, audio_file)
+        return Audio(audio_file)
+
+    def _stft(self):
+        traces = self.results['filter'].traces
+        # All channels in one batch; see spectral.py
+        preset = QUALITY_PRESETS[self.quality]
+        return Spectrograms(
+            compute_spectrograms(
+                traces,
+                self.spec_win_dur,
+                self.ref_val,
+                zero_pad=preset['zero_pad'],
+                overlap=preset['overlap'],
+            )
+        )
+
+    def _figure(self):
+        filtered = self.results['filter']
+
+        # Store user's rc settings, then update font stuff
+        original_params = matplotlib.rcParams.copy()
+        matplotlib.rcParams.update(matplotlib.rcParamsDefault)
+        matplotlib.rcParams['font.sans-serif'] = 'Tex Gyre Heros'
+        matplotlib.rcParams['mathtext.fontset'] = 'custom'
+
+        figure = _spectrogram_stack(
+            filtered.traces,
+            filtered.starttime,
+            filtered.endtime,
+            self.is_infrasound,
+            self.rescale,
+            self.spec_win_dur,
+            self.db_lim,
+            filtered.freq_lim,
+            self.log,
+            self.utc_offset is not None,
+            self.resolution,
+            specs=self.results['stft'].specs,
+            quality=self.quality,
+        )
+
+        # Restore user's rc settings, ignoring Matplotlib deprecation warnings
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            matplotlib.rcParams.update(original_params)
+
+        return SpectrogramFigure(figure)
+
+    def _frames(self):
+        filtered = self.results['filter']
+        video_file = Path(self.temp_dir.name) / '47.mp4'
+        RENDERERS[self.renderer](
+            filtered.traces,
+            filtered.trims[0],
+            filtered.starttime,
+            filtered.endtime,
+            self.is_infrasound,
+            self.rescale,
+            self.spec_win_dur,
+            self.db_lim,
+            filtered.freq_lim,
+            self.log,
+            self.utc_offset is not None,
+            self.resolution,
+            self.fps,
+            self.speed_up_factor,
+            video_file,
+            figure=self.results['figure'].figure,
+            quality=self.quality,
+        )
+        return Frames(video_file)
+
+    def _mux(self):
+        stem = _output_stem(self.results['filter'].traces, self.speed_up_factor)
+        output_file = self.output_dir / f'{stem}.mp4'
+        _ffmpeg_combine(
+            self.results['audio'].audio_file,
+            self.results['frames'].video_file,
+            output_file,
+            self.call_str,
+        )
+        return Output(output_file)
@@ -0,0 +1,286 @@
+"""
+Prefetching for batches of renders: load and filter the data of the next
+jobs in a background thread while the current one renders, so that reading
+the files overlaps with the rendering instead of alternating with it.
+
+:func:`prefetch` is the generic part: it runs a load function over a list of
+items in a background thread, at most `ahead` items (and about
+`memory_budget` bytes) ahead of the consumer. :func:`sonify_jobs` uses it to
+run the `load`, `clean` and `filter` stages of a :class:`~pipeline.Pipeline`
+for each (path, interval) job ahead of its remaining stages.
+"""
+
+import argparse
+import itertools
+import threading
+from collections import deque
+
+import numpy as np
+import psutil
+from obspy import UTCDateTime
+
+from coverage_index import CoverageIndex, plan_jobs
+from pipeline import Pipeline
+from sonify_input import QUALITY_PRESETS, RENDERERS, RESOLUTIONS
+
+
+def prefetch(items, load, ahead=1, memory_budget=None, nbytes=None, release=None):
+    """
+    Load items in a background thread, ahead of their use.
+
+    The thread waits while `ahead` loaded items are waiting to be used, or
+    while those waiting and an item of the size of the last one loaded would
+    exceed `memory_budget`. An item is always loaded if none is waiting,
+    however large.
+
+    Args:
+        items (list): Items to load, in order
+        load: Function called as `load(item)` in the background thread
+        ahead (int): Maximum number of loaded items waiting to be used (at
+            least 1)
+        memory_budget (int): Maximum size of the loaded items waiting to be
+            used [bytes], or `None` for no limit
+        nbytes: Function giving the size of a loaded item [bytes]; needed for
+            `memory_budget`
+        release: Function called as `release(loaded)` for the loaded items
+            that are never yielded because the iteration stopped early (e.g.
+            on an exception), or `None`
+
+    Yields:
+        Tuple of (`item`, `loaded`) for each item, in order. An exception
+        raised by `load` is raised here, when its item is reached
+
+    Raises:
+        ValueError: If `ahead` is less than 1
+    """
+
+    if ahead < 1:
+        raise ValueError('Must load at least one item ahead')
+    items = list(items)
+    ready = deque()  # Tuples of (item, loaded, error, size) waiting to be used
+    cond = threading.Condition()
+    state = dict(stopped=False, last_size=0)
+
+    def _has_room():
+        if len(ready) >= ahead:
+            return False
+        if memory_budget is None or not ready:
+            return True
+        waiting = sum(size for *_, size in ready)
+        return waiting + state['last_size'] <= memory_budget
+
+    def _worker():
+        for item in items:
+            with cond:
+                cond.wait_for(lambda: state['stopped'] or _has_room())
+                if state['stopped']:
+                    return
+            try:
+                loaded, error = load(item), None
+            except Exception as e:
+                loaded, error = None, e
+            size = nbytes(loaded) if nbytes and error is None else 0
+            with cond:
+                stopped = state['stopped']
+                if not stopped:
+                    state['last_size'] = size
+                    ready.append((item, loaded, error, size))
+                    cond.notify_all()
+            if stopped:  # The consumer is gone; nobody else will release it
+                if release and error is None:
+                    release(loaded)
+                return
+
+    thread = threading.Thread(target=_worker, daemon=True)
+    thread.start()
+    try:
+        for _ in items:
+            with cond:
+                cond.wait_for(lambda: ready)
+                item, loaded, error, _ = ready.popleft()
+                cond.notify_all()
+            if error is not None:
+                raise error
+            yield item, loaded
+    finally:
+        with cond:
+            state['stopped'] = True
+            leftover = [loaded for _, loaded, error, _ in ready if error is None]
+            ready.clear()
+            cond.notify_all()
+        if release:
+            for loaded in leftover:
+                release(loaded)
+
+
+def sonify_jobs(
+    jobs,
+    format_in,
+    ahead=1,
+    memory_budget=None,
+    audio_only=False,
+    **kwargs,
+):
+    """
+    Sonify a batch of (path, interval) jobs one after the other, loading and
+    filtering the data of the next jobs while the current one renders. A job
+    that fails is reported and skipped, so that it doesn't stop the batch.
+
+    Args:
+        jobs (list): Tuples of (`path_data`, `starttime`, `endtime`), see
+            docstring for :func:`~sonify_input.sonify_input`, e.g. the
+            :class:`~coverage_index.Job` planned by
+            :func:`~coverage_index.plan_jobs`
+        format_in (str): Format of data files
+        ahead (int): Number of jobs loaded ahead of the one rendering (at
+            least 1)
+        memory_budget (int): Maximum size of the filtered data of the jobs
+            loaded ahead [bytes] (defaults to a quarter of the memory
+            available at the start)
+        audio_only (bool): See docstring for :func:`~sonify_input.sonify_input`
+        **kwargs: Any other argument of :func:`~sonify_input.sonify_input`
+
+    Returns:
+        List of :class:`~pathlib.Path` of the output files, in the order of
+        `jobs` (`None` for the jobs that failed)
+    """
+
+    if memory_budget is None:
+        memory_budget = psutil.virtual_memory().available // 4
+    if audio_only:
+        kwargs['multichannel_wav'] = True
+
+    def _load(job):
+        path_data, starttime, endtime = job[:3]
+        call_str = f'sonify_jobs({path_data!r}, {format_in!r}, {starttime}, {endtime})'
+        pipeline = None
+        try:
+            pipeline = Pipeline(
+                path_data, format_in, starttime, endtime, call_str=call_str, **kwargs
+            )
+            pipeline.run('filter')
+        except Exception as e:
+            print(f'Can not load {path_data}, {starttime} – {endtime} '
+                  f'({type(e).__name__}: {e}). Skipping!')
+            if pipeline is not None:
+                pipeline.close()
+            return None  # Reported here, so that the batch goes on
+        return pipeline
+
+    def _nbytes(pipeline):
+        if pipeline is None:
+            return 0
+        return sum(tr.data.nbytes for tr in pipeline.results['filter'].traces)
+
+    def _release(pipeline):
+        if pipeline is not None:
+            pipeline.close()
+
+    output_files = []
+    for job, pipeline in prefetch(
+        jobs, _load, ahead=ahead, memory_budget=memory_budget, nbytes=_nbytes,
+        release=_release,
+    ):
+        if pipeline is None:
+            output_files.append(None)
+            continue
+        path_data, starttime, endtime = job[:3]
+        print(f'Sonifying {path_data}, {starttime} – {endtime}')
+        with pipeline:
+            try:
+                if audio_only:
+                    output_files.append(pipeline.run('audio')['audio'].audio_file)
+                else:
+                    output_files.append(pipeline.run()['mux'].output_file)
+            except Exception as e:
+                print(f'Can not sonify {path_data}, {starttime} – {endtime} '
+                      f'({type(e).__name__}: {e}). Skipping!')
+                output_files.append(None)
+    return output_files
+
+
+def main():
+    """
+    This function is run when ``prefetch.py`` is called as a script.
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Sonify every interval of one or more data folders, loading the next interval while the current one renders.',
+        allow_abbrev=False,
+    )
+    parser.add_argument('format_in', help='format of data files, e.g. PICKLE')
+    parser.add_argument('starttime', type=UTCDateTime, help='start time (UTC)')
+    parser.add_argument('endtime', type=UTCDateTime, help='end time (UTC)')
+    parser.add_argument('path_data', nargs='+', help='paths to data files')
+    parser.add_argument(
+        '--interval', default=6 * 60 * 60, type=float, help='duration of each output [s]'
+    )
+    parser.add_argument(
+        '--ahead', default=1, type=int, help='number of intervals loaded ahead'
+    )
+    parser.add_argument(
+        '--min_fraction',
+        default=None,
+        type=float,
+        help='only render intervals with at least this fraction of data, found from a coverage index of the folders (all intervals by default)',
+    )
+    parser.add_argument(
+        '--memory_budget',
+        default=None,
+        type=float,
+        help='maximum size of the data loaded ahead [MB] (defaults to a quarter of the available memory)',
+    )
+    parser.add_argument('--freqmin', default=None, type=float)
+    parser.add_argument('--freqmax', default=None, type=float)
+    parser.add_argument('--speed_up_factor', default=200, type=int)
+    parser.add_argument('--fps', default=None, type=int)
+    parser.add_argument('--resolution', default=None, choices=RESOLUTIONS.keys())
+    parser.add_argument('--quality', default='publication', choices=QUALITY_PRESETS.keys())
+    parser.add_argument('--renderer', default='matplotlib', choices=RENDERERS.keys())
+    parser.add_argument('--spec_win_dur', default=5, type=float)
+    parser.add_argument('--output_dir', default=None)
+    parser.add_argument('--audio_only', action='store_true')
+    input_args = parser.parse_args()
+    if input_args.ahead < 1:
+        parser.error('--ahead must be at least 1')
+
+    if input_args.min_fraction is not None:
+        jobs = plan_jobs(
+            CoverageIndex(input_args.path_data, input_args.format_in),
+            input_args.starttime,
+            input_args.endtime,
+            input_args.interval,
+            min_fraction=input_args.min_fraction,
+        )
+    else:
+        starts = np.arange(input_args.starttime.timestamp, input_args.endtime.timestamp,
+                           input_args.interval)
+        jobs = [
+            (path, UTCDateTime(start), min(UTCDateTime(start) + input_args.interval,
+                                           input_args.endtime))
+            for path, start in itertools.product(input_args.path_data, starts)
+        ]
+    memory_budget = input_args.memory_budget
+    if memory_budget is not None:
+        memory_budget = int(memory_budget * 1e6)
+
+    sonify_jobs(
+        jobs,
+        input_args.format_in,
+        ahead=input_args.ahead,
+        memory_budget=memory_budget,
+        audio_only=input_args.audio_only,
+        freqmin=input_args.freqmin,
+        freqmax=input_args.freqmax,
+        speed_up_factor=input_args.speed_up_factor,
+        fps=input_args.fps,
+        resolution=input_args.resolution,
+        quality=input_args.quality,
+        renderer=input_args.renderer,
+        spec_win_dur=input_args.spec_win_dur,
+        output_dir=input_args.output_dir,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""
+Long-term PSD summary database: averaged spectra and band RMS amplitudes per
+fixed window (10 min by default), for overview plots and for choosing which
+intervals to sonify without loading the full-resolution data again.
+
+The archive is streamed once (see :func:`~batch.iter_windows`), only with the
+50 Hz filter of :data:`~sonify_input.PREFILTER_STAGES`. For every window a
+Welch PSD is computed, averaged onto :data:`NUM_FREQS` log-spaced frequency
+bins and stored as `float16` dB, together with the RMS amplitude of the data
+in each frequency band. Only the samples with data count: gaps between files
+are left out of the PSD, and windows that are mostly gap are stored as `NaN`.
+
+The summary is stored per channel and month in columnar :mod:`numpy` files
+with a time index::
+
+    <summary_dir>/<trace id>/meta.json
+    <summary_dir>/<trace id>/<YYYY-MM>/time.npy  # Window starts (POSIX)
+    <summary_dir>/<trace id>/<YYYY-MM>/psd.npy  # (windows, NUM_FREQS) dB
+    <summary_dir>/<trace id>/<YYYY-MM>/rms.npy  # (windows, bands)
+
+so a query over a year reads a few MB, memory-mapped, and only the columns
+it needs.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from obspy import UTCDateTime
+from scipy import signal
+
+from batch import iter_windows
+from sonify_input import PREFILTER_STAGES
+
+WINDOW = 600  # [s] Summary window
+
+WELCH_WIN_DUR = 20  # [s] Welch segment duration (50 % overlap)
+
+NUM_FREQS = 128  # Log-spaced frequency bins stored
+
+FREQ_MIN = 0.05  # [Hz] Lowest frequency bin edge
+
+# [Hz] Frequency bands of the RMS amplitudes
+BANDS = ((0.1, 1), (1, 5), (5, 20), (20, 45), (55, 100))
+
+MIN_COVERAGE = 0.5  # Fraction of a window that must be data, not gap
+
+META_FILE = 'meta.json'
+
+COLUMNS = ('time', 'psd', 'rms')
+
+
+def build_summary(
+    path_data,
+    format_in,
+    summary_dir,
+    starttime,
+    endtime,
+    window=WINDOW,
+    bands=BANDS,
+    min_coverage=MIN_COVERAGE,
+):
+    """
+    Summarize a time span of a data folder, replacing the windows the summary
+    already had in that span.
+
+    Args:
+        path_data (str): Path to data files
+        format_in (str): Format of data files
+        summary_dir (str or :class:`~pathlib.Path`): Root directory of the
+            summary database
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time,
+            rounded down to a multiple of `window`
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        window (int or float): Summary window [s]; must divide a day
+        bands (tuple): (low, high) frequency bands of the RMS amplitudes [Hz]
+        min_coverage (float): Windows with a smaller fraction of data (rather
+            than gaps) are stored as `NaN`
+
+    Returns:
+        :class:`~pathlib.Path` of the channel directory, or `None` if there
+        was no data
+    """
+
+    summary_dir = Path(str(summary_dir)).expanduser().resolve()
+    starttime = UTCDateTime(np.floor(starttime.timestamp / window) * window)
+
+    channel_dir, meta, rows = None, None, {}
+    for win_start, _, tr, _ in iter_windows(
+        path_data,
+        format_in,
+        starttime,
+        endtime,
+        window,
+        step=window,
+        spec_win_dur=None,
+        stages=PREFILTER_STAGES,
+        masked=True,
+    ):
+        fs = tr.stats.sampling_rate
+        if meta is None:
+            channel_dir = summary_dir / tr.id
+            meta = _open_meta(
+                channel_dir,
+                dict(
+                    id=tr.id,
+                    sampling_rate=fs,
+                    window=window,
+                    welch_win_dur=WELCH_WIN_DUR,
+                    freq_edges=np.geomspace(FREQ_MIN, fs / 2, NUM_FREQS + 1).tolist(),
+                    bands=[list(band) for band in bands],
+                ),
+            )
+
+        # Windows share their edge sample; keep it in the next one only
+        data = tr.data[:int(round(window * fs))]
+        covered = ~np.ma.getmaskarray(data)
+        if covered.sum() < min_coverage * window * fs:
+            psd_db = np.full(NUM_FREQS, np.nan, dtype=np.float16)
+            rms = np.full(len(meta['bands']), np.nan, dtype=np.float32)
+        else:
+            psd_db, rms = _summarize(np.ma.getdata(data), covered, fs, meta)
+        month = win_start.strftime('%Y-%m')
+        rows.setdefault(month, []).append((win_start.timestamp, psd_db, rms))
+
+    if meta is None:
+        print('No data found')
+        return None
+
+    for month, month_rows in rows.items():
+        _write_partition(channel_dir / month, meta, month_rows)
+        print(f'{meta["id"]}: {month} summarized ({len(month_rows)} windows)')
+    return channel_dir
+
+
+def load_summary(summary_dir, tr_id, starttime, endtime, columns=COLUMNS):
+    """
+    Read the summary windows that start within a time range.
+
+    Args:
+        summary_dir (str or :class:`~pathlib.Path`): Root directory of the
+            summary database
+        tr_id (str): Trace ID of the channel, e.g. `'CS.G0.00.X'`
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        columns (tuple): Columns to read, any of `'time'`, `'psd'` and `'rms'`
+
+    Returns:
+        Dict with the requested columns (`'time'` as POSIX timestamps of the
+        window starts, `'psd'` and `'rms'` `NaN` for windows that are mostly
+        gap), plus `'freqs'` (centers of the PSD bins [Hz]) and
+        `'bands'`
+    """
+
+    channel_dir = Path(str(summary_dir)).expanduser().resolve() / tr_id
+    meta = json.loads((channel_dir / META_FILE).read_text())
+    t0, t1 = starttime.timestamp, endtime.timestamp
+
+    parts = {name: [] for name in columns}
+    for month_dir in sorted(d for d in channel_dir.iterdir() if d.is_dir()):
+        month_start = UTCDateTime(f'{month_dir.name}-01').timestamp
+        if month_start >= t1 or _next_month(month_dir.name) <= t0:
+            continue
+        times = np.load(month_dir / 'time.npy', mmap_mode='r')
+        i0, i1 = np.searchsorted(times, [t0, t1])
+        for name in columns:
+            column = np.load(month_dir / f'{name}.npy', mmap_mode='r')
+            parts[name].append(column[i0:i1])
+
+    num_cols = dict(time=None, psd=NUM_FREQS, rms=len(meta['bands']))
+    summary = {}
+    for name in columns:
+        if parts[name]:
+            summary[name] = np.concatenate(parts[name])
+        else:
+            shape = (0,) if num_cols[name] is None else (0, num_cols[name])
+            summary[name] = np.empty(shape)
+    edges = np.array(meta['freq_edges'])
+    summary['freqs'] = np.sqrt(edges[:-1] * edges[1:])
+    summary['bands'] = [tuple(band) for band in meta['bands']]
+    return summary
+
+
+def loudest_windows(summary_dir, tr_id, starttime, endtime, band, num_windows=10):
+    """
+    Find the windows with the largest RMS amplitude in a band, e.g. to pick
+    intervals worth sonifying.
+
+    Args:
+        summary_dir (str or :class:`~pathlib.Path`): Root directory of the
+            summary database
+        tr_id (str): Trace ID of the channel
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        band (tuple): One of the (low, high) bands of the summary [Hz]
+        num_windows (int): Number of windows to return
+
+    Returns:
+        List of (`starttime`, `endtime`, `rms`) tuples, loudest first
+    """
+
+    summary = load_summary(summary_dir, tr_id, starttime, endtime, columns=('time', 'rms'))
+    band_index = summary['bands'].index(tuple(band))
+    rms = summary['rms'][:, band_index]
+    meta = json.loads((Path(str(summary_dir)).expanduser().resolve() / tr_id / META_FILE).read_text())
+    order = np.argsort(np.nan_to_num(rms, nan=-np.inf))[::-1][:num_windows]
+    return [
+        (
+            UTCDateTime(summary['time'][i]),
+            UTCDateTime(summary['time'][i] + meta['window']),
+            float(rms[i]),
+        )
+        for i in order
+    ]
+
+
+def _summarize(data, covered, fs, meta):
+    """
+    Log-binned Welch PSD [dB] and band RMS amplitudes of one window, from the
+    Welch segments that lie within the runs of `covered` samples.
+    """
+
+    runs = np.flatnonzero(np.diff(np.r_[0, covered.astype(np.int8), 0]))
+    runs = [data[i0:i1] for i0, i1 in zip(runs[::2], runs[1::2])]
+    nperseg = min(int(meta['welch_win_dur'] * fs), max(run.size for run in runs))
+
+    # Average over the segments of all runs long enough for one
+    f, psd, num_segs = None, 0, 0
+    for run in runs:
+        if run.size < nperseg:
+            continue
+        f, run_psd = signal.welch(run, fs, window='hann', nperseg=nperseg, noverlap=nperseg // 2)
+        run_segs = (run.size - nperseg // 2) // (nperseg - nperseg // 2)
+        psd = psd + run_psd * run_segs
+        num_segs += run_segs
+    psd = psd / num_segs
+
+    # Average the power over each log-spaced bin (NaN for bins without a
+    # frequency, at the low end)
+    edges = np.array(meta['freq_edges'])
+    which = np.digitize(f, edges) - 1
+    valid = (which >= 0) & (which < NUM_FREQS)
+    sums = np.bincount(which[valid], psd[valid], minlength=NUM_FREQS)
+    counts = np.bincount(which[valid], minlength=NUM_FREQS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        psd_db = 10 * np.log10(sums / counts)
+
+    # RMS amplitude from the integral of the PSD over each band
+    df = f[1] - f[0]
+    rms = np.full(len(meta['bands']), np.nan, dtype=np.float32)
+    for i, (low, high) in enumerate(meta['bands']):
+        in_band = (f >= low) & (f < high)
+        if in_band.any():
+            rms[i] = np.sqrt(psd[in_band].sum() * df)
+
+    return psd_db.astype(np.float16), rms
+
+
+def _next_month(month):
+    """
+    POSIX timestamp of the start of the month after a `'YYYY-MM'` month.
+    """
+
+    year, month = (int(v) for v in month.split('-'))
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return UTCDateTime(year, month, 1).timestamp
+
+
+def _open_meta(channel_dir, meta):
+    """
+    Read the settings of an existing summary (checking that they match) or
+    start a new one.
+    """
+
+    meta_file = channel_dir / META_FILE
+    if meta_file.is_file():
+        existing = json.loads(meta_file.read_text())
+        for key in 'sampling_rate', 'window', 'welch_win_dur', 'bands':
+            if existing[key] != meta[key]:
+                raise ValueError(
+                    f'Summary in {channel_dir} was built with {key}={existing[key]!r}, '
+                    f'not {meta[key]!r}'
+                )
+        return existing
+    os.makedirs(channel_dir, exist_ok=True)
+    meta_file.write_text(json.dumps(meta, indent=2))
+    return meta
+
+
+def _write_partition(month_dir, meta, rows):
+    """
+    Merge rows of (time, psd, rms) into a month partition, replacing rows with
+    the same time, and rewrite its columns.
+    """
+
+    times = np.array([row[0] for row in rows])
+    psd = np.array([row[1] for row in rows], dtype=np.float16)
+    rms = np.array([row[2] for row in rows], dtype=np.float32)
+
+    if (month_dir / 'time.npy').is_file():
+        old_times = np.load(month_dir / 'time.npy')
+        keep = ~np.isin(old_times, times)
+        times = np.concatenate([old_times[keep], times])
+        psd = np.concatenate([np.load(month_dir / 'psd.npy')[keep], psd])
+        rms = np.concatenate([np.load(month_dir / 'rms.npy')[keep], rms])
+
+    order = np.argsort(times)
+    os.makedirs(month_dir, exist_ok=True)
+    # Index last, so that it never points past the other columns
+    for name, column in (('psd', psd), ('rms', rms), ('time', times)):
+        temp_file = month_dir / f'{name}.tmp.npy'
+        np.save(temp_file, column[order])
+        os.replace(temp_file, month_dir / f'{name}.npy')
@@ -0,0 +1,460 @@
+"""
+Multi-resolution spectrogram tile pyramid for browsing weeks or months of
+data.
+
+The spectrogram is computed once, with the same settings as
+:func:`~sonify_input._compute_spectrogram`, and stored per channel as tiles
+of three levels:
+
+- `'minute'`: one-hour tiles with the STFT columns themselves
+- `'hour'`: one-day tiles with 30 s columns
+- `'day'`: 30-day tiles with 10 min columns
+
+Column `k` of a tile is centered at `k` column durations after the tile
+start, and holds the column of the finer level (or of the STFT) centered
+nearest to that time. Each level is averaged (in power) from the level below it. Tiles are
+:mod:`numpy` arrays of shape (frequencies, columns) holding the power in dB,
+either quantized to `uint8` (255 for no data) or as `float16` (NaN for no
+data), and the frequency axis is averaged down to at most `FREQ_BINS` bins.
+Layout on disk::
+
+    <pyramid_dir>/<trace id>/meta.json
+    <pyramid_dir>/<trace id>/<level>/<tile start, POSIX timestamp>.npy
+
+:func:`assemble` cuts any time range at screen resolution from the coarsest
+level that is fine enough, reading only a few memory-mapped tiles.
+:func:`update_pyramid` adds new data to an existing pyramid, recomputing
+only the tiles it touches.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.image import imsave
+from obspy import UTCDateTime
+
+from batch import iter_windows
+from sonify_input import PAD, QUALITY_PRESETS, RESOLUTIONS
+from spectral import stft_params
+
+# Level name -> (tile duration [s], column duration [s] or None for the STFT
+# columns), from finest to coarsest
+LEVELS = {
+    'minute': (3600, None),
+    'hour': (86400, 30),
+    'day': (30 * 86400, 600),
+}
+
+FREQ_BINS = 512  # Maximum number of frequency bins stored
+
+NO_DATA = 255  # uint8 code of missing columns
+
+META_FILE = 'meta.json'
+
+
+def build_pyramid(
+    path_data,
+    format_in,
+    pyramid_dir,
+    starttime,
+    endtime,
+    freqmin=None,
+    freqmax=None,
+    speed_up_factor=200,
+    spec_win_dur=5,
+    dtype='uint8',
+    db_range=(-120, 40),
+    quality='publication',
+):
+    """
+    Compute the spectrogram of a time span of a data folder and store it in
+    the tile pyramid, replacing what the pyramid had for that span.
+
+    The data is filtered as by :func:`~sonify_input.sonify_input` (and in a
+    single sweep, see :func:`~batch.iter_windows`), so `freqmin`, `freqmax`
+    and `speed_up_factor` only matter for the bandpass corners.
+
+    Args:
+        path_data (str): Path to data files
+        format_in (str): Format of data files
+        pyramid_dir (str or :class:`~pathlib.Path`): Root directory of the
+            pyramid
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        freqmin (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        freqmax (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        speed_up_factor (int): See docstring for
+            :func:`~sonify_input.sonify_input`
+        spec_win_dur (int or float): Duration of spectrogram window [s]
+        dtype (str): `'uint8'` or `'float16'` storage of new pyramids
+        db_range (tuple): (min, max) power [dB] covered by `'uint8'` tiles
+        quality (str): See docstring for :func:`~sonify_input.sonify_input`;
+            sets the spectrogram zero-padding and overlap (and so the
+            duration of the finest columns)
+
+    Returns:
+        List of :class:`~pathlib.Path` of the channel directories updated
+    """
+
+    if dtype not in ('uint8', 'float16'):
+        raise ValueError("dtype must be 'uint8' or 'float16'")
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f'Quality must be one of {list(QUALITY_PRESETS)}')
+    preset = QUALITY_PRESETS[quality]
+    pyramid_dir = Path(str(pyramid_dir)).expanduser().resolve()
+
+    tile_dur = LEVELS['minute'][0]
+    first_tile = _floor(starttime, tile_dur)
+    half_win = spec_win_dur / 2
+
+    channel_dir, meta, updated = None, None, [None, None]
+    # One window per finest tile, widened so that every column centered in
+    # the tile is complete
+    for win_start, _, tr, (f, t_mpl, sxx_db) in iter_windows(
+        path_data,
+        format_in,
+        first_tile - half_win,
+        endtime,
+        tile_dur + 2 * half_win,
+        step=tile_dur,
+        freqmin=freqmin,
+        freqmax=freqmax,
+        speed_up_factor=speed_up_factor,
+        spec_win_dur=spec_win_dur,
+        quality=quality,
+    ):
+        if meta is None:
+            channel_dir = pyramid_dir / tr.id
+            fs = tr.stats.sampling_rate
+            nperseg, noverlap, _ = stft_params(
+                fs, spec_win_dur, zero_pad=preset['zero_pad'], overlap=preset['overlap']
+            )
+            meta = _open_meta(
+                channel_dir,
+                dict(
+                    id=tr.id,
+                    sampling_rate=fs,
+                    spec_win_dur=spec_win_dur,
+                    quality=quality,
+                    hop=(nperseg - noverlap) / fs,
+                    freqs=_reduce_freqs(f, f[:, None])[:, 0].tolist(),
+                    dtype=dtype,
+                    db_range=list(db_range),
+                    endtime=None,
+                ),
+            )
+        if not t_mpl.size:
+            continue
+
+        tile_start = win_start + half_win
+        times = (t_mpl - UTCDateTime(0).matplotlib_date) * 86400  # POSIX [s]
+        in_tile = (times >= tile_start.timestamp) & (times < tile_start.timestamp + tile_dur)
+        power = _reduce_freqs(f, 10 ** (sxx_db[:, in_tile] / 10))
+        _write_columns(channel_dir, meta, 'minute', times[in_tile], 10 * np.log10(power))
+
+        t_end = times[in_tile][-1] + meta['hop'] if in_tile.any() else tile_start.timestamp
+        updated = [
+            min(v for v in (updated[0], tile_start.timestamp) if v is not None),
+            max(v for v in (updated[1], t_end) if v is not None),
+        ]
+        print(f'{tr.id}: {tile_start.strftime("%d-%b-%Y %H:%M")} done')
+
+    if meta is None:
+        print('No data found')
+        return []
+    if updated[0] is None:
+        print('No complete spectrogram column found')
+        return []
+
+    # Coarser levels from the finer ones, over the updated span only
+    names = list(LEVELS)
+    for finer, level in zip(names, names[1:]):
+        _aggregate(channel_dir, meta, finer, level, *updated)
+
+    meta['endtime'] = max(meta['endtime'] or updated[1], updated[1])
+    _save_meta(channel_dir, meta)
+    return [channel_dir]
+
+
+def update_pyramid(path_data, format_in, pyramid_dir, tr_id, endtime=None, **kwargs):
+    """
+    Add the data that arrived since the last update of a channel.
+
+    The span from a little before the previous end (to replace the columns
+    that were filtered without the data that followed) up to `endtime` is
+    recomputed with :func:`build_pyramid`.
+
+    Args:
+        path_data (str): Path to data files
+        format_in (str): Format of data files
+        pyramid_dir (str or :class:`~pathlib.Path`): Root directory of the
+            pyramid
+        tr_id (str): Trace ID of the channel, e.g. `'CS.G0.00.X'`
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+            (defaults to now)
+        **kwargs: Passed to :func:`build_pyramid`; must match the settings the
+            pyramid was built with
+
+    Returns:
+        See :func:`build_pyramid`
+    """
+
+    channel_dir = Path(str(pyramid_dir)).expanduser().resolve() / tr_id
+    meta = json.loads((channel_dir / META_FILE).read_text())
+    starttime = UTCDateTime(meta['endtime']) - PAD - meta['spec_win_dur']
+    kwargs.setdefault('spec_win_dur', meta['spec_win_dur'])
+    kwargs.setdefault('dtype', meta['dtype'])
+    kwargs.setdefault('db_range', tuple(meta['db_range']))
+    kwargs.setdefault('quality', meta.get('quality', 'publication'))
+    return build_pyramid(
+        path_data, format_in, pyramid_dir, starttime, endtime or UTCDateTime(), **kwargs
+    )
+
+
+def assemble(pyramid_dir, tr_id, starttime, endtime, width=1920):
+    """
+    Cut a time range from the pyramid at screen resolution.
+
+    The coarsest level with at least one column per output column is used,
+    and each output column takes the maximum power of the columns it covers,
+    so short events stay visible when zoomed out.
+
+    Args:
+        pyramid_dir (str or :class:`~pathlib.Path`): Root directory of the
+            pyramid
+        tr_id (str): Trace ID of the channel
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        width (int): Number of output columns
+
+    Returns:
+        Tuple of (`f`, `t_mpl`, `sxx_db`) as returned by
+        :func:`~sonify_input._compute_spectrogram`, with `width` columns and
+        NaN where there is no data
+    """
+
+    channel_dir = Path(str(pyramid_dir)).expanduser().resolve() / tr_id
+    meta = json.loads((channel_dir / META_FILE).read_text())
+    t0, t1 = starttime.timestamp, endtime.timestamp
+    px_dur = (t1 - t0) / width
+
+    level = 'minute'
+    for name, (_, col_dur) in LEVELS.items():
+        if (col_dur or meta['hop']) <= px_dur:
+            level = name
+
+    col_dur = _column_duration(meta, level)
+    col_times, sxx_db = _read_columns(channel_dir, meta, level, t0 - col_dur, t1 + col_dur)
+    px_times = t0 + px_dur * (np.arange(width) + 0.5)
+    out = np.full((len(meta['freqs']), width), np.nan, dtype=np.float32)
+    if col_times.size and col_dur > px_dur:
+        # Zoomed in beyond the STFT columns: repeat the nearest column
+        cols = np.round((px_times - col_times[0]) / col_dur).astype(int)
+        valid = (cols >= 0) & (cols < col_times.size)
+        out[:, valid] = sxx_db[:, cols[valid]]
+    elif col_times.size:
+        px = np.floor((col_times - t0) / px_dur).astype(int)
+        keep = (px >= 0) & (px < width)
+        px, sxx_db = px[keep], sxx_db[:, keep]
+        if px.size:
+            starts = np.flatnonzero(np.r_[True, np.diff(px) > 0])
+            out[:, px[starts]] = np.fmax.reduceat(sxx_db, starts, axis=1)
+
+    t_mpl = UTCDateTime(0).matplotlib_date + px_times / 86400
+    return np.array(meta['freqs']), t_mpl, out
+
+
+def export_image(
+    pyramid_dir, tr_id, starttime, endtime, image_file, resolution='1080p', db_lim=None
+):
+    """
+    Save a time range of the pyramid as an image (time to the right,
+    frequency up), e.g. for a quick look or a web viewer.
+
+    Args:
+        pyramid_dir (str or :class:`~pathlib.Path`): Root directory of the
+            pyramid
+        tr_id (str): Trace ID of the channel
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        image_file (str or :class:`~pathlib.Path`): Output image (e.g. PNG)
+        resolution (str): Image size; see :data:`~sonify_input.RESOLUTIONS`
+        db_lim (tuple): Min and max colormap cutoffs [dB] (defaults to the
+            range of the data)
+    """
+
+    width, height = RESOLUTIONS[resolution]
+    f, _, sxx_db = assemble(pyramid_dir, tr_id, starttime, endtime, width=width)
+    rows = np.minimum((np.arange(height)[::-1] + 0.5) / height * f.size, f.size - 1)
+    image = sxx_db[rows.astype(int)]
+    vmin, vmax = db_lim or (np.nanmin(image), np.nanmax(image))
+    cmap = colormaps['jet'].copy()
+    cmap.set_bad('white')
+    imsave(image_file, np.ma.masked_invalid(image), cmap=cmap, vmin=vmin, vmax=vmax)
+
+
+def _floor(time, duration):
+    """
+    Start of the tile of a given duration that contains a time.
+    """
+
+    return UTCDateTime(np.floor(time.timestamp / duration) * duration)
+
+
+def _open_meta(channel_dir, meta):
+    """
+    Read the settings of an existing pyramid (checking that they match) or
+    start a new one.
+    """
+
+    meta_file = channel_dir / META_FILE
+    if meta_file.is_file():
+        existing = json.loads(meta_file.read_text())
+        for key in 'sampling_rate', 'spec_win_dur', 'hop', 'dtype', 'db_range':
+            if existing[key] != meta[key]:
+                raise ValueError(
+                    f'Pyramid in {channel_dir} was built with {key}={existing[key]!r}, '
+                    f'not {meta[key]!r}'
+                )
+        return existing
+    os.makedirs(channel_dir, exist_ok=True)
+    _save_meta(channel_dir, meta)
+    return meta
+
+
+def _save_meta(channel_dir, meta):
+    temp_file = channel_dir / f'{META_FILE}.tmp'
+    temp_file.write_text(json.dumps(meta, indent=2))
+    os.replace(temp_file, channel_dir / META_FILE)
+
+
+def _reduce_freqs(f, values):
+    """
+    Average rows of `values` (one per frequency of `f`) down to at most
+    :data:`FREQ_BINS` equally wide groups.
+    """
+
+    if f.size <= FREQ_BINS:
+        return values
+    starts = np.linspace(0, f.size, FREQ_BINS + 1).astype(int)[:-1]
+    counts = np.diff(np.r_[starts, f.size])
+    return np.add.reduceat(values, starts, axis=0) / counts[:, None]
+
+
+def _column_duration(meta, level):
+    return LEVELS[level][1] or meta['hop']
+
+
+def _tile_file(channel_dir, level, tile_start):
+    return channel_dir / level / f'{int(tile_start)}.npy'
+
+
+def _load_tile(channel_dir, meta, level, tile_start, mmap_mode=None):
+    """
+    Power [dB] of a tile as `float32`, with NaN for no data (all NaN if the
+    tile does not exist yet).
+    """
+
+    tile_dur = LEVELS[level][0]
+    num_cols = int(round(tile_dur / _column_duration(meta, level)))
+    tile_file = _tile_file(channel_dir, level, tile_start)
+    if not tile_file.is_file():
+        return np.full((len(meta['freqs']), num_cols), np.nan, dtype=np.float32)
+    codes = np.load(tile_file, mmap_mode=mmap_mode)
+    if meta['dtype'] == 'float16':
+        return codes.astype(np.float32)
+    lo, hi = meta['db_range']
+    sxx_db = lo + codes.astype(np.float32) * ((hi - lo) / (NO_DATA - 1))
+    sxx_db[codes == NO_DATA] = np.nan
+    return sxx_db
+
+
+def _save_tile(channel_dir, meta, level, tile_start, sxx_db):
+    if meta['dtype'] == 'float16':
+        codes = sxx_db.astype(np.float16)
+    else:
+        lo, hi = meta['db_range']
+        codes = np.round((sxx_db - lo) / (hi - lo) * (NO_DATA - 1))
+        codes = np.clip(np.nan_to_num(codes, nan=NO_DATA), 0, NO_DATA).astype(np.uint8)
+        codes[np.isnan(sxx_db)] = NO_DATA
+    tile_file = _tile_file(channel_dir, level, tile_start)
+    os.makedirs(tile_file.parent, exist_ok=True)
+    temp_file = tile_file.with_suffix('.tmp.npy')
+    np.save(temp_file, codes)
+    os.replace(temp_file, tile_file)  # Readers never see a partial tile
+
+
+def _write_columns(channel_dir, meta, level, times, sxx_db):
+    """
+    Store columns (POSIX times of their centers, power [dB]) in the tiles of a
+    level, each in the slot centered nearest to it, replacing what was there.
+    """
+
+    tile_dur = LEVELS[level][0]
+    col_dur = _column_duration(meta, level)
+    # A column centered within half a slot before a tile goes in its first
+    # slot
+    tile_starts = np.floor((times + col_dur / 2) / tile_dur) * tile_dur
+    for tile_start in np.unique(tile_starts):
+        in_tile = tile_starts == tile_start
+        tile = _load_tile(channel_dir, meta, level, tile_start)
+        cols = np.floor((times[in_tile] - tile_start) / col_dur + 0.5).astype(int)
+        cols = np.clip(cols, 0, tile.shape[1] - 1)
+        tile[:, cols] = sxx_db[:, in_tile]
+        _save_tile(channel_dir, meta, level, tile_start, tile)
+
+
+def _read_columns(channel_dir, meta, level, t0, t1):
+    """
+    Columns of a level between two POSIX times.
+
+    Returns:
+        Tuple of (`times`, `sxx_db`) with the POSIX times of the column centers
+        and their power [dB] (NaN for no data)
+    """
+
+    tile_dur = LEVELS[level][0]
+    col_dur = _column_duration(meta, level)
+    times, blocks = [], []
+    for tile_start in np.arange(np.floor(t0 / tile_dur) * tile_dur, t1, tile_dur):
+        tile = _load_tile(channel_dir, meta, level, tile_start, mmap_mode='r')
+        col_times = tile_start + np.arange(tile.shape[1]) * col_dur
+        keep = (col_times >= t0) & (col_times < t1)
+        times.append(col_times[keep])
+        blocks.append(tile[:, keep])
+    if not times:
+        return np.empty(0), np.empty((len(meta['freqs']), 0))
+    return np.concatenate(times), np.hstack(blocks)
+
+
+def _aggregate(channel_dir, meta, finer, level, t0, t1):
+    """
+    Recompute the columns of `level` between two POSIX times by averaging the
+    power of the `finer` level columns centered within half a column of
+    theirs.
+    """
+
+    col_dur = _column_duration(meta, level)
+    first = np.floor(t0 / col_dur + 0.5)  # Index of the first column since 1970
+    t0 = (first - 0.5) * col_dur
+    t1 = (np.floor(t1 / col_dur + 0.5) + 0.5) * col_dur
+    times, sxx_db = _read_columns(channel_dir, meta, finer, t0, t1)
+    if not times.size:
+        return
+    cols = (np.floor(times / col_dur + 0.5) - first).astype(int)
+    num_cols = cols.max() + 1
+    power = np.nan_to_num(10 ** (sxx_db / 10))
+    valid = ~np.isnan(sxx_db[0])
+    sums = np.zeros((sxx_db.shape[0], num_cols))
+    np.add.at(sums.T, cols[valid], power[:, valid].T)
+    counts = np.bincount(cols[valid], minlength=num_cols)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coarse_db = 10 * np.log10(sums / counts)
+    has_data = counts > 0
+    col_times = (first + np.arange(num_cols)) * col_dur
+    _write_columns(channel_dir, meta, level, col_times[has_data], coarse_db[:, has_data])
@@ -0,0 +1,335 @@
+"""
+Archive-wide data quality control: scan every data file of one or more
+folders in parallel and keep a compact report in an SQLite database, which
+can be queried, printed, and used by later renders (see the `qc_report`
+argument of :func:`~sonify_input.sonify_input`) without reading the files
+again.
+
+For each trace of each file, the `traces` table holds its span, the number
+of NaN, infinite and clipped samples (absolute value of at least `clip`) and
+the time ranges of the runs of such samples. The `gaps` view lists the gaps
+and overlaps between consecutive traces of the same channel, within or
+between files. Files that did not change since the last scan (same size and
+modification time) are not read again.
+
+Usage:
+
+    python qc.py report.sqlite PICKLE data/Geophone_0_X data/Geophone_0_Y --clip 8388607
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+
+import numpy as np
+import obspy
+from obspy import UTCDateTime
+
+from utils import index_ranges, read_stream_bz2_pickle
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS traces (
+    path TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    id TEXT,
+    starttime REAL,
+    endtime REAL,
+    sampling_rate REAL,
+    npts INTEGER,
+    nan INTEGER,
+    inf INTEGER,
+    clipped INTEGER,
+    bad_ranges TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS traces_path ON traces (path);
+CREATE INDEX IF NOT EXISTS traces_id ON traces (id, starttime);
+CREATE VIEW IF NOT EXISTS gaps AS
+SELECT
+    id,
+    CASE WHEN delta > 0 THEN 'gap' ELSE 'overlap' END AS kind,
+    prev_path,
+    path,
+    prev_end AS starttime,
+    starttime AS endtime,
+    ABS(delta) AS duration
+FROM (
+    SELECT
+        id,
+        path,
+        starttime,
+        LAG(path) OVER w AS prev_path,
+        LAG(endtime) OVER w AS prev_end,
+        starttime - LAG(endtime) OVER w - 1 / sampling_rate AS delta,
+        sampling_rate
+    FROM traces
+    WHERE error IS NULL
+    WINDOW w AS (PARTITION BY id ORDER BY starttime)
+)
+WHERE ABS(delta) > 0.5 / sampling_rate;
+"""
+
+
+def scan_file(path, format_in, clip=None):
+    """
+    Check the traces of a data file for NaN, infinite and clipped samples.
+
+    Args:
+        path (str): Data file
+        format_in (str): Format of the data file (`'bz2'` for a compressed
+            pickled Stream)
+        clip (int or float): Absolute value from which samples count as
+            clipped, or `None` to skip this check
+
+    Returns:
+        List with a row of the `traces` table for each trace (a single row
+        with the `error` if the file can't be read)
+    """
+
+    stat = os.stat(path)
+    file_info = (path, stat.st_size, stat.st_mtime)
+    try:
+        if format_in.lower() == 'bz2':
+            st = read_stream_bz2_pickle(path)
+        else:
+            st = obspy.read(path, format=format_in)
+    except Exception as e:
+        return [file_info + (None,) * 9 + (f'{type(e).__name__}: {e}',)]
+
+    rows = []
+    for tr in st:
+        data = tr.data
+        fs = tr.stats.sampling_rate
+        if np.issubdtype(data.dtype, np.floating):
+            nan, inf = np.isnan(data), np.isinf(data)
+            bad = nan | inf
+        else:
+            nan = inf = bad = np.zeros(data.size, dtype=bool)
+        clipped = np.abs(data) >= clip if clip is not None else np.zeros(data.size, dtype=bool)
+        bad |= clipped
+
+        # Times of the first and last bad sample of each run. The runs are kept
+        # exact, since clean_trace() zeroes every sample of a range
+        t0 = tr.stats.starttime.timestamp
+        ranges = index_ranges(bad) + [0, -1]
+        bad_ranges = [[t0 + start / fs, t0 + stop / fs] for start, stop in ranges]
+        rows.append(
+            file_info
+            + (
+                tr.id,
+                t0,
+                tr.stats.endtime.timestamp,
+                fs,
+                tr.stats.npts,
+                int(np.count_nonzero(nan)),
+                int(np.count_nonzero(inf)),
+                int(np.count_nonzero(clipped & ~(nan | inf))),
+                json.dumps(bad_ranges),
+                None,
+            )
+        )
+    return rows
+
+
+def scan(report, paths, format_in, clip=None, max_workers=None):
+    """
+    Scan the data files of folders into a report, reading only the files
+    that are new or changed since the last scan, and forgetting those that
+    were removed from the folders (or no longer exist).
+
+    Args:
+        report (str): SQLite database file (created if needed)
+        paths (list): Folders of data files
+        format_in (str): Format of data files
+        clip (int or float): See docstring for :func:`scan_file`
+        max_workers (int): Number of files read at the same time (defaults to
+            the number of CPUs)
+
+    Returns:
+        Tuple of (number of files read, number of files unchanged)
+    """
+
+    files = [
+        os.path.join(path, file)
+        for path in paths
+        for file in sorted(os.listdir(path))
+        if os.path.isfile(os.path.join(path, file))
+    ]
+    with closing(sqlite3.connect(report)) as db, db:
+        db.executescript(SCHEMA)
+        known = {
+            path: (size, mtime)
+            for path, size, mtime in db.execute('SELECT DISTINCT path, size, mtime FROM traces')
+        }
+        listed = set(files)
+        folders = {os.path.dirname(os.path.join(path, '')) for path in paths}
+        removed = [
+            path
+            for path in known
+            if path not in listed and (os.path.dirname(path) in folders or not os.path.exists(path))
+        ]
+        db.executemany('DELETE FROM traces WHERE path = ?', [(path,) for path in removed])
+
+        todo = []
+        for file in files:
+            stat = os.stat(file)
+            if known.get(file) != (stat.st_size, stat.st_mtime):
+                todo.append(file)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(
+                scan_file,
+                todo,
+                [format_in] * len(todo),
+                [clip] * len(todo),
+                chunksize=max(1, len(todo) // (4 * (os.cpu_count() or 1))),
+            )
+            for file, rows in zip(todo, results):
+                db.execute('DELETE FROM traces WHERE path = ?', (file,))
+                db.executemany(f'INSERT INTO traces VALUES ({", ".join("?" * 13)})', rows)
+
+    return len(todo), len(files) - len(todo)
+
+
+def bad_ranges(report, tr_id, starttime, endtime):
+    """
+    Time ranges of the NaN, infinite or clipped samples of a channel in the
+    report.
+
+    Args:
+        report (str): SQLite database file written by :func:`scan`
+        tr_id (str): SEED id of the channel
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+
+    Returns:
+        Sorted list of (`start`, `end`) tuples of
+        :class:`~obspy.core.utcdatetime.UTCDateTime` (first and last bad
+        sample) that overlap the interval
+    """
+
+    with closing(sqlite3.connect(report)) as db:
+        rows = db.execute(
+            'SELECT bad_ranges FROM traces WHERE id = ? AND bad_ranges != ? '
+            'AND starttime <= ? AND endtime >= ?',
+            (tr_id, '[]', endtime.timestamp, starttime.timestamp),
+        ).fetchall()
+    ranges = sorted(
+        (start, end)
+        for (row,) in rows
+        for start, end in json.loads(row)
+        if start <= endtime.timestamp and end >= starttime.timestamp
+    )
+    return [(UTCDateTime(start), UTCDateTime(end)) for start, end in ranges]
+
+
+def clean_trace(tr, report, time_shift=0):
+    """
+    Set the samples of a trace that the report flags as NaN, infinite or
+    clipped to zero, in place.
+
+    Args:
+        tr (:class:`~obspy.core.trace.Trace`): Trace, e.g. merged from the
+            files of a folder
+        report (str): SQLite database file written by :func:`scan`
+        time_shift (int or float): Time added to the trace since it was read
+            (e.g. a UTC offset) [s]
+
+    Returns:
+        Number of samples set to zero
+    """
+
+    fs = tr.stats.sampling_rate
+    t0 = tr.stats.starttime - time_shift
+    count = 0
+    for start, end in bad_ranges(report, tr.id, t0, tr.stats.endtime - time_shift):
+        i0 = max(int(round((start - t0) * fs)), 0)
+        i1 = min(int(round((end - t0) * fs)) + 1, tr.stats.npts)
+        if i1 > i0:
+            tr.data[i0:i1] = 0
+            count += i1 - i0
+    return count
+
+
+def summarize(report):
+    """
+    Print a summary of a report: per channel the time covered, the bad
+    samples and the gaps and overlaps, and the files that can't be read.
+
+    Args:
+        report (str): SQLite database file written by :func:`scan`
+    """
+
+    with closing(sqlite3.connect(report)) as db:
+        channels = db.execute(
+            'SELECT id, COUNT(DISTINCT path), MIN(starttime), MAX(endtime), '
+            'SUM(npts / sampling_rate), SUM(nan), SUM(inf), SUM(clipped), '
+            'SUM(bad_ranges != ?) FROM traces WHERE error IS NULL GROUP BY id',
+            ('[]',),
+        ).fetchall()
+        gaps = dict(
+            ((tr_id, kind), (count, total))
+            for tr_id, kind, count, total in db.execute(
+                'SELECT id, kind, COUNT(*), SUM(duration) FROM gaps GROUP BY id, kind'
+            )
+        )
+        errors = db.execute('SELECT path, error FROM traces WHERE error IS NOT NULL').fetchall()
+
+    for tr_id, num_files, start, end, covered, nan, inf, clipped, num_bad in channels:
+        print(
+            f'{tr_id}: {num_files} files from {UTCDateTime(start)} to {UTCDateTime(end)} '
+            f'({covered / 86400:.2f} days of data)'
+        )
+        print(f'  {nan} NaN, {inf} inf, {clipped} clipped samples in {num_bad} traces')
+        for kind in 'gap', 'overlap':
+            count, total = gaps.get((tr_id, kind), (0, 0))
+            print(f'  {count} {kind}s ({total:.1f} s)')
+    for path, error in errors:
+        print(f'Can not read {path} ({error})')
+
+
+def main():
+    """
+    This function is run when ``qc.py`` is called as a script.
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Check every data file of one or more folders for NaN, infinite and clipped samples, gaps and overlaps, and keep the result in an SQLite report.',
+        allow_abbrev=False,
+    )
+    parser.add_argument('report', help='SQLite database file of the report')
+    parser.add_argument('format_in', help='format of data files, e.g. PICKLE')
+    parser.add_argument('path_data', nargs='+', help='folders of data files')
+    parser.add_argument(
+        '--clip',
+        default=None,
+        type=float,
+        help='absolute value from which samples count as clipped (not checked by default)',
+    )
+    parser.add_argument(
+        '--max_workers',
+        default=None,
+        type=int,
+        help='number of files read at the same time (defaults to the number of CPUs)',
+    )
+    input_args = parser.parse_args()
+
+    t = time.time()
+    num_read, num_unchanged = scan(
+        input_args.report,
+        input_args.path_data,
+        input_args.format_in,
+        clip=input_args.clip,
+        max_workers=input_args.max_workers,
+    )
+    print(f'Read {num_read} files ({num_unchanged} unchanged) in {time.time() - t:.1f} s')
+    summarize(input_args.report)
+
+
+if __name__ == '__main__':
+    main()
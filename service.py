@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+"""
+Local render service: a small HTTP server that runs :func:`sonify_input`
+jobs for several users on one host.
+
+Jobs run in a bounded pool of worker processes. Requests are keyed by their
+normalized parameters, so a request identical to one that is still running
+waits for the same job instead of starting another one, and finished outputs
+are kept in a least-recently-used cache on disk, so repeated requests return
+at once. Only the standard library is used on top of the pipeline itself.
+
+Requests (JSON bodies and responses):
+
+- ``POST /render`` with the keyword arguments of :func:`sonify_input` (times
+  as strings, e.g. ``"2021-10-09T12:50:00"``). Add ``"wait": true`` to block
+  until the output is ready. Responds with the job status (see below), with
+  code 200 if the output is ready and 202 if it is queued or running.
+- ``GET /jobs/<job_id>`` for the status of a job.
+
+A job status is a dict with the keys `'job_id'`, `'status'` (`'queued'`,
+`'running'`, `'done'` or `'failed'`), `'output'` (path of the output file
+once done) and `'error'` (message if failed).
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.request import Request, urlopen
+
+from obspy import UTCDateTime
+
+from sonify_input import QUALITY_PRESETS, sonify_input
+
+DEFAULT_PORT = 8047
+
+# Arguments set by the service rather than by the request
+RESERVED_ARGS = ('output_dir',)
+
+REQUEST_FILE = 'request.json'  # Stored next to each cached output
+
+
+def normalize_params(params):
+    """
+    Fill in the defaults of :func:`sonify_input` (including those of the
+    quality preset) and bring the parameters to a canonical form, so that
+    equivalent requests (e.g. `speed_up_factor=200` and
+    `speed_up_factor=200.0`, `fps=None` and the preset's `fps`, or times
+    written differently) give the same key. The key also holds the name, size
+    and modification time of every data file, so that a request made after
+    the data has changed is rendered again.
+
+    Args:
+        params (dict): Keyword arguments of :func:`sonify_input`
+
+    Returns:
+        Tuple of (`key`, `kwargs`) with the canonical JSON string of the
+        parameters and data files and the keyword arguments to call
+        :func:`sonify_input` with
+
+    Raises:
+        ValueError: If the quality preset is unknown
+    """
+
+    params = {k: v for k, v in params.items() if k not in RESERVED_ARGS}
+    signature = inspect.signature(sonify_input)
+    bound = signature.bind(**params)
+    bound.apply_defaults()
+    kwargs = {k: v for k, v in bound.arguments.items() if k not in RESERVED_ARGS}
+
+    # Canonical values. Whole numbers are passed as int where the default is
+    # an int, since e.g. the speed-up factor ends up in the file names
+    for name, value in kwargs.items():
+        default = signature.parameters[name].default
+        if type(default) is int and isinstance(value, float) and value.is_integer():
+            kwargs[name] = int(value)
+    for name in 'starttime', 'endtime':
+        kwargs[name] = UTCDateTime(kwargs[name])
+    paths = kwargs['path_data']
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    kwargs['path_data'] = [str(Path(path).expanduser().resolve()) for path in paths]
+    if isinstance(kwargs['db_lim'], list):
+        kwargs['db_lim'] = tuple(kwargs['db_lim'])
+    if kwargs['quality'] not in QUALITY_PRESETS:
+        raise ValueError(f'Quality must be one of {list(QUALITY_PRESETS)}')
+    for name in 'fps', 'resolution':
+        kwargs[name] = kwargs[name] or QUALITY_PRESETS[kwargs['quality']][name]
+
+    def _canonical(value):
+        if isinstance(value, UTCDateTime):
+            return str(value)
+        if isinstance(value, bool) or value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, (list, tuple)):
+            return [_canonical(v) for v in value]
+        return repr(value)
+
+    key = {k: _canonical(v) for k, v in kwargs.items()}
+    key['data_files'] = [_data_files(path) for path in kwargs['path_data']]
+    return json.dumps(key, sort_keys=True), kwargs
+
+
+def _data_files(path_data):
+    """
+    Name, size and modification time [ns] of each file of a data folder, in
+    name order (empty if the folder does not exist).
+    """
+
+    if not os.path.isdir(path_data):
+        return []
+    files = []
+    for name in sorted(os.listdir(path_data)):
+        file = os.path.join(path_data, name)
+        if os.path.isfile(file):
+            stat = os.stat(file)
+            files.append([name, stat.st_size, stat.st_mtime_ns])
+    return files
+
+
+def job_id(key):
+    """
+    Short, stable ID of a normalized request key.
+    """
+
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class RenderService:
+    """
+    Job queue, worker pool, in-flight coalescing and LRU output cache behind
+    the HTTP server. Thread-safe.
+
+    Args:
+        cache_dir (str or :class:`~pathlib.Path`): Directory for the outputs,
+            one subdirectory per job. Outputs already there from a previous
+            run are cached again
+        max_workers (int): Number of jobs rendered at the same time
+        max_entries (int): Number of finished outputs kept; the least
+            recently requested are deleted first. As many errors of failed
+            jobs are kept for their status
+        max_queue (int): Number of jobs queued or running at the same time
+            before new requests are refused
+    """
+
+    def __init__(self, cache_dir, max_workers=2, max_entries=50, max_queue=20):
+        self.cache_dir = Path(str(cache_dir)).expanduser().resolve()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_queue = max_queue
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.lock = threading.RLock()  # Callbacks of finished futures run at once
+        self.in_flight = {}  # Job ID -> Future
+        self.failed = OrderedDict()  # Job ID -> error message, oldest first
+        self.cache = OrderedDict()  # Job ID -> output file, oldest first
+        self._load_cache()
+
+    def _load_cache(self):
+        job_dirs = [d for d in self.cache_dir.iterdir() if (d / REQUEST_FILE).is_file()]
+        for job_dir in sorted(job_dirs, key=lambda d: d.stat().st_mtime):
+            output = json.loads((job_dir / REQUEST_FILE).read_text())['output']
+            if Path(output).is_file():
+                self.cache[job_dir.name] = Path(output)
+            else:
+                shutil.rmtree(job_dir, ignore_errors=True)
+        self._evict()
+        print(f'{len(self.cache)} cached outputs in {self.cache_dir}')
+
+    def submit(self, params):
+        """
+        Look up or start the job of a request.
+
+        Args:
+            params (dict): Keyword arguments of :func:`sonify_input`
+
+        Returns:
+            Tuple of (`job_id`, `future`) where `future` is `None` if the output
+            is already cached
+
+        Raises:
+            RuntimeError: If the queue is full
+        """
+
+        key, kwargs = normalize_params(params)
+        jid = job_id(key)
+        with self.lock:
+            output = self.cache.get(jid)
+            if output is not None and output.is_file():
+                self.cache.move_to_end(jid)
+                return jid, None
+            self.cache.pop(jid, None)
+
+            future = self.in_flight.get(jid)
+            if future is not None:  # Coalesce with the running job
+                return jid, future
+            if len(self.in_flight) >= self.max_queue:
+                raise RuntimeError(f'Queue is full ({self.max_queue} jobs)')
+
+            job_dir = self.cache_dir / jid
+            shutil.rmtree(job_dir, ignore_errors=True)
+            future = self.executor.submit(_run_job, kwargs, job_dir, key)
+            self.in_flight[jid] = future
+            self.failed.pop(jid, None)
+            future.add_done_callback(lambda f, jid=jid: self._finish(jid, f))
+        print(f'Queued job {jid}')
+        return jid, future
+
+    def _finish(self, jid, future):
+        with self.lock:
+            if self.in_flight.pop(jid, None) is None:
+                return  # Already handled
+            if future.exception() is None:
+                self.cache[jid] = future.result()
+                self._evict()
+                print(f'Finished job {jid}')
+            else:
+                error = f'{type(future.exception()).__name__}: {future.exception()}'
+                self.failed[jid] = error
+                while len(self.failed) > self.max_entries:
+                    self.failed.popitem(last=False)
+                shutil.rmtree(self.cache_dir / jid, ignore_errors=True)
+                print(f'Job {jid} failed ({error})')
+
+    def _evict(self):
+        while len(self.cache) > self.max_entries:
+            jid, _ = self.cache.popitem(last=False)
+            shutil.rmtree(self.cache_dir / jid, ignore_errors=True)
+
+    def status(self, jid):
+        """
+        Returns:
+            Job status dict (see module docstring), or `None` if the job is
+            unknown
+        """
+
+        with self.lock:
+            if jid in self.cache:
+                self.cache.move_to_end(jid)
+                return dict(job_id=jid, status='done', output=str(self.cache[jid]), error=None)
+            future = self.in_flight.get(jid)
+            if future is not None and future.done():  # Callback not run yet
+                self._finish(jid, future)
+                return self.status(jid)
+            if future is not None:
+                status = 'running' if future.running() else 'queued'
+                return dict(job_id=jid, status=status, output=None, error=None)
+            if jid in self.failed:
+                return dict(job_id=jid, status='failed', output=None, error=self.failed[jid])
+        return None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_job(kwargs, job_dir, key):
+    """
+    Run :func:`sonify_input` for one job in a worker process and record the
+    request next to its output.
+
+    Returns:
+        :class:`~pathlib.Path` of the output file
+    """
+
+    os.makedirs(job_dir, exist_ok=True)
+    output = sonify_input(output_dir=job_dir, **kwargs)
+    (job_dir / REQUEST_FILE).write_text(
+        json.dumps(dict(request=json.loads(key), output=str(output)), indent=2)
+    )
+    return output
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    HTTP front end of :class:`RenderService` (see module docstring).
+    """
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/render':
+            return self._reply(404, dict(error=f'Unknown path {self.path}'))
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length) or b'{}')
+            wait = params.pop('wait', False)
+            jid, future = self.server.service.submit(params)
+        except RuntimeError as e:
+            return self._reply(503, dict(error=str(e)))
+        except (TypeError, ValueError) as e:
+            return self._reply(400, dict(error=f'{type(e).__name__}: {e}'))
+
+        if future is not None and wait:
+            try:
+                future.result()
+            except Exception:
+                pass  # Reported by the status
+        status = self.server.service.status(jid)
+        self._reply(200 if status['status'] in ('done', 'failed') else 202, status)
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == 'jobs':
+            status = self.server.service.status(parts[1])
+            if status is not None:
+                return self._reply(200, status)
+        self._reply(404, dict(error=f'Unknown path {self.path}'))
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(cache_dir, host='127.0.0.1', port=DEFAULT_PORT, **kwargs):
+    """
+    Run the render service until interrupted.
+
+    Args:
+        cache_dir (str or :class:`~pathlib.Path`): See :class:`RenderService`
+        host (str): Address to listen on. Keep the default to accept local
+            requests only
+        port (int): Port to listen on
+        **kwargs: Passed to :class:`RenderService`
+    """
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.service = RenderService(cache_dir, **kwargs)
+    print(f'Render service listening on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopped')
+    finally:
+        server.server_close()
+        server.service.shutdown()
+
+
+def request_render(url=f'http://127.0.0.1:{DEFAULT_PORT}', wait=True, **params):
+    """
+    Ask a running render service for a :func:`sonify_input` output; a drop-in
+    for calling :func:`sonify_input` directly from scripts.
+
+    Args:
+        url (str): Address of the service
+        wait (bool): If `True`, block until the output is ready
+        **params: Keyword arguments of :func:`sonify_input`. Times may be
+            :class:`~obspy.core.utcdatetime.UTCDateTime` objects
+
+    Returns:
+        Job status dict (see module docstring)
+    """
+
+    body = {k: str(v) if isinstance(v, UTCDateTime) else v for k, v in params.items()}
+    body['wait'] = wait
+    request = Request(
+        f'{url.rstrip("/")}/render',
+        data=json.dumps(body).encode(),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def main():
+    """
+    This function is run when ``service.py`` is called as a script.
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Run a local render service with request coalescing and a result cache.',
+        allow_abbrev=False,
+    )
+    parser.add_argument('cache_dir', help='directory for the cached outputs')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', default=DEFAULT_PORT, type=int, help='port to listen on')
+    parser.add_argument(
+        '--max_workers', default=2, type=int, help='number of jobs rendered at the same time'
+    )
+    parser.add_argument(
+        '--max_entries', default=50, type=int, help='number of finished outputs kept'
+    )
+    parser.add_argument(
+        '--max_queue', default=20, type=int, help='number of jobs queued or running before refusing requests'
+    )
+    input_args = parser.parse_args()
+
+    serve(
+        input_args.cache_dir,
+        host=input_args.host,
+        port=input_args.port,
+        max_workers=input_args.max_workers,
+        max_entries=input_args.max_entries,
+        max_queue=input_args.max_queue,
+    )
+
+
+if __name__ == '__main__':
+    main()
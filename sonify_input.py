@@ -9,24 +9,27 @@ Modifications:
 import argparse
 import subprocess
 import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import warnings
 from pathlib import Path
 from types import MethodType
 import os
 from utils import read_data_from_folder
-import scipy.signal
+from audio import write_audio
+from filtering import filter_data, filter_traces
+from spectral import compute_spectrograms
 
 import matplotlib
 import matplotlib.dates as mdates
 import numpy as np
 from matplotlib import font_manager
 from matplotlib.animation import FuncAnimation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.figure import Figure
 from matplotlib.gridspec import GridSpec
 from matplotlib.offsetbox import AnchoredText
 from matplotlib.ticker import ScalarFormatter
-from obspy import UTCDateTime
-import obspy.signal.filter
+from obspy import Trace, UTCDateTime
 from obspy.clients.fdsn import RoutingClient
 from obspy.clients.fdsn.client import raise_on_error
 from scipy import signal
@@ -64,9 +67,48 @@ REFERENCE_VELOCITY = 1  # [m/s]
 
 MS_PER_S = 1000  # [ms/s]
 
+# Filter stages (btype, [Hz], corners) applied to all data before the bandpass
+PREFILTER_STAGES = [
+    ('bandstop', (49.8, 50.2), 8),  # Filtering 50 Hz
+]
+
 # Colorbar extension triangle height as proportion of colorbar length
 EXTENDFRAC = 0.04
 
+# Data types for the precision option of sonify_input()
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+
+# Quality presets of sonify_input(): spectrogram FFT length (zero_pad times the
+# next power of two of the window length) and overlap [fraction of a window],
+# spectrogram shading, default resolution and frame rate, and x264 encoder
+# preset (None for FFmpeg's default)
+QUALITY_PRESETS = {
+    'draft': dict(
+        zero_pad=1,
+        overlap=0,
+        shading='nearest',
+        resolution='crude',
+        fps=1,
+        encoder_preset='ultrafast',
+    ),
+    'standard': dict(
+        zero_pad=1,
+        overlap=0.5,
+        shading='gouraud',
+        resolution='1080p',
+        fps=1,
+        encoder_preset='veryfast',
+    ),
+    'publication': dict(
+        zero_pad=2,
+        overlap=0.5,
+        shading='gouraud',
+        resolution='4K',
+        fps=1,
+        encoder_preset=None,
+    ),
+}
+
 
 def sonify_input(
     path_data,
@@ -77,20 +119,27 @@ def sonify_input(
     freqmin=None,
     freqmax=None,
     speed_up_factor=200,
-    fps=1,
-    resolution='4K',
+    fps=None,
+    resolution=None,
     output_dir=None,
     spec_win_dur=5,
     db_lim='smart',
     log=False,
     utc_offset=None,
+    audio_only=False,
+    multichannel_wav=True,
+    renderer='matplotlib',
+    precision='float64',
+    quality='publication',
+    qc_report=None,
 ):
     r"""
     Produce an animated spectrogram with a soundtrack derived from sped-up
     seismic or infrasound data.
 
     Args:
-        path_data: path to data files
+        path_data (str or list): path to data files, or list of paths (e.g. the
+            X, Y and Z components of a sensor) to stack in a single video
         format_in: format of data files
         starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time of
             animation (UTC)
@@ -104,11 +153,12 @@ def sonify_input(
             smaller)
         speed_up_factor (int): Factor by which to speed up the waveform data
             (higher values = higher pitches)
-        fps (int): Frames per second of output video
+        fps (int): Frames per second of output video (defaults to that of
+            `quality`)
         resolution (str): Resolution of output video; one of `'crude'` (640
             :math:`\times` 360), `'720p'` (1280 :math:`\times` 720), `'1080p'`
             (1920 :math:`\times` 1080), `'2K'` (2560 :math:`\times` 1440), or
-            `'4K'` (3840 :math:`\times` 2160)
+            `'4K'` (3840 :math:`\times` 2160) (defaults to that of `quality`)
         output_dir (str or :class:`~pathlib.Path`): Directory where output video
             should be saved (defaults to :meth:`~pathlib.Path.cwd`)
         spec_win_dur (int or float): Duration of spectrogram window [s]
@@ -117,6 +167,30 @@ def sonify_input(
         log (bool): If `True`, use log scaling for :math:`y`-axis of spectrogram
         utc_offset (int or float): If not `None`, convert UTC time to local time
             using this offset [hours] before plotting
+        audio_only (bool): If `True`, only write the sonified audio file and
+            skip the spectrogram figure, frame rendering and FFmpeg
+        multichannel_wav (bool): If several paths are given, also save the
+            multichannel soundtrack (one channel per path) in `output_dir`
+        renderer (str): `'matplotlib'` to draw every frame with Matplotlib, or
+            `'ffmpeg'` to draw the figure once and animate the cursor, waveform
+            highlighting and time box in an FFmpeg filtergraph (much faster)
+        precision (str): Floating point type of the data from reading through
+            filtering, spectrogram and plotting, `'float64'` or `'float32'`
+            (half the memory and faster filtering and FFTs, with errors far
+            below the resolution of the audio and figure). Only the audio
+            resampling works in `float64` regardless
+        quality (str): One of :data:`QUALITY_PRESETS`: `'draft'` for a quick
+            preview (no spectrogram zero-padding or overlap, flat shading,
+            640 :math:`\times` 360 and fast encoding), `'standard'`, or
+            `'publication'` (twice zero-padded spectrogram with 50 % overlap,
+            Gouraud shading and 4K)
+        qc_report (str): SQLite report written by :func:`~qc.scan` for the
+            data files; samples it flags as NaN, infinite or clipped are set
+            to zero before filtering, without checking the data again
+
+    Returns:
+        :class:`~pathlib.Path` of the output video file (or of the audio file
+        if `audio_only` is `True`)
 
     .. _Nyquist frequency: https://en.wikipedia.org/wiki/Nyquist_frequency
     """
@@ -125,39 +199,359 @@ def sonify_input(
     key_value_pairs = [f'{k}={repr(v)}' for k, v in locals().items()]
     call_str = 'sonify({})'.format(', '.join(key_value_pairs))
 
+    # The steps are the stages of a pipeline; see pipeline.py
+    from pipeline import Pipeline
+
+    with Pipeline(
+        path_data,
+        format_in,
+        starttime,
+        endtime,
+        output_dir=output_dir,
+        call_str=call_str,
+        freqmin=freqmin,
+        freqmax=freqmax,
+        speed_up_factor=speed_up_factor,
+        fps=fps,
+        resolution=resolution,
+        spec_win_dur=spec_win_dur,
+        db_lim=db_lim,
+        log=log,
+        utc_offset=utc_offset,
+        multichannel_wav=multichannel_wav or audio_only,
+        renderer=renderer,
+        precision=precision,
+        quality=quality,
+        qc_report=qc_report,
+    ) as pipeline:
+        # Skip figure, frames and FFmpeg altogether if only the audio is wanted
+        if audio_only:
+            return pipeline.run('audio')['audio'].audio_file
+        return pipeline.run()['mux'].output_file
+
+
+def sonify_audio_batch(
+    path_data,
+    format_in,
+    intervals,
+    speed_up_factors=(200,),
+    freqmin=None,
+    freqmax=None,
+    output_dir=None,
+    utc_offset=None,
+):
+    """
+    Write sonified audio files for many time intervals and speed-up factors
+    from a single load of the data. No figure, frames or video are produced.
+
+    The data files are read and merged once for the whole span covered by
+    `intervals`. For every speed-up factor, the 50 Hz bandstop, the bandpass
+    and the audio anti-alias lowpass are then applied in a single pass and
+    every interval is cut from that filtered trace.
+
+    Args:
+        path_data: path to data files
+        format_in: format of data files
+        intervals (list): List of (`starttime`, `endtime`) tuples of
+            :class:`~obspy.core.utcdatetime.UTCDateTime` (UTC)
+        speed_up_factors (list): Speed-up factors to generate for every interval
+        freqmin (int or float): See docstring for :func:`sonify_input`
+        freqmax (int or float): See docstring for :func:`sonify_input`
+        output_dir (str or :class:`~pathlib.Path`): Directory where audio files
+            should be saved (defaults to :meth:`~pathlib.Path.cwd`)
+        utc_offset (int or float): See docstring for :func:`sonify_input`
+
+    Returns:
+        List of :class:`~pathlib.Path` of the written audio files, ordered by
+        speed-up factor and then by interval
+    """
+
     # Use current working directory if none provided
     if not output_dir:
         output_dir = Path().cwd()
     else:
         os.makedirs(output_dir, exist_ok=True)
     output_dir = Path(str(output_dir)).expanduser().resolve()
-    if not output_dir.is_dir():
-        raise FileNotFoundError(f'Directory {output_dir} does not exist!')
 
+    intervals = sorted(intervals)
+    tr = _load_trace(
+        path_data,
+        format_in,
+        min(start for start, _ in intervals),
+        max(end for _, end in intervals),
+    )
+
+    # Apply UTC offset if provided
+    if utc_offset is not None:
+        utc_offset_sec = utc_offset * mdates.SEC_PER_HOUR
+        intervals = [
+            (start + utc_offset_sec, end + utc_offset_sec) for start, end in intervals
+        ]
+        tr.stats.starttime += utc_offset_sec
+
+    audio_files = []
+    filtered = {}  # Filtered traces, keyed by filter stages
+    for speed_up_factor in speed_up_factors:
+        corners = _bandpass_corners(tr, freqmin, freqmax, speed_up_factor)
+        stages = (
+            PREFILTER_STAGES
+            + [('bandpass', corners, 4)]
+            + _antialias_stages(tr, speed_up_factor)
+        )
+        key = tuple(stages)
+        if key not in filtered:
+            print(f'Applying {corners[0]:g}–{corners[1]:g} Hz bandpass')
+            filtered[key] = filter_traces([tr.copy()], stages)[0]
+        tr_filt = filtered[key]
+
+        for starttime, endtime in intervals:
+            tr_trim = tr_filt.slice(starttime, endtime)
+            if not tr_trim.stats.npts:
+                warnings.warn(f'No data between {starttime} and {endtime}. Skipping!')
+                continue
+            audio_file = output_dir / f'{_output_stem(tr_trim, speed_up_factor)}.wav'
+            _make_audio(tr_trim, speed_up_factor, audio_file, antialias=False)
+            audio_files.append(audio_file)
+
+    return audio_files
+
+
+def sonify_variants(
+    path_data,
+    format_in,
+    starttime,
+    endtime,
+    variants,
+    output_dir=None,
+    spec_win_dur=5,
+    db_lim='smart',
+    log=False,
+    utc_offset=None,
+    max_workers=None,
+    renderer='matplotlib',
+    precision='float64',
+    quality='publication',
+):
+    r"""
+    Produce several versions of the same animated spectrogram (e.g. different
+    speed-up factors and resolutions) from a single preprocessing pass.
+
+    The data files are read, merged and 50 Hz filtered once. The bandpass and
+    the spectrogram are computed once per distinct pair of bandpass corners,
+    the audio once per distinct (corners, speed-up factor) and only the frames
+    are rendered per variant, in up to `max_workers` parallel processes. Each
+    process is sent only the data it draws: the traces and spectrogram columns
+    within one spectrogram window of the animation time span.
+
+    Args:
+        path_data (str or list): See docstring for :func:`sonify_input`
+        format_in: format of data files
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time of
+            animation (UTC)
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time of
+            animation (UTC)
+        variants (list): One dict per output video with any of the keys
+            `'speed_up_factor'`, `'fps'`, `'resolution'`, `'freqmin'` and
+            `'freqmax'`, which default as in :func:`sonify_input` (`'fps'` and
+            `'resolution'` to those of `quality`)
+        output_dir (str or :class:`~pathlib.Path`): Directory where output files
+            should be saved (defaults to :meth:`~pathlib.Path.cwd`)
+        spec_win_dur (int or float): See docstring for :func:`sonify_input`
+        db_lim (tuple or str): See docstring for :func:`sonify_input`
+        log (bool): See docstring for :func:`sonify_input`
+        utc_offset (int or float): See docstring for :func:`sonify_input`
+        max_workers (int): Maximum number of videos rendered at the same time
+            (defaults to the number of variants or of CPUs, whichever is
+            smaller)
+        renderer (str): See docstring for :func:`sonify_input`
+        precision (str): See docstring for :func:`sonify_input`
+        quality (str): See docstring for :func:`sonify_input`; applies to all
+            variants
+
+    Returns:
+        List of :class:`~pathlib.Path` of the output video files, in the order
+        of `variants`. Each is named like the output of :func:`sonify_input`
+        with the resolution and frame rate appended
     """
-    # See https://service.iris.edu/irisws/fedcatalog/1/datacenters?format=html
-    client = RoutingClient('iris-federator')
 
-    print('Retrieving data...')
-    st = client.get_waveforms(
-        network=network,
-        station=station,
-        location=location,
-        channel=channel,
-        starttime=starttime - PAD,
-        endtime=endtime + PAD,
-    )
-    if not st:
-        raise_on_error(204, None)  # If Stream is empty, then raise FDSNNoDataException
-    print('Done')
+    # Capture args and format as string to store in movie metadata
+    key_value_pairs = [f'{k}={repr(v)}' for k, v in locals().items()]
+    call_str = 'sonify_variants({})'.format(', '.join(key_value_pairs))
+
+    if precision not in PRECISIONS:
+        raise ValueError(f'Precision must be one of {list(PRECISIONS)}')
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f'Quality must be one of {list(QUALITY_PRESETS)}')
+    preset = QUALITY_PRESETS[quality]
+
+    # Use current working directory if none provided
+    if not output_dir:
+        output_dir = Path().cwd()
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+    output_dir = Path(str(output_dir)).expanduser().resolve()
+
+    if isinstance(path_data, (str, Path)):
+        path_data = [path_data]
+    traces = [
+        _load_trace(path, format_in, starttime, endtime, dtype=PRECISIONS[precision])
+        for path in path_data
+    ]
+    filter_traces(traces, PREFILTER_STAGES)
+
+    # Apply UTC offset if provided
+    if utc_offset is not None:
+        utc_offset_sec = utc_offset * mdates.SEC_PER_HOUR
+        starttime += utc_offset_sec
+        endtime += utc_offset_sec
+        for tr_i in traces:
+            tr_i.stats.starttime += utc_offset_sec
+
+    is_infrasound = True
+    rescale = 1  # No conversion
+    ref_val = 1
+
+    variants = [
+        dict(
+            speed_up_factor=variant.get('speed_up_factor', 200),
+            fps=variant.get('fps') or preset['fps'],
+            resolution=variant.get('resolution') or preset['resolution'],
+            freqmin=variant.get('freqmin'),
+            freqmax=variant.get('freqmax'),
+        )
+        for variant in variants
+    ]
+
+    temp_dir = tempfile.TemporaryDirectory()
+
+    # Shared intermediates: bandpassed traces and their spectrograms are keyed
+    # by corners, audio files by (corners, speed-up factor)
+    filtered, audio_files, jobs = {}, {}, []
+    for variant in variants:
+        suf = variant['speed_up_factor']
+        corners = _bandpass_corners(
+            traces[0], variant['freqmin'], variant['freqmax'], suf
+        )
+        if corners not in filtered:
+            print(f'Applying {corners[0]:g}–{corners[1]:g} Hz bandpass')
+            band_traces = filter_traces(
+                [tr_i.copy() for tr_i in traces], [('bandpass', corners, 4)]
+            )
+            trims = [tr_i.copy().trim(starttime, endtime) for tr_i in band_traces]
+            specs = compute_spectrograms(
+                band_traces,
+                spec_win_dur,
+                ref_val,
+                zero_pad=preset['zero_pad'],
+                overlap=preset['overlap'],
+            )
+            # The workers only draw the animation time span, so send them
+            # that (and a spectrogram window on either side for the edges)
+            # rather than pickling all of the data for every variant
+            lo, hi = starttime - spec_win_dur, endtime + spec_win_dur
+            filtered[corners] = (
+                band_traces,
+                [tr_i.slice(lo, hi) for tr_i in band_traces],
+                trims,
+                [_slice_spectrogram(spec, lo, hi) for spec in specs],
+            )
+        band_traces, sliced_traces, trims, specs = filtered[corners]
+
+        stem = _output_stem(band_traces, suf)
+        if (corners, suf) not in audio_files:
+            audio_file = output_dir / f'{stem}.wav'
+            if len(trims) == 1:
+                _make_audio(trims[0], suf, audio_file)
+            else:
+                _make_multichannel_audio(trims, suf, audio_file)
+            audio_files[(corners, suf)] = audio_file
+
+        name = f'{stem}_{variant["resolution"]}_{variant["fps"]}fps'
+        jobs.append(
+            dict(
+                traces=sliced_traces,
+                tr_trim=trims[0],
+                starttime=starttime,
+                endtime=endtime,
+                is_infrasound=is_infrasound,
+                rescale=rescale,
+                spec_win_dur=spec_win_dur,
+                db_lim=db_lim,
+                freq_lim=corners,
+                log=log,
+                is_local_time=utc_offset is not None,
+                resolution=variant['resolution'],
+                fps=variant['fps'],
+                speed_up_factor=suf,
+                video_file=Path(temp_dir.name) / f'{name}.mp4',
+                specs=specs,
+                audio_file=audio_files[(corners, suf)],
+                output_file=output_dir / f'{name}.mp4',
+                call_str=call_str,
+                renderer=renderer,
+                quality=quality,
+            )
+        )
+
+    if not max_workers:
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+    print(f'Rendering {len(jobs)} videos using {max_workers} workers ...')
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        output_files = list(executor.map(_render_variant, jobs))
+
+    # Clean up temporary directory, just to be safe
+    temp_dir.cleanup()
+
+    return output_files
+
+
+def _render_variant(job):
+    """
+    Render and mux one output video of :func:`sonify_variants`. Runs in a
+    worker process.
+
+    Args:
+        job (dict): Keyword arguments of :func:`_render_video` plus the
+            `audio_file`, `output_file` and `call_str` arguments of
+            :func:`_ffmpeg_combine` and the `renderer` to use
+
+    Returns:
+        :class:`~pathlib.Path` of the output video file
+    """
+
+    audio_file = job.pop('audio_file')
+    output_file = job.pop('output_file')
+    call_str = job.pop('call_str')
+    RENDERERS[job.pop('renderer')](**job)
+    _ffmpeg_combine(audio_file, job['video_file'], output_file, call_str)
+    return output_file
+
+
+def _load_trace(path_data, format_in, starttime, endtime, dtype=None):
+    """
+    Read all data files of a folder, then sort and merge them into a single
+    Trace. No filtering is applied; see :data:`PREFILTER_STAGES`.
+
+    Args:
+        path_data: path to data files
+        format_in: format of data files
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        dtype: Data type to convert each file's data to before merging, or
+            `None` to keep that of the files
 
-    # Merge Traces with the same IDs
-    st.merge(fill_value='interpolate')
+    Returns:
+        :class:`~obspy.core.trace.Trace` with the merged data
     """
 
     # Read data files
     print(f'Reading data files ...')
     st = read_data_from_folder(path_data, format_in, starttime, endtime)
+    if not st:
+        raise ValueError(f'No data in {path_data} between {starttime} and {endtime}')
+    if dtype is not None:
+        for tr in st:
+            tr.data = tr.data.astype(dtype, copy=False)
 
     # Sort data
     print(f'Sorting data ...')
@@ -175,62 +569,22 @@ def sonify_input(
             print(tr.id)
     tr = st[0]
 
-    # Filtering 50 Hz
-    filter_50Hz = True
-    if filter_50Hz:
-        sr = 250
-        tr.data = obspy.signal.filter.bandstop(tr.data, 49.8, 50.2, sr, corners=8, zerophase=True)
-
-    """
-    # Now that we have just one Trace, get inventory (which has response info)
-    inv = client.get_stations(
-        network=tr.stats.network,
-        station=tr.stats.station,
-        location=tr.stats.location,
-        channel=tr.stats.channel,
-        starttime=tr.stats.starttime,
-        endtime=tr.stats.endtime,
-        level='response',
-    )
+    return tr
 
-    # Adjust starttime so we have nice numbers in time box (carefully!)
-    offset = np.abs(tr.stats.starttime - (starttime - PAD))  # [s]
-    if offset > tr.stats.delta:
-        warnings.warn(
-            f'Difference between requested and actual starttime is {offset} s, '
-            f'which is larger than the data sample interval ({tr.stats.delta} s). '
-            'Not adjusting starttime of downloaded data; beware of inaccurate timing!'
-        )
-    else:
-        tr.stats.starttime = starttime - PAD
+
+def _bandpass_corners(tr, freqmin, freqmax, speed_up_factor):
     """
+    Fill in the default bandpass corners for a given speed-up factor.
 
-    # Apply UTC offset if provided
-    if utc_offset is not None:
-        signed_offset = f'{utc_offset:{"+" if utc_offset else ""}g}'
-        print(f'Converting to local time using UTC offset of {signed_offset} hours')
-        utc_offset_sec = utc_offset * mdates.SEC_PER_HOUR
-        starttime += utc_offset_sec
-        endtime += utc_offset_sec
-        tr.stats.starttime += utc_offset_sec
+    Args:
+        tr (:class:`~obspy.core.trace.Trace`): Input data
+        freqmin (int or float): See docstring for :func:`sonify_input`
+        freqmax (int or float): See docstring for :func:`sonify_input`
+        speed_up_factor (int): See docstring for :func:`sonify_input`
 
+    Returns:
+        Tuple of (`freqmin`, `freqmax`)
     """
-    # All infrasound sensors have a "?DF" channel pattern
-    if tr.stats.channel[1:3] == 'DF':
-        is_infrasound = True
-        rescale = 1  # No conversion
-    # All high-gain seismometers have a "?H?" channel pattern
-    elif tr.stats.channel[1] == 'H':
-        is_infrasound = False
-        rescale = 1e6  # Convert m to µm
-    # We can't figure out what type of sensor this is...
-    else:
-        raise ValueError(
-            f'Channel {tr.stats.channel} is not an infrasound or seismic channel!'
-        )
-    """
-    is_infrasound = True
-    rescale = 1  # No conversion
 
     if not freqmax:
         freqmax = np.min(
@@ -239,62 +593,205 @@ def sonify_input(
     if not freqmin:
         freqmin = LOWEST_AUDIBLE_FREQUENCY / speed_up_factor
 
+    return freqmin, freqmax
+
+
+def _output_stem(tr, speed_up_factor):
+    """
+    Build the file name (without suffix) shared by the audio and video outputs.
+
+    Args:
+        tr (:class:`~obspy.core.trace.Trace` or list): Trace (or list of Traces)
+            whose ID and start time name the file. IDs of several Traces are
+            joined after their common leading codes, e.g. `CS_G0_00_X-Y-Z`
+        speed_up_factor (int): See docstring for :func:`sonify_input`
+
+    Returns:
+        str
+    """
+
+    traces = [tr] if isinstance(tr, Trace) else list(tr)
+    codes = [trace.id.split('.') for trace in traces]
+    num_common = 0
+    while num_common < len(codes[0]) and all(
+        len(c) > num_common and c[num_common] == codes[0][num_common] for c in codes
+    ):
+        num_common += 1
+    num_common = min(num_common, len(codes[0]) - 1)  # Always keep the channel
+    tr_id_str = '_'.join([code for code in codes[0][:num_common] if code])
+    tr_id_str += '_' + '-'.join(
+        '_'.join([code for code in c[num_common:] if code]) for c in codes
+    )
+    tr_id_str = tr_id_str.lstrip('_')
+    starttime = traces[0].stats.starttime
+    return f'{tr_id_str}_{starttime.strftime("%d-%b-%Y at %H.%M.%S")}_{speed_up_factor}x'
+
+
+def _make_audio(tr_trim, speed_up_factor, audio_file, antialias=True):
+    """
+    Anti-alias, resample and save a trimmed trace as a sped-up audio file.
+
+    The audio is resampled and written a block at a time (see
+    :func:`~audio.write_audio`), so it never has to fit in memory. The file is
+    the same as that of `Trace.write(format='WAV', width=4, rescale=True)` on
+    the output of :func:`_resample_audio`.
+
+    Args:
+        tr_trim (:class:`~obspy.core.trace.Trace`): Bandpassed data trimmed to
+            the animation time span (not modified)
+        speed_up_factor (int): See docstring for :func:`sonify_input`
+        audio_file (:class:`~pathlib.Path`): Output WAV (or FLAC) file (full
+            path)
+        antialias (bool): See docstring for :func:`_resample_audio`
     """
-    tr.remove_response(inventory=inv)  # Units are m/s OR Pa after response removal
-    tr.detrend('demean')
-    tr.taper(max_percentage=None, max_length=PAD / 2)  # Taper away some of PAD
-    """
-    # Correct sensor response
-    correc_f = False
-    # Sensor correction parameters: coefficients of the numerator and denominator of the transfer function
-    b = [1.0000, -1.5365, 0.6507]  # Numerator
-    a = [-1.0000, 1.9388, -0.9388]  # Denominator
-    if correc_f:
-        z, p, k = scipy.signal.tf2zpk(b, a)
-        paz = {
-            'poles': p,
-            'zeros': z,
-            'gain': k,
-            'sensitivity': 1}
-        tr.simulate(paz_remove=paz)
-    detrend_f = False
-    if detrend_f:
-        tr.detrend('demean')
-
-    print(f'Applying {freqmin:g}–{freqmax:g} Hz bandpass')
-    tr.filter('bandpass', freqmin=freqmin, freqmax=freqmax, zerophase=True)
-
-    # Make trimmed version
-    tr_trim = tr.copy()
-    tr_trim.trim(starttime, endtime)
-
-    # Create temporary directory for audio and video files
-    temp_dir = tempfile.TemporaryDirectory()
 
-    # MAKE AUDIO FILE
     print('Preparing audio file ...')
+    data = _antialiased_data(tr_trim, speed_up_factor, antialias)
+    print('Saving audio file...')
+    write_audio(
+        [data],
+        tr_trim.stats.sampling_rate,
+        AUDIO_SAMPLE_RATE / speed_up_factor,
+        audio_file,
+        AUDIO_SAMPLE_RATE,
+    )
+    print('Done audio file')
+
+
+def _make_multichannel_audio(trims, speed_up_factor, audio_file):
+    """
+    Save several trimmed traces as the channels of a single sped-up audio file.
+
+    All channels are rescaled by the same factor so that their relative
+    amplitudes are kept. As in :func:`_make_audio`, the audio is written a
+    block at a time.
+
+    Args:
+        trims (list): Bandpassed :class:`~obspy.core.trace.Trace` objects
+            trimmed to the animation time span (not modified)
+        speed_up_factor (int): See docstring for :func:`sonify_input`
+        audio_file (:class:`~pathlib.Path`): Output WAV (or FLAC) file (full
+            path)
+    """
+
+    print('Preparing multichannel audio file ...')
+    channels = [_antialiased_data(tr_trim, speed_up_factor, True) for tr_trim in trims]
+    print('Saving audio file...')
+    write_audio(
+        channels,
+        trims[0].stats.sampling_rate,
+        AUDIO_SAMPLE_RATE / speed_up_factor,
+        audio_file,
+        AUDIO_SAMPLE_RATE,
+    )
+    print('Done audio file')
+
+
+def _antialiased_data(tr_trim, speed_up_factor, antialias):
+    """
+    Data of a trimmed trace ready for resampling to the sped-up audio rate:
+    anti-aliased (a filtered copy) if `antialias`, else the data itself.
+    """
+
+    stages = _antialias_stages(tr_trim, speed_up_factor) if antialias else []
+    if not stages:
+        return tr_trim.data
+    return filter_data(tr_trim.data, tr_trim.stats.sampling_rate, stages)
+
+
+def _resample_audio(tr_trim, speed_up_factor, antialias=True):
+    """
+    Anti-alias and resample a trimmed trace to the sped-up audio rate.
+
+    Args:
+        tr_trim (:class:`~obspy.core.trace.Trace`): Bandpassed data trimmed to
+            the animation time span (not modified)
+        speed_up_factor (int): See docstring for :func:`sonify_input`
+        antialias (bool): If `False`, `tr_trim` was already filtered with
+            :func:`_antialias_stages` and only the resampling is done
+
+    Returns:
+        Resampled copy of `tr_trim`
+    """
 
     tr_audio = tr_trim.copy()
     target_fs = AUDIO_SAMPLE_RATE / speed_up_factor
-    corner_freq = 0.4 * target_fs  # [Hz] Note that Nyquist is 0.5 * target_fs
-    if corner_freq < tr_audio.stats.sampling_rate / 2:  # To avoid ValueError
-        tr_audio.filter('lowpass', freq=corner_freq, corners=10, zerophase=True)
+    if antialias:
+        filter_traces([tr_audio], _antialias_stages(tr_audio, speed_up_factor))
     tr_audio.interpolate(sampling_rate=target_fs, method='lanczos', a=20)
     #tr_audio.taper(0.01)  # For smooth start and end
-    #audio_file = Path(temp_dir.name) / '47.wav'
-    tr_id_str = '_'.join([code for code in tr.id.split('.') if code])
-    audio_file = output_dir / f'{tr_id_str}_{tr.stats.starttime.strftime("%d-%b-%Y at %H.%M.%S")}_{speed_up_factor}x.wav'
-    print('Saving audio file...')
-    tr_audio.write(
-        str(audio_file),
-        format='WAV',
-        width=4,
-        rescale=True,
-        framerate=AUDIO_SAMPLE_RATE,
-    )
-    print('Done audio file')
+    return tr_audio
+
+
+def _antialias_stages(tr, speed_up_factor):
+    """
+    Filter stages of the anti-alias lowpass applied before resampling a trace
+    to the sped-up audio rate.
+
+    Args:
+        tr (:class:`~obspy.core.trace.Trace`): Trace to be resampled
+        speed_up_factor (int): See docstring for :func:`sonify_input`
+
+    Returns:
+        List with the lowpass stage, or empty list if none is needed
+    """
+
+    target_fs = AUDIO_SAMPLE_RATE / speed_up_factor
+    corner_freq = 0.4 * target_fs  # [Hz] Note that Nyquist is 0.5 * target_fs
+    if corner_freq < tr.stats.sampling_rate / 2:  # To avoid ValueError
+        return [('lowpass', corner_freq, 10)]
+    return []
+
+
+def _render_video(
+    traces,
+    tr_trim,
+    starttime,
+    endtime,
+    is_infrasound,
+    rescale,
+    spec_win_dur,
+    db_lim,
+    freq_lim,
+    log,
+    is_local_time,
+    resolution,
+    fps,
+    speed_up_factor,
+    video_file,
+    specs=None,
+    figure=None,
+    quality='publication',
+):
+    """
+    Render the animated spectrogram (without sound) to a video file.
+
+    Args:
+        traces (list): Bandpassed :class:`~obspy.core.trace.Trace` objects, one
+            per stacked channel
+        tr_trim (:class:`~obspy.core.trace.Trace`): First trace trimmed to the
+            animation time span, used for the frame timing
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        is_infrasound (bool): `True` if infrasound, `False` if seismic
+        rescale (int or float): Scale waveforms by this factor for plotting
+        spec_win_dur (int or float): See docstring for :func:`sonify_input`
+        db_lim (tuple or str): See docstring for :func:`sonify_input`
+        freq_lim (tuple): Tuple defining frequency limits for spectrogram plot
+        log (bool): See docstring for :func:`sonify_input`
+        is_local_time (bool): Passed to :class:`_UTCDateFormatter`
+        resolution (str): See docstring for :func:`sonify_input`
+        fps (int): See docstring for :func:`sonify_input`
+        speed_up_factor (int): See docstring for :func:`sonify_input`
+        video_file (:class:`~pathlib.Path`): Output video file (full path)
+        specs (list): Precomputed output of :func:`_compute_spectrogram` for
+            each trace, or `None` to compute them here
+        figure (tuple): Output of :func:`_spectrogram_stack` for these
+            arguments to animate (it is modified), or `None` to make it here
+        quality (str): See docstring for :func:`sonify_input`; sets the
+            spectrogram and the encoder preset
+    """
 
-    # MAKE VIDEO FILE
     print('Preparing video file ...')
 
     # We don't need an anti-aliasing filter here since we never use the values,
@@ -302,14 +799,7 @@ def sonify_input(
     timing_tr = tr_trim.copy().interpolate(sampling_rate=fps / speed_up_factor)
     times = timing_tr.times('UTCDateTime')[:-1]  # Remove extra frame
 
-    # Define update function
-    def _march_forward(frame, spec_line, wf_line, time_box, wf_progress):
-        spec_line.set_xdata(times[frame].matplotlib_date)
-        wf_line.set_xdata(times[frame].matplotlib_date)
-        time_box.txt.set_text(times[frame].strftime('%H:%M:%S'))
-        tr_progress = tr.copy().trim(endtime=times[frame])
-        wf_progress.set_xdata(tr_progress.times('matplotlib'))
-        wf_progress.set_ydata(tr_progress.data * rescale)
+    _march_forward = _frame_updater(traces, times, rescale)
 
     # Store user's rc settings, then update font stuff
     original_params = matplotlib.rcParams.copy()
@@ -317,57 +807,381 @@ def sonify_input(
     matplotlib.rcParams['font.sans-serif'] = 'Tex Gyre Heros'
     matplotlib.rcParams['mathtext.fontset'] = 'custom'
 
-    fig, *fargs = _spectrogram(
-        tr,
-        starttime,
-        endtime,
-        is_infrasound,
-        rescale,
-        spec_win_dur,
-        db_lim,
-        (freqmin, freqmax),
-        log,
-        utc_offset is not None,
-        resolution,
-    )
-
-    # Create animation
-    interval = ((1 / timing_tr.stats.sampling_rate) * MS_PER_S) / speed_up_factor
-    frames_tqdm = tqdm(
-        np.arange(times.size),
-        initial=1,  # Frames start at 1
-        bar_format='{percentage:3.0f}% |{bar}| {n_fmt}/{total_fmt} frames ',
-    )
-    animation = FuncAnimation(
-        fig,
-        func=_march_forward,
-        frames=frames_tqdm,
-        fargs=fargs,
-        interval=interval,
-    )
+    if figure is None:
+        figure = _spectrogram_stack(
+            traces,
+            starttime,
+            endtime,
+            is_infrasound,
+            rescale,
+            spec_win_dur,
+            db_lim,
+            freq_lim,
+            log,
+            is_local_time,
+            resolution,
+            specs=specs,
+            quality=quality,
+        )
+    fig, *fargs = figure
+    dpi = RESOLUTIONS[resolution][0] / FIGURE_WIDTH  # Can be a float...
+    encoder_preset = QUALITY_PRESETS[quality]['encoder_preset']
+
+    # Frames whose pixels don't change (the cursor in the same pixel column
+    # and the same time box text) are rendered once and held
+    keep = _changed_frames(fig, fargs[0][0].axes, times, dpi)
+    if keep.size < times.size:
+        print(f'Rendering {keep.size} of {times.size} frames (the rest are unchanged)')
+        _save_frames_vfr(
+            fig,
+            _march_forward,
+            fargs,
+            keep,
+            times.size,
+            fps,
+            dpi,
+            video_file,
+            encoder_preset,
+        )
+        print('Done video file')
+    else:
+        # Create animation
+        interval = ((1 / timing_tr.stats.sampling_rate) * MS_PER_S) / speed_up_factor
+        frames_tqdm = tqdm(
+            np.arange(times.size),
+            initial=1,  # Frames start at 1
+            bar_format='{percentage:3.0f}% |{bar}| {n_fmt}/{total_fmt} frames ',
+        )
+        animation = FuncAnimation(
+            fig,
+            func=_march_forward,
+            frames=frames_tqdm,
+            fargs=fargs,
+            interval=interval,
+        )
 
-    video_file = Path(temp_dir.name) / '47.mp4'
-    tqdm.write('Saving animation. This may take a while...')
-    animation.save(
-        video_file,
-        dpi=RESOLUTIONS[resolution][0] / FIGURE_WIDTH,  # Can be a float...
-    )
-    frames_tqdm.close()
-    print('Done video file')
+        tqdm.write('Saving animation. This may take a while...')
+        animation.save(
+            video_file,
+            dpi=dpi,
+            extra_args=['-preset', encoder_preset] if encoder_preset else None,
+        )
+        frames_tqdm.close()
+        print('Done video file')
 
     # Restore user's rc settings, ignoring Matplotlib deprecation warnings
     with warnings.catch_warnings():
         warnings.simplefilter('ignore')
         matplotlib.rcParams.update(original_params)
 
-    # MAKE COMBINED FILE
 
-    tr_id_str = '_'.join([code for code in tr.id.split('.') if code])
-    output_file = output_dir / f'{tr_id_str}_{tr.stats.starttime.strftime("%d-%b-%Y at %H.%M.%S")}_{speed_up_factor}x.mp4'
-    _ffmpeg_combine(audio_file, video_file, output_file, call_str)
+def _frame_updater(traces, times, rescale):
+    """
+    Make the update function of the animation of :func:`_render_video`.
 
-    # Clean up temporary directory, just to be safe
-    temp_dir.cleanup()
+    Args:
+        traces (list): Bandpassed :class:`~obspy.core.trace.Trace` objects, one
+            per stacked channel
+        times (:class:`~numpy.ndarray`): Frame times
+            (:class:`~obspy.core.utcdatetime.UTCDateTime`)
+        rescale (int or float): Scale waveforms by this factor for plotting
+
+    Returns:
+        Function called as `func(frame, spec_lines, wf_lines, time_box,
+        wf_progresses)` with the frame index and the artists returned by
+        :func:`_spectrogram_stack`
+    """
+
+    # Matplotlib dates of every sample, computed once rather than per frame
+    wf_times = [tr_i.times('matplotlib') for tr_i in traces]
+    wf_data = [tr_i.data * rescale for tr_i in traces]
+
+    # The timeline and time box are shared by all channels; only the lines and
+    # the waveform progress are per channel
+    def _march_forward(frame, spec_lines, wf_lines, time_box, wf_progresses):
+        frame_date = times[frame].matplotlib_date
+        for line in spec_lines + wf_lines:
+            line.set_xdata([frame_date, frame_date])
+        time_box.txt.set_text(times[frame].strftime('%H:%M:%S'))
+        for wf_progress, t_mpl, data in zip(wf_progresses, wf_times, wf_data):
+            npts = np.searchsorted(t_mpl, frame_date, side='right')
+            wf_progress.set_xdata(t_mpl[:npts])
+            wf_progress.set_ydata(data[:npts])
+
+    return _march_forward
+
+
+def _changed_frames(fig, spec_ax, times, dpi):
+    """
+    Find the animation frames whose pixels differ from those of the previous
+    frame: those where the cursor moves to another pixel column or the time
+    box text changes. The waveform progress ends at the cursor, so a frame
+    held in place of the next ones differs from them at most in the leading
+    pixel column of the waveforms.
+
+    Args:
+        fig (:class:`~matplotlib.figure.Figure`): Figure to be animated
+        spec_ax (:class:`~matplotlib.axes.Axes`): Axes of the cursor
+        times (:class:`~numpy.ndarray`): Frame times
+            (:class:`~obspy.core.utcdatetime.UTCDateTime`)
+        dpi (float): Resolution the frames are saved at
+
+    Returns:
+        :class:`~numpy.ndarray` with the indices of the changed frames (the
+        first frame included)
+    """
+
+    dates = np.array([t.matplotlib_date for t in times])
+    x = spec_ax.transData.transform(np.column_stack([dates, np.zeros(dates.size)]))[:, 0]
+    # Display coordinates scale with the dpi; Agg snaps vertical lines to the
+    # nearest pixel
+    column = np.floor(x * dpi / fig.dpi + 0.5)
+    text = np.array([t.strftime('%H:%M:%S') for t in times])
+    changed = np.r_[True, (column[1:] != column[:-1]) | (text[1:] != text[:-1])]
+    return np.flatnonzero(changed)
+
+
+def _save_frames_vfr(fig, func, fargs, frames, num_frames, fps, dpi, video_file,
+                     encoder_preset=None):
+    """
+    Render selected animation frames and encode them with a variable frame
+    rate, each frame held until the next selected one. Uses the concat
+    demuxer of `FFmpeg`_ on PNG images.
+
+    Args:
+        fig (:class:`~matplotlib.figure.Figure`): Figure to be animated
+        func: Update function, called as `func(frame, *fargs)`
+        fargs (list): Further arguments of `func`
+        frames (:class:`~numpy.ndarray`): Increasing indices of the frames to
+            render, starting at 0
+        num_frames (int): Number of frames of the whole animation
+        fps (int): Frame rate of the whole animation
+        dpi (float): Resolution of the frames
+        video_file (:class:`~pathlib.Path`): Output video file (full path)
+        encoder_preset (str): x264 encoder preset, or `None` for FFmpeg's
+            default
+
+    .. _FFmpeg: https://www.ffmpeg.org/
+    """
+
+    # Frame rate of the images, which sets the time base of the timestamps
+    option = f'option framerate {fps}'
+    durations = np.diff(np.r_[frames, num_frames]) / fps
+    with tempfile.TemporaryDirectory(dir=video_file.parent) as frame_dir:
+        lines = ['ffconcat version 1.0']
+        for i, frame in enumerate(tqdm(frames, unit='frame')):
+            func(frame, *fargs)
+            frame_file = f'{i:06d}.png'
+            fig.savefig(
+                Path(frame_dir) / frame_file, dpi=dpi, pil_kwargs=dict(compress_level=1)
+            )
+            lines += [f'file {frame_file}', option, f'duration {durations[i]:.6f}']
+        # The duration of the last entry only counts if it is followed by
+        # another one
+        lines += [f'file {frame_file}', option]
+        list_file = Path(frame_dir) / 'frames.ffconcat'
+        list_file.write_text('\n'.join(lines) + '\n')
+
+        args = ['ffmpeg', '-y', '-v', 'warning', '-f', 'concat', '-safe', '0']
+        args += ['-i', list_file, '-fps_mode', 'vfr', '-frames:v', str(frames.size)]
+        args += ['-c:v', 'h264']
+        if encoder_preset:
+            args += ['-preset', encoder_preset]
+        args += ['-pix_fmt', 'yuv420p', video_file]
+        code = subprocess.call(args)
+    if code != 0:
+        raise OSError('Issue with FFmpeg rendering. Check error messages and try again.')
+
+
+def _render_video_ffmpeg(
+    traces,
+    tr_trim,
+    starttime,
+    endtime,
+    is_infrasound,
+    rescale,
+    spec_win_dur,
+    db_lim,
+    freq_lim,
+    log,
+    is_local_time,
+    resolution,
+    fps,
+    speed_up_factor,
+    video_file,
+    specs=None,
+    figure=None,
+    quality='publication',
+):
+    """
+    Render the animated spectrogram (without sound) to a video file using a
+    single `FFmpeg`_ filtergraph. Takes the same arguments as
+    :func:`_render_video` and produces the same frames up to antialiasing of
+    the moving parts.
+
+    The figure is drawn by Matplotlib only twice: once without any of the
+    animated artists and once with the waveforms fully highlighted. FFmpeg
+    then reveals the highlighted waveforms left of the cursor with a moving
+    mask, overlays the cursor line and draws the time box text, so the cost
+    of a frame does not depend on the complexity of the figure.
+
+    The filtergraph runs in data time (one frame every `speed_up_factor` /
+    `fps` seconds) so that the time box can be drawn from the frame
+    timestamps, and is retimed to video time at the end.
+
+    .. _FFmpeg: https://www.ffmpeg.org/
+    """
+
+    print('Preparing video file ...')
+
+    # Same frame timing as _render_video()
+    timing_tr = tr_trim.copy().interpolate(sampling_rate=fps / speed_up_factor)
+    times = timing_tr.times('UTCDateTime')[:-1]  # Remove extra frame
+
+    # Store user's rc settings, then update font stuff
+    original_params = matplotlib.rcParams.copy()
+    matplotlib.rcParams.update(matplotlib.rcParamsDefault)
+    matplotlib.rcParams['font.sans-serif'] = 'Tex Gyre Heros'
+    matplotlib.rcParams['mathtext.fontset'] = 'custom'
+
+    if figure is None:
+        figure = _spectrogram_stack(
+            traces,
+            starttime,
+            endtime,
+            is_infrasound,
+            rescale,
+            spec_win_dur,
+            db_lim,
+            freq_lim,
+            log,
+            is_local_time,
+            resolution,
+            specs=specs,
+            quality=quality,
+        )
+    fig, spec_lines, wf_lines, time_box, wf_progresses = figure
+
+    # Draw at the output resolution so that display coordinates are pixels
+    canvas = FigureCanvasAgg(fig)
+    fig.set_dpi(RESOLUTIONS[resolution][0] / FIGURE_WIDTH)
+    width, height = int(round(fig.bbox.width)), int(round(fig.bbox.height))
+
+    # Static image: everything but the cursor and the time box text (the box
+    # itself stays so that FFmpeg only has to write into it)
+    time_text = time_box.txt._text
+    time_text.set_alpha(0)
+    for line in spec_lines + wf_lines:
+        line.set_visible(False)
+    canvas.draw()
+    renderer = canvas.get_renderer()
+    text_bbox = time_text.get_window_extent(renderer)
+    static_file = video_file.with_name(f'{video_file.stem}_static.png')
+    fig.savefig(static_file, dpi=fig.dpi)
+
+    # Same image with the waveforms fully highlighted
+    for wf_progress, tr in zip(wf_progresses, traces):
+        wf_progress.set_data(tr.times('matplotlib'), tr.data * rescale)
+    progress_file = video_file.with_name(f'{video_file.stem}_progress.png')
+    fig.savefig(progress_file, dpi=fig.dpi)
+
+    # Pixel extents (origin at the top left, as in the image)
+    wf_axes = [wf_progress.axes for wf_progress in wf_progresses]
+    spec_ax = spec_lines[0].axes
+    x0, x1 = spec_ax.bbox.x0, spec_ax.bbox.x1
+    wf_top = height - max(ax.bbox.y1 for ax in wf_axes)
+    wf_bottom = height - min(ax.bbox.y0 for ax in wf_axes)
+    line_top = height - spec_ax.bbox.y1
+    line_bottom = height - (wf_axes[-1].bbox.y0 + 0.01 * wf_axes[-1].bbox.height)
+    line_width = max(1, int(round(spec_lines[0].get_linewidth() * fig.dpi / 72)))
+    font_size = time_text.get_fontsize() * fig.dpi / 72
+    font_file = font_manager.findfont(time_text.get_fontproperties())
+
+    # Restore user's rc settings, ignoring Matplotlib deprecation warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        matplotlib.rcParams.update(original_params)
+
+    # Cursor position [px] = a + b * t, where t [s] is the data time since the
+    # first frame
+    duration = endtime - starttime
+    b = (x1 - x0) / duration
+    a = x0 + b * (times[0] - starttime)
+
+    # Waveform region, which is the only part where the two images differ
+    rx, ry = int(np.floor(x0)), int(np.floor(wf_top))
+    rw, rh = int(np.ceil(x1)) - rx, int(np.ceil(wf_bottom)) - ry
+    lh = int(round(line_bottom - line_top))
+
+    rate = f'{fps}/{speed_up_factor}'  # Frame rate in data time
+    clock = _ffmpeg_escape(
+        _ffmpeg_escape(
+            f'%{{pts:gmtime:{times[0].timestamp:.6f}:%H\\:%M\\:%S}}', "\\':"
+        ),
+        "\\'[],;",
+    )
+    font = _ffmpeg_escape(_ffmpeg_escape(font_file, "\\':"), "\\'[],;")
+    graph = ';'.join(
+        [
+            f'[0:v]format=gbrp,split=2[base][lo0]',
+            f'[lo0]crop={rw}:{rh}:{rx}:{ry}[lo]',
+            f'[1:v]format=gbrp,crop={rw}:{rh}:{rx}:{ry}[hi]',
+            f'color=c=black:s={rw}x{rh}:r={rate},format=gbrp[m0]',
+            f'color=c=white:s={rw}x{rh}:r={rate},format=gbrp[m1]',
+            f'[m0][m1]overlay=x={a - rx - rw:.4f}+{b:.8f}*t:y=0:eval=frame[mask]',
+            f'[lo][hi][mask]maskedmerge[wf]',
+            f'[base][wf]overlay=x={rx}:y={ry}[merged]',
+            f'color=c=forestgreen:s={line_width}x{lh}:r={rate},format=gbrp[cursor]',
+            f'[merged][cursor]overlay=x={a - line_width / 2:.4f}+{b:.8f}*t'
+            f':y={int(round(line_top))}:eval=frame,'
+            f'drawtext=fontfile={font}:text={clock}:fontsize={font_size:.2f}'
+            f':fontcolor=forestgreen:x={text_bbox.x0:.2f}'
+            f':y={height - text_bbox.y1:.2f},'
+            f'settb=AVTB,setpts=PTS/{speed_up_factor},fps={fps},format=yuv420p[out]',
+        ]
+    )
+    graph_file = video_file.with_name(f'{video_file.stem}_graph.txt')
+    graph_file.write_text(graph)
+
+    args = [
+        'ffmpeg',
+        '-y',
+        '-v',
+        'warning',
+        '-f',
+        'image2',
+        '-loop',
+        '1',
+        '-framerate',
+        rate,
+        '-i',
+        static_file,
+        '-f',
+        'image2',
+        '-loop',
+        '1',
+        '-framerate',
+        rate,
+        '-i',
+        progress_file,
+        '-filter_complex_script',
+        graph_file,
+        '-map',
+        '[out]',
+        '-frames:v',
+        str(times.size),
+        '-c:v',
+        'h264',
+    ]
+    encoder_preset = QUALITY_PRESETS[quality]['encoder_preset']
+    if encoder_preset:
+        args += ['-preset', encoder_preset]
+    args += ['-pix_fmt', 'yuv420p', video_file]
+    print(f'Rendering {times.size} frames using FFmpeg...')
+    code = subprocess.call(args)
+    if code != 0:
+        raise OSError('Issue with FFmpeg rendering. Check error messages and try again.')
+    print('Done video file')
 
 
 def _spectrogram(
@@ -406,6 +1220,65 @@ def _spectrogram(
         Tuple of (`fig`, `spec_line`, `wf_line`, `time_box`, `wf_progress`)
     """
 
+    fig, spec_lines, wf_lines, time_box, wf_progresses = _spectrogram_stack(
+        [tr],
+        starttime,
+        endtime,
+        is_infrasound,
+        rescale,
+        spec_win_dur,
+        db_lim,
+        freq_lim,
+        log,
+        is_local_time,
+        resolution,
+    )
+    return fig, spec_lines[0], wf_lines[0], time_box, wf_progresses[0]
+
+
+def _spectrogram_stack(
+    traces,
+    starttime,
+    endtime,
+    is_infrasound,
+    rescale,
+    spec_win_dur,
+    db_lim,
+    freq_lim,
+    log,
+    is_local_time,
+    resolution,
+    specs=None,
+    quality='publication',
+):
+    """
+    Make a plot with one waveform and spectrogram pair per trace, stacked from
+    top to bottom and sharing the time axis.
+
+    Args:
+        traces (list): Input :class:`~obspy.core.trace.Trace` objects; see
+            :func:`_spectrogram`
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        is_infrasound (bool): `True` if infrasound, `False` if seismic
+        rescale (int or float): Scale waveforms by this factor for plotting
+        spec_win_dur (int or float): See docstring for :func:`~sonify.sonify`
+        db_lim (tuple or str): See docstring for :func:`~sonify.sonify`
+        freq_lim (tuple): Tuple defining frequency limits for spectrogram plot
+        log (bool): See docstring for :func:`~sonify.sonify`
+        is_local_time (bool): Passed to :class:`_UTCDateFormatter`
+        resolution (str): See docstring for :func:`~sonify.sonify`
+        specs (list): Precomputed output of :func:`_compute_spectrogram` for
+            each trace, or `None` to compute them here
+        quality (str): See docstring for :func:`sonify_input`; sets the
+            spectrogram shading (and resolution if computed here)
+
+    Returns:
+        Tuple of (`fig`, `spec_lines`, `wf_lines`, `time_box`, `wf_progresses`)
+        where all but `fig` and the single, shared `time_box` are lists with
+        one entry per trace
+    """
+
     if is_infrasound:
         #ylab = 'Pressure (Pa)'
         ylab = "Amplitude"
@@ -425,60 +1298,131 @@ def _spectrogram(
             )
         ref_val = REFERENCE_VELOCITY
 
-    fs = tr.stats.sampling_rate
-    nperseg = int(spec_win_dur * fs)  # Samples
-    nfft = np.power(2, int(np.ceil(np.log2(nperseg))) + 1)  # Pad fft with zeroes
+    # Ensure a 16:9 aspect ratio
+    fig = Figure(figsize=(FIGURE_WIDTH, (9 / 16) * FIGURE_WIDTH))
 
-    f, t, sxx = signal.spectrogram(
-        tr.data, fs, window='hann', nperseg=nperseg, noverlap=nperseg // 2, nfft=nfft
+    # width_ratios effectively controls the colorbar width
+    num_traces = len(traces)
+    gs = GridSpec(
+        2 * num_traces,
+        2,
+        figure=fig,
+        height_ratios=[2, 1] * num_traces,
+        width_ratios=[40, 1],
     )
 
-    # [dB rel. (ref_val <ref_val_unit>)^2 Hz^-1]
-    sxx_db = 10 * np.log10(sxx / (ref_val**2))
+    spec_axes, wf_axes, caxes, extends = [], [], [], []
+    spec_lines, wf_lines, wf_progresses = [], [], []
+    line_kwargs = dict(x=starttime.matplotlib_date, color='forestgreen', linewidth=1)
+    for i, tr in enumerate(traces):
+        if specs:
+            f, t_mpl, sxx_db = specs[i]
+        else:
+            f, t_mpl, sxx_db = _compute_spectrogram(tr, spec_win_dur, ref_val, quality)
+
+        sharex = spec_axes[0] if spec_axes else None
+        spec_ax = fig.add_subplot(gs[2 * i, 0], sharex=sharex)
+        wf_ax = fig.add_subplot(gs[2 * i + 1, 0], sharex=spec_ax)  # Share x-axis with spec
+        cax = fig.add_subplot(gs[2 * i, 1])
+
+        wf_lw = 0.5
+        wf_ax.plot(tr.times('matplotlib'), tr.data * rescale, '#b0b0b0', linewidth=wf_lw)
+        wf_progresses.append(wf_ax.plot(np.nan, np.nan, 'black', linewidth=wf_lw)[0])
+        wf_ax.set_ylabel(ylab)
+        wf_ax.grid(linestyle=':')
+        max_value = np.abs(tr.slice(starttime, endtime).data).max() * rescale
+        wf_ax.set_ylim(-max_value, max_value)
+
+        """
+        im = spec_ax.pcolormesh(
+            t_mpl, f, sxx_db, cmap='inferno', shading='nearest', rasterized=True
+        )
+        """
 
-    t_mpl = tr.stats.starttime.matplotlib_date + (t / mdates.SEC_PER_DAY)
+        """
+        im = spec_ax.pcolormesh(
+            t_mpl, f, sxx_db, cmap='jet', shading='nearest', rasterized=True
+        )
+        """
+
+        im = spec_ax.pcolormesh(
+            t_mpl,
+            f,
+            sxx_db,
+            cmap='jet',
+            shading=QUALITY_PRESETS[quality]['shading'],
+            rasterized=True,
+        )
 
-    # Ensure a 16:9 aspect ratio
-    fig = Figure(figsize=(FIGURE_WIDTH, (9 / 16) * FIGURE_WIDTH))
+        spec_ax.set_ylabel('Frequency (Hz)')
+        #spec_ax.grid(linestyle=':')
+        if log:
+            spec_ax.set_yscale('log')
 
-    # width_ratios effectively controls the colorbar width
-    gs = GridSpec(2, 2, figure=fig, height_ratios=[2, 1], width_ratios=[40, 1])
+        # Initialize animated stuff
+        spec_lines.append(spec_ax.axvline(**line_kwargs))
+        wf_lines.append(
+            wf_ax.axvline(ymin=0.01, clip_on=False, zorder=10, **line_kwargs)
+        )
 
-    spec_ax = fig.add_subplot(gs[0, 0])
-    wf_ax = fig.add_subplot(gs[1, 0], sharex=spec_ax)  # Share x-axis with spec
-    cax = fig.add_subplot(gs[0, 1])
+        # Adjustments to ensure time marker line is zordered properly
+        # 9 is below marker; 11 is above marker
+        spec_ax.spines['bottom'].set_zorder(9)
+        wf_ax.spines['top'].set_zorder(9)
+        for side in 'bottom', 'left', 'right':
+            wf_ax.spines[side].set_zorder(11)
 
-    wf_lw = 0.5
-    wf_ax.plot(tr.times('matplotlib'), tr.data * rescale, '#b0b0b0', linewidth=wf_lw)
-    wf_progress = wf_ax.plot(np.nan, np.nan, 'black', linewidth=wf_lw)[0]
-    wf_ax.set_ylabel(ylab)
-    wf_ax.grid(linestyle=':')
-    max_value = np.abs(tr.copy().trim(starttime, endtime).data).max() * rescale
-    wf_ax.set_ylim(-max_value, max_value)
+        # Pick smart limits rounded to nearest 10
+        if db_lim == 'smart':
+            db_min = np.percentile(sxx_db, 20)
+            db_max = sxx_db.max()
+            tr_db_lim = (np.ceil(db_min / 10) * 10, np.floor(db_max / 10) * 10)
+        else:
+            tr_db_lim = db_lim
 
-    """
-    im = spec_ax.pcolormesh(
-        t_mpl, f, sxx_db, cmap='inferno', shading='nearest', rasterized=True
-    )
-    """
+        # Clip image to db_lim if provided (doesn't clip if db_lim=None)
+        im.set_clim(tr_db_lim)
 
-    """
-    im = spec_ax.pcolormesh(
-        t_mpl, f, sxx_db, cmap='jet', shading='nearest', rasterized=True
-    )
-    """
+        # Automatically determine whether to show triangle extensions on colorbar
+        # (kind of adopted from xarray)
+        if tr_db_lim:
+            min_extend = sxx_db.min() < tr_db_lim[0]
+            max_extend = sxx_db.max() > tr_db_lim[1]
+        else:
+            min_extend = False
+            max_extend = False
+        if min_extend and max_extend:
+            extend = 'both'
+        elif min_extend:
+            extend = 'min'
+        elif max_extend:
+            extend = 'max'
+        else:
+            extend = 'neither'
 
-    im = spec_ax.pcolormesh(
-        t_mpl, f, sxx_db, cmap='jet', shading='gouraud', rasterized=True
-    )
+        fig.colorbar(im, cax, extend=extend, extendfrac=EXTENDFRAC, label=clab)
 
-    spec_ax.set_ylabel('Frequency (Hz)')
-    #spec_ax.grid(linestyle=':')
-    if log:
-        spec_ax.set_yscale('log')
+        if num_traces == 1:
+            spec_ax.set_title(tr.id)
+        else:
+            # Titles, labels and edge ticks would collide with the neighbouring
+            # panels, so label inside and shorten
+            spec_ax.add_artist(
+                AnchoredText(tr.id, loc='upper left', pad=0.2, borderpad=0.3)
+            )
+            spec_ax.set_ylabel('Freq. (Hz)')
+            wf_ax.set_ylabel('Amp.')
+            spec_ax.yaxis.get_major_locator().set_params(prune='lower')
+            wf_ax.yaxis.get_major_locator().set_params(prune='upper')
+
+        spec_axes.append(spec_ax)
+        wf_axes.append(wf_ax)
+        caxes.append(cax)
+        extends.append((min_extend, max_extend))
 
     # Tick locating and formatting
     locator = mdates.AutoDateLocator()
+    wf_ax = wf_axes[-1]
     wf_ax.xaxis.set_major_locator(locator)
     wf_ax.xaxis.set_major_formatter(_UTCDateFormatter(locator, is_local_time))
     fig.autofmt_xdate()
@@ -486,10 +1430,7 @@ def _spectrogram(
     # "Crop" x-axis!
     wf_ax.set_xlim(starttime.matplotlib_date, endtime.matplotlib_date)
 
-    # Initialize animated stuff
-    line_kwargs = dict(x=starttime.matplotlib_date, color='forestgreen', linewidth=1)
-    spec_line = spec_ax.axvline(**line_kwargs)
-    wf_line = wf_ax.axvline(ymin=0.01, clip_on=False, zorder=10, **line_kwargs)
+    # The time box sits on top of the bottom waveform and is shared by all
     time_box = AnchoredText(
         s=starttime.strftime('%H:%M:%S'),
         pad=0.2,
@@ -505,82 +1446,222 @@ def _spectrogram(
     time_box.patch.set_linewidth(matplotlib.rcParams['axes.linewidth'])
     wf_ax.add_artist(time_box)
 
-    # Adjustments to ensure time marker line is zordered properly
-    # 9 is below marker; 11 is above marker
-    spec_ax.spines['bottom'].set_zorder(9)
-    wf_ax.spines['top'].set_zorder(9)
-    for side in 'bottom', 'left', 'right':
-        wf_ax.spines[side].set_zorder(11)
-
-    # Pick smart limits rounded to nearest 10
-    if db_lim == 'smart':
-        db_min = np.percentile(sxx_db, 20)
-        db_max = sxx_db.max()
-        db_lim = (np.ceil(db_min / 10) * 10, np.floor(db_max / 10) * 10)
-
-    # Clip image to db_lim if provided (doesn't clip if db_lim=None)
-    im.set_clim(db_lim)
-
-    # Automatically determine whether to show triangle extensions on colorbar
-    # (kind of adopted from xarray)
-    if db_lim:
-        min_extend = sxx_db.min() < db_lim[0]
-        max_extend = sxx_db.max() > db_lim[1]
-    else:
-        min_extend = False
-        max_extend = False
-    if min_extend and max_extend:
-        extend = 'both'
-    elif min_extend:
-        extend = 'min'
-    elif max_extend:
-        extend = 'max'
-    else:
-        extend = 'neither'
+    fig.tight_layout()
+    fig.subplots_adjust(hspace=0, wspace=0.05)
 
-    fig.colorbar(im, cax, extend=extend, extendfrac=EXTENDFRAC, label=clab)
+    for cax, (min_extend, max_extend) in zip(caxes, extends):
+        # Finnicky formatting to get extension triangles (if they exist) to extend
+        # above and below the vertical extent of the spectrogram axes
+        pos = cax.get_position()
+        triangle_height = EXTENDFRAC * pos.height
+        ymin = pos.ymin
+        height = pos.height
+        if min_extend and max_extend:
+            ymin -= triangle_height
+            height += 2 * triangle_height
+        elif min_extend and not max_extend:
+            ymin -= triangle_height
+            height += triangle_height
+        elif max_extend and not min_extend:
+            height += triangle_height
+        else:
+            pass
+        cax.set_position([pos.xmin, ymin, pos.width, height])
+
+    for wf_ax in wf_axes:
+        # Move offset text around and format it more nicely, see
+        # https://github.com/matplotlib/matplotlib/blob/710fce3df95e22701bd68bf6af2c8adbc9d67a79/lib/matplotlib/ticker.py#L677
+        magnitude = wf_ax.yaxis.get_major_formatter().orderOfMagnitude
+        if magnitude:  # I.e., if offset text is present
+            wf_ax.yaxis.get_offset_text().set_visible(False)  # Remove original text
+            sf = ScalarFormatter(useMathText=True)
+            sf.orderOfMagnitude = magnitude  # Formatter needs to know this!
+            sf.locs = [47]  # Can't be an empty list
+            wf_ax.text(
+                0.002,
+                0.95,
+                sf.get_offset(),  # Let the ScalarFormatter do the formatting work
+                transform=wf_ax.transAxes,
+                ha='left',
+                va='top',
+            )
 
-    spec_ax.set_title(tr.id)
+    return fig, spec_lines, wf_lines, time_box, wf_progresses
 
-    fig.tight_layout()
-    fig.subplots_adjust(hspace=0, wspace=0.05)
 
-    # Finnicky formatting to get extension triangles (if they exist) to extend
-    # above and below the vertical extent of the spectrogram axes
-    pos = cax.get_position()
-    triangle_height = EXTENDFRAC * pos.height
-    ymin = pos.ymin
-    height = pos.height
-    if min_extend and max_extend:
-        ymin -= triangle_height
-        height += 2 * triangle_height
-    elif min_extend and not max_extend:
-        ymin -= triangle_height
-        height += triangle_height
-    elif max_extend and not min_extend:
-        height += triangle_height
-    else:
-        pass
-    cax.set_position([pos.xmin, ymin, pos.width, height])
-
-    # Move offset text around and format it more nicely, see
-    # https://github.com/matplotlib/matplotlib/blob/710fce3df95e22701bd68bf6af2c8adbc9d67a79/lib/matplotlib/ticker.py#L677
-    magnitude = wf_ax.yaxis.get_major_formatter().orderOfMagnitude
-    if magnitude:  # I.e., if offset text is present
-        wf_ax.yaxis.get_offset_text().set_visible(False)  # Remove original text
-        sf = ScalarFormatter(useMathText=True)
-        sf.orderOfMagnitude = magnitude  # Formatter needs to know this!
-        sf.locs = [47]  # Can't be an empty list
-        wf_ax.text(
-            0.002,
-            0.95,
-            sf.get_offset(),  # Let the ScalarFormatter do the formatting work
-            transform=wf_ax.transAxes,
-            ha='left',
-            va='top',
+def _slice_spectrogram(spec, starttime, endtime):
+    """
+    Keep the columns of a spectrogram between two times.
+
+    Args:
+        spec (tuple): Output of :func:`_compute_spectrogram`
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+
+    Returns:
+        Tuple of (`f`, `t_mpl`, `sxx_db`) with the columns whose times lie
+        between `starttime` and `endtime` (views, not copies)
+    """
+
+    f, t_mpl, sxx_db = spec
+    i0, i1 = np.searchsorted(t_mpl, [starttime.matplotlib_date, endtime.matplotlib_date])
+    return f, t_mpl[i0:i1], sxx_db[:, i0:i1]
+
+
+def _compute_spectrogram(tr, spec_win_dur, ref_val, quality='publication'):
+    """
+    Compute the power spectrogram of a trace in decibels.
+
+    Args:
+        tr (:class:`~obspy.core.trace.Trace`): Input data
+        spec_win_dur (int or float): See docstring for :func:`~sonify.sonify`
+        ref_val (int or float): Reference value for the decibel conversion
+        quality (str): See docstring for :func:`sonify_input`; sets the
+            zero-padding and overlap
+
+    Returns:
+        Tuple of (`f`, `t_mpl`, `sxx_db`) with the frequencies [Hz], the
+        Matplotlib dates of the segment centers and the power [dB]
+    """
+
+    preset = QUALITY_PRESETS[quality]
+    fs = tr.stats.sampling_rate
+    nperseg = int(spec_win_dur * fs)  # Samples
+    nfft = np.power(2, int(np.ceil(np.log2(nperseg)))) * preset['zero_pad']  # Pad fft
+
+    f, t, sxx = signal.spectrogram(
+        tr.data,
+        fs,
+        window='hann',
+        nperseg=nperseg,
+        noverlap=int(nperseg * preset['overlap']),
+        nfft=nfft,
+    )
+    if sxx.dtype == np.float32:
+        # Power far below the peak can round to zero in single precision
+        sxx = np.maximum(sxx, np.finfo(sxx.dtype).tiny)
+
+    # [dB rel. (ref_val <ref_val_unit>)^2 Hz^-1]
+    sxx_db = 10 * np.log10(sxx / (ref_val**2))
+
+    t_mpl = tr.stats.starttime.matplotlib_date + (t / mdates.SEC_PER_DAY)
+
+    return f, t_mpl, sxx_db
+
+
+class _IncrementalSpectrogram:
+    """
+    Spectrogram of data that arrives in consecutive blocks, with the same
+    window, overlap and FFT length as :func:`_compute_spectrogram` for the
+    same `quality`.
+
+    Columns are computed as soon as a full window of samples is available and
+    the overlap is carried over to the next block, so the columns are the same
+    as those of the concatenated data and every sample is transformed once
+    per window it falls in.
+
+    Args:
+        fs (float): Sampling rate [Hz]
+        spec_win_dur (int or float): See docstring for :func:`~sonify.sonify`
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Time of the
+            first sample of the first block
+        ref_val (int or float): Reference value for the decibel conversion
+        quality (str): See docstring for :func:`sonify_input`; sets the
+            zero-padding and overlap
+    """
+
+    def __init__(self, fs, spec_win_dur, starttime, ref_val=1, quality='publication'):
+        preset = QUALITY_PRESETS[quality]
+        self.fs = fs
+        self.nperseg = int(spec_win_dur * fs)  # Samples
+        self.noverlap = int(self.nperseg * preset['overlap'])
+        self.nfft = np.power(2, int(np.ceil(np.log2(self.nperseg)))) * preset['zero_pad']
+        self.ref_val = ref_val
+        self.pending_start = starttime  # Of the first sample in self.pending
+        self.pending = np.empty(0)
+        self.f = np.fft.rfftfreq(self.nfft, 1 / fs)
+        self.t_mpl = np.empty(0)
+        self.sxx_db = np.empty((self.f.size, 0))
+
+    def extend(self, data):
+        """
+        Add the next block of samples.
+
+        Args:
+            data (:class:`~numpy.ndarray`): 1-D array following the previous
+                block without a gap
+        """
+
+        pending = np.concatenate([self.pending, data])
+        if pending.size < self.nperseg:
+            self.pending = pending
+            return
+        hop = self.nperseg - self.noverlap
+        num_cols = (pending.size - self.noverlap) // hop
+        _, t, sxx = signal.spectrogram(
+            pending[:(num_cols - 1) * hop + self.nperseg],
+            self.fs,
+            window='hann',
+            nperseg=self.nperseg,
+            noverlap=self.noverlap,
+            nfft=self.nfft,
         )
+        sxx_db = 10 * np.log10(sxx / (self.ref_val**2))
+        t_mpl = self.pending_start.matplotlib_date + (t / mdates.SEC_PER_DAY)
+        self.t_mpl = np.concatenate([self.t_mpl, t_mpl])
+        self.sxx_db = np.hstack([self.sxx_db, sxx_db])
+
+        # Carry the overlap with the next window over
+        self.pending = pending[num_cols * hop:]
+        self.pending_start += num_cols * hop / self.fs
+
+    def drop_before(self, time):
+        """
+        Forget the columns centered before a time.
+
+        Args:
+            time (:class:`~obspy.core.utcdatetime.UTCDateTime`): Oldest time
+                to keep
+        """
+
+        keep = self.t_mpl >= time.matplotlib_date
+        self.t_mpl = self.t_mpl[keep]
+        self.sxx_db = self.sxx_db[:, keep]
+
+    def between(self, starttime, endtime):
+        """
+        Columns whose windows lie entirely between two times.
+
+        Returns:
+            Tuple of (`f`, `t_mpl`, `sxx_db`) as returned by
+            :func:`_compute_spectrogram`
+        """
+
+        half_win = 0.5 * self.nperseg / self.fs / mdates.SEC_PER_DAY
+        eps = 0.5 / self.fs / mdates.SEC_PER_DAY  # Rounding of the times
+        keep = (self.t_mpl - half_win >= starttime.matplotlib_date - eps) & (
+            self.t_mpl + half_win <= endtime.matplotlib_date + eps
+        )
+        return self.f, self.t_mpl[keep], self.sxx_db[:, keep]
 
-    return fig, spec_line, wf_line, time_box, wf_progress
+
+def _ffmpeg_escape(value, chars):
+    """
+    Escape characters of a value with backslashes for one level of `FFmpeg`_
+    filtergraph parsing: backslash, quote and colon for a filter option value,
+    and backslash, quote, brackets, comma and semicolon for the filtergraph.
+
+    Args:
+        value (str): Value to escape
+        chars (str): Characters to escape
+
+    Returns:
+        str
+
+    .. _FFmpeg: https://www.ffmpeg.org/
+    """
+
+    return ''.join(f'\\{c}' if c in chars else c for c in str(value))
 
 
 def _ffmpeg_combine(audio_file, video_file, output_file, call_str):
@@ -668,6 +1749,13 @@ class _UTCDateFormatter(mdates.ConciseDateFormatter):
             offset.set_x(0.5)
 
 
+# Video renderers by name; all take the arguments of _render_video()
+RENDERERS = {
+    'matplotlib': _render_video,
+    'ffmpeg': _render_video_ffmpeg,
+}
+
+
 def main():
     """
     This function is run when ``sonify.py`` is called as a script. It's also set
@@ -729,13 +1817,22 @@ def main():
         help='factor by which to speed up the waveform data (higher values = higher pitches)',
     )
     parser.add_argument(
-        '--fps', default=1, type=int, help='frames per second of output video'
+        '--fps',
+        default=None,
+        type=int,
+        help='frames per second of output video (defaults to that of "QUALITY")',
     )
     parser.add_argument(
         '--resolution',
-        default='4K',
+        default=None,
         choices=RESOLUTIONS.keys(),
-        help='resolution of output video; one of "crude" (640 x 360), "720p" (1280 x 720), "1080p" (1920 x 1080), "2K" (2560 x 1440), or "4K" (3840 x 2160)',
+        help='resolution of output video; one of "crude" (640 x 360), "720p" (1280 x 720), "1080p" (1920 x 1080), "2K" (2560 x 1440), or "4K" (3840 x 2160) (defaults to that of "QUALITY")',
+    )
+    parser.add_argument(
+        '--quality',
+        default='publication',
+        choices=QUALITY_PRESETS.keys(),
+        help='quality preset; "draft" for a quick preview, "standard", or "publication"',
     )
     parser.add_argument(
         '--output_dir',
@@ -808,6 +1905,7 @@ def main():
         db_lim,
         input_args.log,
         input_args.utc_offset,
+        quality=input_args.quality,
     )
 
 
@@ -0,0 +1,151 @@
+"""
+Batched spectrograms: the power spectrograms of many aligned channels (e.g.
+all the geophones of an array over the same interval) in one vectorized
+computation.
+
+Channels with the same sampling rate, start time and length are stacked into
+a 2-D array. Their segments are detrended, windowed and transformed together
+by :func:`scipy.fft.rfft` with `workers` threads, a block of segments at a
+time so that the temporary complex spectra stay small, and written into one
+preallocated output array. :mod:`scipy.fft` caches the FFT plan, so it is
+set up once for all channels and blocks.
+
+The result is the same as that of :func:`scipy.signal.spectrogram` (with its
+defaults: constant detrending, density scaling, one-sided) for each channel,
+up to floating point rounding.
+"""
+
+import matplotlib.dates as mdates
+import numpy as np
+import scipy.fft
+from scipy import signal
+
+BLOCK_SIZE = 2**20  # [values] Size of the segment blocks transformed at a time
+
+
+def stft_params(fs, spec_win_dur, zero_pad=2, overlap=0.5):
+    """
+    Segment length, overlap and FFT length of the spectrograms (by default
+    50 % overlap, zero-padded to twice the next power of two).
+
+    Args:
+        fs (float): Sampling rate [Hz]
+        spec_win_dur (int or float): Duration of spectrogram window [s]
+        zero_pad (int): FFT length as a multiple of the next power of two of
+            the window length
+        overlap (float): Fraction of a window shared by consecutive windows
+
+    Returns:
+        Tuple of (`nperseg`, `noverlap`, `nfft`)
+    """
+
+    nperseg = int(spec_win_dur * fs)  # Samples
+    nfft = np.power(2, int(np.ceil(np.log2(nperseg)))) * zero_pad  # Pad fft with zeroes
+    return nperseg, int(nperseg * overlap), nfft
+
+
+def power_spectrograms(data, fs, nperseg, noverlap, nfft, workers=None, out=None):
+    """
+    Power spectral density spectrograms of several channels at once.
+
+    Args:
+        data (:class:`~numpy.ndarray`): Array of shape (channels, samples)
+        fs (float): Sampling rate [Hz]
+        nperseg (int): Samples per segment
+        noverlap (int): Samples shared by consecutive segments
+        nfft (int): FFT length (zero-padded)
+        workers (int): Threads used by :func:`scipy.fft.rfft` (defaults to
+            all CPUs)
+        out (:class:`~numpy.ndarray`): Array of shape (channels, frequencies,
+            segments) to write the result into, e.g. a shared or memory-mapped
+            array (allocated if `None`)
+
+    Returns:
+        Tuple of (`f`, `t`, `sxx`) as returned by
+        :func:`scipy.signal.spectrogram`, with `sxx` of shape (channels,
+        frequencies, segments)
+    """
+
+    data = np.atleast_2d(data)
+    if workers is None:
+        workers = -1  # All CPUs
+    dtype = np.result_type(data.dtype, np.float32)
+    hop = nperseg - noverlap
+    num_segs = (data.shape[-1] - noverlap) // hop
+    f = scipy.fft.rfftfreq(nfft, 1 / fs)
+    t = np.arange(nperseg / 2, data.shape[-1] - nperseg / 2 + 1, hop) / float(fs)
+    if out is None:
+        out = np.empty((data.shape[0], f.size, num_segs), dtype=dtype)
+
+    win = signal.get_window('hann', nperseg).astype(dtype)
+    scale = 1.0 / (fs * (win * win).sum())
+
+    # Segments as a strided view, (channels, segments, nperseg)
+    segments = np.lib.stride_tricks.sliding_window_view(data, nperseg, axis=-1)[:, ::hop]
+    block = max(1, BLOCK_SIZE // (data.shape[0] * nfft))  # Segments at a time
+    for i0 in range(0, num_segs, block):
+        seg = segments[:, i0:i0 + block]
+        seg = (seg - seg.mean(axis=-1, keepdims=True)) * win
+        spec = scipy.fft.rfft(seg, n=nfft, axis=-1, workers=workers)
+        psd = spec.real**2
+        psd += spec.imag**2
+        psd *= scale
+        if nfft % 2:
+            psd[..., 1:] *= 2
+        else:
+            # Last point is unpaired Nyquist freq point, don't double
+            psd[..., 1:-1] *= 2
+        out[:, :, i0:i0 + block] = np.swapaxes(psd, 1, 2)
+
+    return f, t, out
+
+
+def compute_spectrograms(traces, spec_win_dur, ref_val, workers=None, zero_pad=2,
+                         overlap=0.5):
+    """
+    Compute the power spectrograms of several traces in decibels, batching
+    those that are aligned (same sampling rate, start time and length).
+
+    Args:
+        traces (list): :class:`~obspy.core.trace.Trace` objects
+        spec_win_dur (int or float): Duration of spectrogram window [s]
+        ref_val (int or float): Reference value for the decibel conversion
+        workers (int): See docstring for :func:`power_spectrograms`
+        zero_pad (int): See docstring for :func:`stft_params`
+        overlap (float): See docstring for :func:`stft_params`
+
+    Returns:
+        List with a tuple of (`f`, `t_mpl`, `sxx_db`) for each trace, as
+        returned by :func:`~sonify_input._compute_spectrogram`
+    """
+
+    groups = {}
+    for i, tr in enumerate(traces):
+        key = (tr.stats.sampling_rate, tr.stats.starttime.ns, tr.stats.npts)
+        groups.setdefault(key, []).append(i)
+
+    specs = [None] * len(traces)
+    for (fs, _, _), indices in groups.items():
+        if len(indices) == 1:
+            data = traces[indices[0]].data[np.newaxis]
+        else:
+            data = np.vstack([traces[i].data for i in indices])
+        f, t, sxx = power_spectrograms(
+            data, fs, *stft_params(fs, spec_win_dur, zero_pad, overlap),
+            workers=workers,
+        )
+        if sxx.dtype == np.float32:
+            # Power far below the peak can round to zero in single precision
+            np.maximum(sxx, np.finfo(sxx.dtype).tiny, out=sxx)
+
+        # [dB rel. (ref_val <ref_val_unit>)^2 Hz^-1], in place
+        np.divide(sxx, ref_val**2, out=sxx)
+        np.log10(sxx, out=sxx)
+        sxx *= 10
+
+        starttime = traces[indices[0]].stats.starttime
+        t_mpl = starttime.matplotlib_date + (t / mdates.SEC_PER_DAY)
+        for i, sxx_db in zip(indices, sxx):
+            specs[i] = f, t_mpl, sxx_db
+
+    return specs
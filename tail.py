@@ -0,0 +1,724 @@
+#!/usr/bin/env python
+"""
+Near-real-time follow mode: watch a data folder, read only the files that
+land in it and keep an always up-to-date spectrogram and soundtrack of the
+latest data as a live `HLS`_ playlist.
+
+The new data is filtered causally with the filter state carried from file
+to file, and the spectrogram is extended column by column with the window
+overlap carried over, so each new file costs only its own samples. Every
+`segment_dur` seconds of new data, a media segment is written with the
+current spectrogram figure and the sped-up sound of the new data, and the
+playlist is rewritten to list the latest segments.
+
+.. _HLS: https://en.wikipedia.org/wiki/HTTP_Live_Streaming
+"""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from obspy import Trace
+from scipy.io import wavfile
+
+from filtering import CausalFilter
+from sonify_input import (
+    AUDIO_SAMPLE_RATE,
+    FIGURE_WIDTH,
+    PREFILTER_STAGES,
+    QUALITY_PRESETS,
+    RESOLUTIONS,
+    _IncrementalSpectrogram,
+    _bandpass_corners,
+    _resample_audio,
+    _spectrogram_stack,
+)
+from utils import read_data_file
+
+PLAYLIST_NAME = 'live.m3u8'
+
+
+def tail_folder(
+    path_data,
+    format_in,
+    output_dir,
+    window=1800,
+    segment_dur=10,
+    speed_up_factor=200,
+    freqmin=None,
+    freqmax=None,
+    spec_win_dur=5,
+    db_lim='smart',
+    log=False,
+    resolution=None,
+    fps=None,
+    quality='standard',
+    poll_interval=2,
+    playlist_size=6,
+    max_polls=None,
+):
+    r"""
+    Follow a data folder and keep a live playlist of the latest data.
+
+    Each segment plays for `segment_dur` seconds, i.e. in real time, so that
+    the playlist keeps pace with the incoming data. Its picture is the
+    spectrogram and waveform of the latest `window` seconds and its sound is
+    the new data of the segment sped up by `speed_up_factor`, followed by
+    silence. Segments are held back until the spectrogram has its first
+    column, and the last segment before an outage longer than `window` is
+    shorter if needed, so that no data is left out.
+
+    Files are read once their size and modification time stop changing
+    between two polls. On start-up, the files modified within the last
+    `window` seconds are read to fill the figure; older files are ignored.
+
+    Args:
+        path_data (str): Folder to watch
+        format_in (str): Format of data files (e.g. `'PICKLE'` or `'bz2'`)
+        output_dir (str or :class:`~pathlib.Path`): Directory for the segments
+            and the playlist `live.m3u8`
+        window (int or float): Duration of data shown in the figure [s]
+        segment_dur (int or float): Duration of new data per segment [s]
+        speed_up_factor (int): See docstring for
+            :func:`~sonify_input.sonify_input`
+        freqmin (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        freqmax (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        spec_win_dur (int or float): Duration of spectrogram window [s]
+        db_lim (tuple or str): See docstring for
+            :func:`~sonify_input.sonify_input`
+        log (bool): See docstring for :func:`~sonify_input.sonify_input`
+        resolution (str): Resolution of the segments; see
+            :data:`~sonify_input.RESOLUTIONS` (defaults to that of `quality`)
+        fps (int): Frames per second of the segments (defaults to that of
+            `quality`)
+        quality (str): One of :data:`~sonify_input.QUALITY_PRESETS`; sets the
+            spectrogram, the default resolution and frame rate, and the
+            encoder preset
+        poll_interval (int or float): Time between polls of the folder [s]
+        playlist_size (int): Number of segments listed in the playlist. Older
+            segments are deleted
+        max_polls (int): Stop after this many polls (defaults to running until
+            interrupted)
+    """
+
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f'Quality must be one of {list(QUALITY_PRESETS)}')
+    fps = fps or QUALITY_PRESETS[quality]['fps']
+    resolution = resolution or QUALITY_PRESETS[quality]['resolution']
+
+    output_dir = Path(str(output_dir)).expanduser().resolve()
+    os.makedirs(output_dir, exist_ok=True)
+
+    watcher = _FolderWatcher(path_data, since=time.time() - window)
+    live = None
+    writer = _SegmentWriter(
+        output_dir, segment_dur, speed_up_factor, db_lim, log, resolution, fps, quality,
+        playlist_size,
+    )
+
+    print(f'Following {path_data} (Ctrl+C to stop)')
+    num_polls = 0
+    try:
+        while max_polls is None or num_polls < max_polls:
+            for file in watcher.poll():
+                try:
+                    st = read_data_file(file, format_in)
+                except Exception as e:
+                    print('Can not read %s (%s: %s)' % (file, type(e).__name__, e))
+                    continue
+                if live is None:
+                    live = _LiveTrace(
+                        st[0], window, speed_up_factor, freqmin, freqmax, spec_win_dur,
+                        quality,
+                    )
+                    print(f'Following {live.id} at {live.fs:g} Hz')
+                # Before starting over after an outage, write what is unsent
+                live.extend(st, before_reset=lambda: writer.write(live, flush=True))
+                writer.write(live)
+
+            num_polls += 1
+            if max_polls is None or num_polls < max_polls:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print('Stopped')
+
+    return output_dir / PLAYLIST_NAME
+
+
+class _FolderWatcher:
+    """
+    Poll a folder for new data files.
+
+    A file is reported once (in name order, like
+    :func:`~utils.read_data_from_folder`) after its size and modification time
+    were the same at two consecutive polls, so that files still being written
+    are not read.
+
+    Args:
+        path_data (str): Folder to watch
+        since (float): Ignore files modified before this POSIX timestamp
+    """
+
+    def __init__(self, path_data, since):
+        self.path_data = path_data
+        self.since = since
+        self.seen = set()
+        self.pending = {}  # File -> (size, mtime) at the previous poll
+
+    def poll(self):
+        """
+        Returns:
+            List of the paths of the new, complete files
+        """
+
+        ready = []
+        for name in sorted(os.listdir(self.path_data)):
+            file = os.path.join(self.path_data, name)
+            if file in self.seen or not os.path.isfile(file):
+                continue
+            stat = os.stat(file)
+            if stat.st_mtime < self.since:
+                self.seen.add(file)
+                continue
+            state = (stat.st_size, stat.st_mtime)
+            if self.pending.get(file) == state:
+                del self.pending[file]
+                self.seen.add(file)
+                ready.append(file)
+            else:
+                self.pending[file] = state
+        return ready
+
+
+class _LiveTrace:
+    """
+    Rolling, incrementally filtered Trace and spectrogram of the latest data.
+
+    New samples are filtered causally with :class:`~filtering.CausalFilter`
+    (the same stages as :func:`~sonify_input.sonify_input`, in a single pass).
+    The spectrogram is extended with
+    :class:`~sonify_input._IncrementalSpectrogram`, so its columns are
+    identical to those of the whole filtered trace.
+
+    Gaps between files are filled with zeros, as when merging. After a gap
+    longer than `window`, the filter and spectrogram start over.
+
+    Args:
+        tr (:class:`~obspy.core.trace.Trace`): First data, defines the ID and
+            the sampling rate that are followed
+        window (int or float): Duration of data kept [s]
+        speed_up_factor (int): Used for the default bandpass corners
+        freqmin (int or float): Lower bandpass corner [Hz]
+        freqmax (int or float): Upper bandpass corner [Hz]
+        spec_win_dur (int or float): Duration of spectrogram window [s]
+        quality (str): See docstring for :func:`tail_folder`
+    """
+
+    def __init__(
+        self, tr, window, speed_up_factor, freqmin, freqmax, spec_win_dur, quality='standard'
+    ):
+        self.id = tr.id
+        self.stats = tr.stats.copy()
+        self.fs = tr.stats.sampling_rate
+        self.window = window
+        self.freq_lim = _bandpass_corners(tr, freqmin, freqmax, speed_up_factor)
+        self.stages = PREFILTER_STAGES + [('bandpass', self.freq_lim, 4)]
+        self.spec_win_dur = spec_win_dur
+        self.quality = quality
+        self._reset(tr.stats.starttime)
+
+    def _reset(self, starttime):
+        self.filter = CausalFilter(self.stages, self.fs)
+        self.starttime = starttime  # Of the first sample in self.data
+        self.data = np.empty(0)
+        self.num_unsent = 0  # Number of samples not yet in a segment
+        self.spec = _IncrementalSpectrogram(
+            self.fs, self.spec_win_dur, starttime, quality=self.quality
+        )
+
+    @property
+    def endtime(self):
+        """
+        Time of the sample following the last one
+        """
+
+        return self.starttime + self.data.size / self.fs
+
+    @property
+    def trace(self):
+        """
+        :class:`~obspy.core.trace.Trace` with the data kept
+        """
+
+        stats = self.stats.copy()
+        stats.starttime = self.starttime
+        stats.npts = self.data.size
+        return Trace(data=self.data, header=stats)
+
+    def extend(self, st, before_reset=None):
+        """
+        Append the data of a new file.
+
+        Args:
+            st (:class:`~obspy.core.stream.Stream`): Data read from the file.
+                Only the Traces with the followed ID are used
+            before_reset: Function called before starting over after a long
+                gap, e.g. to write the unsent samples, which are dropped
+        """
+
+        for tr in st.select(id=self.id):
+            if tr.stats.sampling_rate != self.fs:
+                warnings.warn(
+                    f'Skipping {tr.stats.starttime} of {tr.id}: sampling rate '
+                    f'{tr.stats.sampling_rate:g} Hz instead of {self.fs:g} Hz'
+                )
+                continue
+
+            # Align the new samples on the sample grid of the data kept
+            offset = int(round((tr.stats.starttime - self.endtime) * self.fs))
+            data = np.asarray(tr.data, dtype=np.float64)
+            if offset < 0:  # Overlap: keep only the new samples
+                data = data[-offset:]
+            elif offset / self.fs > self.window:  # Long outage
+                print(f'Gap of {offset / self.fs:g} s, starting over')
+                if before_reset is not None and self.num_unsent:
+                    before_reset()
+                self._reset(tr.stats.starttime)
+            elif offset:  # Gap: fill with zeros
+                data = np.concatenate([np.zeros(offset), data])
+            if not data.size:
+                continue
+
+            self._append(self.filter(data))
+
+    def _append(self, filtered):
+        self.data = np.concatenate([self.data, filtered])
+        self.num_unsent += filtered.size
+        self.spec.extend(filtered)
+
+        # Drop what is older than the window (but never unsent samples)
+        excess = self.data.size - max(int(self.window * self.fs), self.num_unsent)
+        if excess > 0:
+            self.data = self.data[excess:]
+            self.starttime += excess / self.fs
+            self.spec.drop_before(self.starttime)
+
+    def pop_unsent(self, npts):
+        """
+        Take the oldest `npts` samples not yet written to a segment.
+
+        Returns:
+            :class:`~obspy.core.trace.Trace`
+        """
+
+        tr = self.trace
+        start = self.data.size - self.num_unsent
+        tr.data = tr.data[start:start + npts].copy()
+        tr.stats.starttime = self.starttime + start / self.fs
+        self.num_unsent -= npts
+        return tr
+
+
+class _SegmentWriter:
+    """
+    Write the media segments of a :class:`_LiveTrace` and keep the live
+    playlist of the latest ones.
+
+    Args:
+        output_dir (:class:`~pathlib.Path`): Directory for the segments and
+            the playlist
+        segment_dur (int or float): Duration of new data per segment [s]
+        speed_up_factor (int): See docstring for
+            :func:`~sonify_input.sonify_input`
+        db_lim (tuple or str): See docstring for
+            :func:`~sonify_input.sonify_input`
+        log (bool): See docstring for :func:`~sonify_input.sonify_input`
+        resolution (str): Resolution of the segments
+        fps (int): Frames per second of the segments
+        quality (str): See docstring for :func:`tail_folder`
+        playlist_size (int): Number of segments listed in the playlist
+    """
+
+    def __init__(
+        self, output_dir, segment_dur, speed_up_factor, db_lim, log, resolution, fps, quality,
+        playlist_size,
+    ):
+        self.output_dir = output_dir
+        self.segment_dur = segment_dur
+        self.speed_up_factor = speed_up_factor
+        self.fps = fps
+        self.encoder_preset = QUALITY_PRESETS[quality]['encoder_preset']
+        self.playlist_size = playlist_size
+        self.figure = _LiveFigure(db_lim, log, resolution, quality)
+        self.playlist = []  # (sequence number, duration, file name)
+        self.sequence = 0
+        self.ts_offset = 0  # [s] Start of the next segment in the stream
+
+    def write(self, live, flush=False):
+        """
+        Write a segment for every `segment_dur` seconds of unsent data, once
+        the spectrogram has a column to show.
+
+        Args:
+            live (:class:`_LiveTrace`): Data to write
+            flush (bool): Also write the remaining unsent samples as a shorter
+                segment
+        """
+
+        npts = int(round(self.segment_dur * live.fs))
+        while live.num_unsent and (live.num_unsent >= npts or flush):
+            if not live.spec.t_mpl.size and self.figure.fig is None:
+                if flush:
+                    warnings.warn(
+                        f'Dropping {live.num_unsent / live.fs:g} s of data, too short '
+                        'for a spectrogram window'
+                    )
+                    live.pop_unsent(live.num_unsent)
+                return
+            num = min(npts, live.num_unsent)
+            name = f'segment_{self.sequence:06d}.ts'
+            duration = num / live.fs
+            _write_segment(
+                live,
+                self.figure,
+                num,
+                self.output_dir / name,
+                self.ts_offset,
+                self.speed_up_factor,
+                self.fps,
+                self.encoder_preset,
+            )
+            self.playlist.append((self.sequence, duration, name))
+            for _, _, old_name in self.playlist[:-self.playlist_size]:
+                (self.output_dir / old_name).unlink(missing_ok=True)
+            self.playlist = self.playlist[-self.playlist_size:]
+            _write_playlist(self.output_dir / PLAYLIST_NAME, self.playlist)
+            print(f'Segment {self.sequence} up to {live.endtime.strftime("%H:%M:%S")}')
+            self.sequence += 1
+            self.ts_offset += duration
+
+
+class _LiveFigure:
+    """
+    Spectrogram and waveform figure of a :class:`_LiveTrace`, made once with
+    :func:`~sonify_input._spectrogram_stack` and then updated in place for
+    each segment: the waveform, the spectrogram image and its color limits,
+    the time axis, the cursor and the time box. It is made again only if the
+    order of magnitude of the waveform changes, since that label is static.
+
+    Args:
+        db_lim (tuple or str): See docstring for
+            :func:`~sonify_input.sonify_input`
+        log (bool): See docstring for :func:`~sonify_input.sonify_input`
+        resolution (str): Resolution of the pictures
+        quality (str): See docstring for :func:`tail_folder`; sets the
+            spectrogram shading
+    """
+
+    def __init__(self, db_lim, log, resolution, quality):
+        self.db_lim = db_lim
+        self.log = log
+        self.resolution = resolution
+        self.quality = quality
+        self.fig = None
+        self.magnitude = None
+
+    def save(self, live, starttime, endtime, tr_new, image_file):
+        """
+        Save the picture of the data between two times with the cursor at the
+        start of the new data `tr_new` and its end in the time box. The
+        spectrogram needs at least one column to make the figure;
+        without, the previous spectrogram image is kept.
+        """
+
+        tr = live.trace
+        max_value = np.abs(tr.slice(starttime, endtime).data).max()
+        magnitude = int(np.floor(np.log10(max_value))) if max_value else None
+
+        original_params = matplotlib.rcParams.copy()
+        matplotlib.rcParams.update(matplotlib.rcParamsDefault)
+        matplotlib.rcParams['font.sans-serif'] = 'Tex Gyre Heros'
+        matplotlib.rcParams['mathtext.fontset'] = 'custom'
+        if self.fig is None or (magnitude != self.magnitude and live.spec.t_mpl.size):
+            self._make(live, tr, starttime, endtime)
+        else:
+            self._update(live, tr, starttime, endtime, max_value)
+        self.magnitude = magnitude
+        for line in self.lines:
+            line.set_xdata([tr_new.stats.starttime.matplotlib_date] * 2)
+        self.time_box.txt.set_text(tr_new.stats.endtime.strftime('%H:%M:%S'))
+        self.fig.savefig(image_file, dpi=RESOLUTIONS[self.resolution][0] / FIGURE_WIDTH)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            matplotlib.rcParams.update(original_params)
+
+    def _make(self, live, tr, starttime, endtime):
+        self.fig, spec_lines, wf_lines, self.time_box, _ = _spectrogram_stack(
+            [tr],
+            starttime,
+            endtime,
+            True,
+            1,
+            live.spec_win_dur,
+            self.db_lim,
+            live.freq_lim,
+            self.log,
+            False,
+            self.resolution,
+            specs=[(live.spec.f, live.spec.t_mpl, live.spec.sxx_db)],
+            quality=self.quality,
+        )
+        FigureCanvasAgg(self.fig)
+        self.lines = spec_lines + wf_lines
+        self.spec_ax, self.wf_ax = spec_lines[0].axes, wf_lines[0].axes
+        self.mesh = self.spec_ax.collections[0]
+        self.colorbar = self.mesh.colorbar
+        self.waveform = self.wf_ax.lines[0]
+
+    def _update(self, live, tr, starttime, endtime, max_value):
+        self.waveform.set_data(tr.times('matplotlib'), tr.data)
+        if max_value:
+            self.wf_ax.set_ylim(-max_value, max_value)
+
+        sxx_db = live.spec.sxx_db
+        if sxx_db.size:
+            mesh = self.spec_ax.pcolormesh(
+                live.spec.t_mpl,
+                live.spec.f,
+                sxx_db,
+                cmap=self.mesh.cmap,
+                norm=self.mesh.norm,
+                shading=QUALITY_PRESETS[self.quality]['shading'],
+                rasterized=True,
+            )
+            self.mesh.remove()
+            self.mesh = mesh
+            if self.db_lim == 'smart':
+                db_min = np.percentile(sxx_db, 20)
+                db_max = sxx_db.max()
+                mesh.set_clim(np.ceil(db_min / 10) * 10, np.floor(db_max / 10) * 10)
+            self.colorbar.update_normal(mesh)
+        self.wf_ax.set_xlim(starttime.matplotlib_date, endtime.matplotlib_date)
+
+
+def _write_segment(
+    live, figure, npts, segment_file, ts_offset, speed_up_factor, fps, encoder_preset=None
+):
+    """
+    Write the next media segment: the figure (a :class:`_LiveFigure`) as a
+    still picture and the sped-up sound of the next `npts` unsent samples,
+    padded with silence to the duration of these samples. Uses a system call
+    to `FFmpeg`_ with the x264 `encoder_preset` (FFmpeg's default if `None`).
+
+    .. _FFmpeg: https://www.ffmpeg.org/
+    """
+
+    tr_new = live.pop_unsent(npts)
+    endtime = tr_new.stats.endtime + tr_new.stats.delta
+    starttime = endtime - live.window
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Sound, scaled by the peak of the window shown so that the loudness
+        # does not jump from one segment to the next
+        audio_file = Path(temp_dir) / 'segment.wav'
+        data = _resample_audio(tr_new, speed_up_factor).data
+        peak = np.abs(live.data).max() or 1
+        data = np.clip(data / peak, -1, 1) * (2**31 - 1)
+        wavfile.write(str(audio_file), AUDIO_SAMPLE_RATE, data.astype(np.int32))
+
+        # Picture
+        image_file = Path(temp_dir) / 'segment.png'
+        figure.save(live, starttime, endtime, tr_new, image_file)
+
+        args = [
+            'ffmpeg',
+            '-y',
+            '-v',
+            'warning',
+            '-loop',
+            '1',
+            '-framerate',
+            str(fps),
+            '-i',
+            image_file,
+            '-guess_layout_max',
+            '0',
+            '-i',
+            audio_file,
+            '-af',
+            'apad',
+            '-t',
+            f'{npts / live.fs:g}',
+            '-c:v',
+            'h264',
+            *(['-preset', encoder_preset] if encoder_preset else []),
+            '-tune',
+            'stillimage',
+            '-bf',
+            '0',  # Nothing to gain from B-frames for a still picture
+            '-pix_fmt',
+            'yuv420p',
+            '-c:a',
+            'aac',
+            '-b:a',
+            '320k',
+            '-ac',
+            '2',
+            '-output_ts_offset',
+            f'{ts_offset:g}',  # Continuous timestamps
+            '-f',
+            'mpegts',
+            segment_file,
+        ]
+        code = subprocess.call(args)
+
+    if code != 0:
+        segment_file.unlink(missing_ok=True)  # Remove file if it was made
+        raise OSError('Issue with FFmpeg conversion. Check error messages and try again.')
+
+
+def _write_playlist(playlist_file, playlist):
+    """
+    Write a live HLS playlist of (sequence number, duration, file name)
+    segments. The file is replaced atomically so that players never read a
+    partial playlist.
+    """
+
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{int(np.ceil(max(d for _, d, _ in playlist)))}',
+        f'#EXT-X-MEDIA-SEQUENCE:{playlist[0][0]}',
+    ]
+    for _, duration, name in playlist:
+        lines += [f'#EXTINF:{duration:.3f},', name]
+    temp_file = playlist_file.with_suffix('.tmp')
+    temp_file.write_text('\n'.join(lines) + '\n')
+    os.replace(temp_file, playlist_file)
+
+
+def main():
+    """
+    This function is run when ``tail.py`` is called as a script.
+    """
+
+    parser = argparse.ArgumentParser(
+        description='Follow a data folder and keep a live spectrogram and soundtrack playlist of the latest data.',
+        allow_abbrev=False,
+    )
+    parser.add_argument('path_data', help='folder to watch')
+    parser.add_argument('output_dir', help='directory for the segments and the playlist')
+    parser.add_argument('--format_in', default='PICKLE', help='format of data files')
+    parser.add_argument(
+        '--window', default=1800, type=float, help='duration of data shown [s]'
+    )
+    parser.add_argument(
+        '--segment_dur', default=10, type=float, help='duration of new data per segment [s]'
+    )
+    parser.add_argument(
+        '--speed_up_factor',
+        default=200,
+        type=int,
+        help='factor by which to speed up the waveform data (higher values = higher pitches)',
+    )
+    parser.add_argument('--freqmin', default=None, type=float, help='lower bandpass corner [Hz]')
+    parser.add_argument('--freqmax', default=None, type=float, help='upper bandpass corner [Hz]')
+    parser.add_argument(
+        '--spec_win_dur', default=5, type=float, help='duration of spectrogram window [s]'
+    )
+    parser.add_argument(
+        '--resolution',
+        default=None,
+        choices=RESOLUTIONS.keys(),
+        help='resolution of the segments (defaults to that of "QUALITY")',
+    )
+    parser.add_argument(
+        '--fps',
+        default=None,
+        type=int,
+        help='frames per second of the segments (defaults to that of "QUALITY")',
+    )
+    parser.add_argument(
+        '--quality',
+        default='standard',
+        choices=QUALITY_PRESETS.keys(),
+        help='quality preset; "draft", "standard", or "publication"',
+    )
+    parser.add_argument(
+        '--db_lim',
+        default='smart',
+        nargs='+',
+        help='numbers "<min>" "<max>" defining min and max colormap cutoffs [dB], "smart" for a sensible automatic choice, or "None" for no clipping',
+    )
+    parser.add_argument(
+        '--log',
+        action='store_true',
+        help='use log scaling for y-axis of spectrogram',
+    )
+    parser.add_argument(
+        '--poll_interval', default=2, type=float, help='time between polls of the folder [s]'
+    )
+    parser.add_argument(
+        '--playlist_size',
+        default=6,
+        type=int,
+        help='number of segments listed in the playlist; older segments are deleted',
+    )
+    input_args = parser.parse_args()
+
+    # Extra type check for db_lim kwarg
+    db_lim_error = False
+    db_lim = np.atleast_1d(input_args.db_lim)
+    if db_lim.size == 1:
+        db_lim = db_lim[0]
+        if db_lim == 'smart':
+            pass
+        elif db_lim == 'None':
+            db_lim = None
+        else:
+            db_lim_error = True
+    elif db_lim.size == 2:
+        try:
+            db_lim = tuple(float(s) for s in db_lim)
+        except ValueError:
+            db_lim_error = True
+    else:  # User provided more than 2 args
+        db_lim_error = True
+    if db_lim_error:
+        parser.error(
+            'argument --db_lim: must be one of "smart", "None", or two numeric values "<min>" "<max>"'
+        )
+    if input_args.playlist_size < 1:
+        parser.error('argument --playlist_size: must be at least 1')
+
+    tail_folder(
+        input_args.path_data,
+        input_args.format_in,
+        input_args.output_dir,
+        window=input_args.window,
+        segment_dur=input_args.segment_dur,
+        speed_up_factor=input_args.speed_up_factor,
+        freqmin=input_args.freqmin,
+        freqmax=input_args.freqmax,
+        spec_win_dur=input_args.spec_win_dur,
+        db_lim=db_lim,
+        log=input_args.log,
+        resolution=input_args.resolution,
+        fps=input_args.fps,
+        quality=input_args.quality,
+        poll_interval=input_args.poll_interval,
+        playlist_size=input_args.playlist_size,
+    )
+
+
+if __name__ == '__main__':
+    main()
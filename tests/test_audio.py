@@ -0,0 +1,66 @@
+import sys
+import wave
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Trace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from audio import LanczosResampler, write_audio  # noqa: E402
+
+FS = 100
+TARGET_FS = 441  # As with a speed-up factor of 100 played back at 44.1 kHz
+
+
+def _read_wav(audio_file):
+    with wave.open(str(audio_file), 'rb') as f:
+        channels = f.getnchannels()
+        frames = np.frombuffer(f.readframes(f.getnframes()), dtype='<i4')
+    return frames.reshape(-1, channels)
+
+
+@pytest.mark.parametrize('block_size', [1, 777, 10_000])
+def test_lanczos_resampler_blockwise(block_size):
+    data = np.random.default_rng(0).normal(size=5000)
+    resampler = LanczosResampler(FS, TARGET_FS)
+    out = np.concatenate(
+        [resampler(data[i:i + block_size]) for i in range(0, data.size, block_size)]
+        + [resampler.flush()]
+    )
+    tr = Trace(data.copy(), header=dict(sampling_rate=FS))
+    tr.interpolate(sampling_rate=TARGET_FS, method='lanczos', a=20)
+    np.testing.assert_allclose(out, tr.data, rtol=0, atol=1e-10)
+
+
+def test_write_audio_matches_trace_write(tmp_path):
+    data = np.random.default_rng(0).normal(size=3000)
+    audio_file = write_audio([data], FS, TARGET_FS, tmp_path / 'out.wav', 44100,
+                             block_size=1000)
+
+    tr = Trace(data.copy(), header=dict(sampling_rate=FS))
+    tr.interpolate(sampling_rate=TARGET_FS, method='lanczos', a=20)
+    tr.stats.sampling_rate = 44100
+    tr.write(str(tmp_path / 'ref.wav'), format='WAV', width=4, rescale=True)
+    ref = _read_wav(tmp_path / 'ref.wav')
+    frames = _read_wav(audio_file)
+    assert frames.shape == ref.shape
+    assert np.abs(frames.astype(np.int64) - ref).max() <= 1  # Rounding
+
+
+def test_write_audio_multichannel_peak(tmp_path):
+    rng = np.random.default_rng(0)
+    channels = [rng.normal(size=3000), rng.normal(size=1000)]  # Different lengths
+    frames = _read_wav(write_audio(channels, FS, TARGET_FS, tmp_path / 'out.wav', 44100,
+                                   peak=10, block_size=700))
+
+    out = []
+    for data_ch in channels:
+        tr = Trace(data_ch.copy(), header=dict(sampling_rate=FS))
+        tr.interpolate(sampling_rate=TARGET_FS, method='lanczos', a=20)
+        out.append(tr.data)
+    num_out = min(o.size for o in out)  # Cut to the shortest channel
+    expected = np.column_stack([o[:num_out] for o in out]) / 10 * (2**31 - 1)
+    assert frames.shape == expected.shape
+    np.testing.assert_allclose(frames, expected, rtol=0, atol=1)
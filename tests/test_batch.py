@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from batch import iter_windows  # noqa: E402
+from filtering import filter_data  # noqa: E402
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 20
+STAGES = [('bandpass', (0.5, 5), 4)]
+
+
+@pytest.fixture
+def gappy_folder(tmp_path):
+    """
+    Hourly files covering 00–02 h and 05–08 h, and the whole span merged and
+    filtered at once.
+    """
+
+    rng = np.random.default_rng(0)
+    traces = []
+    for hour in (0, 1, 5, 6, 7):
+        tr = Trace(
+            rng.normal(size=3600 * FS),
+            header=dict(station='A', channel='HHZ', sampling_rate=FS,
+                        starttime=T0 + hour * 3600),
+        )
+        Stream([tr]).write(str(tmp_path / f'{hour:02d}.pickle'), format='PICKLE')
+        traces.append(tr)
+    ref = Stream(traces).merge(method=0, fill_value=0)[0]
+    ref.data = filter_data(ref.data, FS, STAGES)
+    return tmp_path, ref
+
+
+@pytest.mark.parametrize(
+    'start, end, window, step',
+    [(0, 8, 3600, None), (3, 7, 3600, None), (1.5, 7, 1800, None), (3, 7, 5400, 3600)],
+)
+def test_iter_windows_gap(gappy_folder, start, end, window, step):
+    path_data, ref = gappy_folder
+    starts = []
+    for win_start, win_end, tr, _ in iter_windows(
+        str(path_data), 'PICKLE', T0 + start * 3600, T0 + end * 3600, window, step=step,
+        spec_win_dur=None, stages=STAGES,
+    ):
+        starts.append(win_start)
+        expected = ref.slice(tr.stats.starttime, tr.stats.endtime).data
+        assert tr.stats.npts == expected.size
+        np.testing.assert_allclose(tr.data, expected, atol=1e-8)
+    # Every window of the sweep has data or zeros, none is skipped
+    assert len(starts) == len(np.arange(start * 3600, end * 3600, step or window))
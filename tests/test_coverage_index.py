@@ -0,0 +1,88 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from coverage_index import CoverageIndex, plan_jobs  # noqa: E402
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 10
+
+
+def _write(path, start, duration):
+    tr = Trace(np.zeros(int(duration * FS)), header=dict(station='A', channel='HHZ',
+                                                          sampling_rate=FS,
+                                                          starttime=T0 + start))
+    Stream([tr]).write(str(path / f'{start:05d}.pickle'), format='PICKLE')
+    return tr.id
+
+
+@pytest.fixture
+def folder(tmp_path):
+    """
+    Files covering 0–100 s, 150–250 s and 200–300 s (overlapping) and 400–500 s.
+    """
+
+    path = tmp_path / 'data'
+    path.mkdir()
+    for start in (0, 150, 200, 400):
+        tr_id = _write(path, start, 100)
+    return path, tr_id
+
+
+@pytest.mark.parametrize(
+    'start, end, covered',
+    [
+        (0, 500, 350),
+        (50, 175, 75),  # Across a gap
+        (100, 150, 0),  # Within a gap
+        (180, 280, 100),  # Within the overlap, counted once
+        (250, 450, 100),
+        (-100, 600, 350),  # Beyond the data
+    ],
+)
+def test_covered(folder, start, end, covered):
+    path, tr_id = folder
+    index = CoverageIndex(str(path), 'PICKLE')
+    channel = index.channels[tr_id]
+    assert channel.covered(T0.timestamp + start, T0.timestamp + end) == pytest.approx(covered)
+    assert index.coverage(tr_id, T0 + start, T0 + end) == pytest.approx(covered / (end - start))
+
+
+def test_gaps_overlaps_and_windows(folder):
+    path, tr_id = folder
+    index = CoverageIndex(str(path), 'PICKLE')
+    channel = index.channels[tr_id]
+    np.testing.assert_allclose(np.array(channel.gaps()) - T0.timestamp, [[100, 150], [300, 400]])
+    np.testing.assert_allclose(np.array(channel.overlaps) - T0.timestamp, [[200, 250]])
+
+    # Arrays of windows give the same as one at a time
+    starts = T0.timestamp + np.arange(0, 500, 50)
+    np.testing.assert_allclose(
+        channel.covered(starts, starts + 50),
+        [channel.covered(start, start + 50) for start in starts],
+    )
+    windows = index.windows(tr_id, T0, T0 + 500, 100, min_fraction=0.6)
+    assert [(w[0] - T0, w[2]) for w in windows] == [(0, 1), (200, 1), (400, 1)]
+
+    jobs = plan_jobs(index, T0, T0 + 500, 100, min_fraction=0.6)
+    assert [(job.starttime - T0, job.samples) for job in jobs] == [
+        (0, 100 * FS), (200, 100 * FS), (400, 100 * FS)
+    ]
+
+
+def test_update(folder, tmp_path):
+    path, tr_id = folder
+    cache = str(tmp_path / 'cache.json')
+    index = CoverageIndex(str(path), 'PICKLE', cache=cache)
+    assert CoverageIndex(str(path), 'PICKLE', cache=cache).update() == 0  # Nothing new
+
+    (path / '00400.pickle').unlink()
+    _write(path, 100, 50)  # Fills the first gap
+    assert index.update() == 1
+    assert index.channels[tr_id].gaps() == []
+    assert index.coverage(tr_id, T0, T0 + 300) == pytest.approx(1)
@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy.signal.filter import bandpass
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from filtering import (  # noqa: E402
+    CausalFilter,
+    chain_sos,
+    design_sos,
+    filter_data,
+    zerophase_sosfilt,
+)
+from sonify_input import PREFILTER_STAGES  # noqa: E402
+
+
+@pytest.mark.parametrize('block_size', [1000, 4096, 2**20])
+def test_zerophase_sosfilt_blockwise(block_size):
+    x = np.random.default_rng(0).normal(size=(2, 10_000))
+    sos = chain_sos([('bandpass', (1, 10), 4)], 100)
+    out = zerophase_sosfilt(x, sos, block_size=block_size)
+    for row, out_row in zip(x, out):
+        expected = bandpass(row, 1, 10, 100, corners=4, zerophase=True)
+        np.testing.assert_allclose(out_row, expected, rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize('fs', [40, 100, 100.4])
+def test_prefilter_at_or_below_nyquist(fs):
+    x = np.random.default_rng(0).normal(size=5000)
+    stages = [('bandpass', (1, 10), 4)]
+    design_sos.cache_clear()  # Designs warn once, when first made
+    with pytest.warns(UserWarning, match='bandstop'):
+        out = filter_data(x, fs, PREFILTER_STAGES + stages)
+    np.testing.assert_array_equal(out, filter_data(x, fs, stages))
+    np.testing.assert_array_equal(CausalFilter(PREFILTER_STAGES, fs)(x), x)
@@ -0,0 +1,105 @@
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import NEEDS, STAGES, Pipeline  # noqa: E402
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 100
+
+
+@pytest.fixture
+def folder(tmp_path):
+    path = tmp_path / 'data'
+    path.mkdir()
+    tr = Trace(np.random.default_rng(0).normal(size=20 * 60 * FS),
+               header=dict(station='G0', channel='X', sampling_rate=FS, starttime=T0))
+    Stream([tr]).write(str(path / 'data.pickle'), format='PICKLE')
+    return str(path)
+
+
+def test_reuse_results(folder, tmp_path, monkeypatch):
+    with Pipeline(folder, 'PICKLE', T0 + 300, T0 + 900, output_dir=tmp_path / 'a',
+                  speed_up_factor=100) as pipeline:
+        results = pipeline.run('filter')
+        # The filter works in place and uses up the loaded data
+        assert list(results) == ['filter']
+        audio_file = pipeline.run('audio')['audio'].audio_file
+        pipeline.save(tmp_path / 'results.pickle')
+        with pytest.raises(ValueError):
+            pipeline.run('sound')
+
+    # A restored pipeline goes on from the saved results without loading
+    monkeypatch.setattr(Pipeline, '_load', lambda self: pytest.fail('Loaded again'))
+    with Pipeline(folder, 'PICKLE', T0 + 300, T0 + 900, output_dir=tmp_path / 'b',
+                  speed_up_factor=100) as pipeline:
+        pipeline.restore(tmp_path / 'results.pickle')
+        assert pipeline.run('audio')['audio'].audio_file == audio_file  # Not run again
+        del pipeline.results['audio']
+        restored_file = pipeline.run('audio')['audio'].audio_file
+    assert restored_file.parent == tmp_path / 'b'
+    assert restored_file.read_bytes() == audio_file.read_bytes()
+
+    # Spectrograms of the restored data are those of the original data
+    with Pipeline(folder, 'PICKLE', T0 + 300, T0 + 900, speed_up_factor=100) as pipeline:
+        pipeline.restore(tmp_path / 'results.pickle')
+        specs = pipeline.run('stft')['stft'].specs
+    monkeypatch.undo()
+    with Pipeline(folder, 'PICKLE', T0 + 300, T0 + 900, speed_up_factor=100) as pipeline:
+        expected = pipeline.run('stft')['stft'].specs
+    for spec, spec_ref in zip(specs, expected):
+        for x, x_ref in zip(spec, spec_ref):
+            np.testing.assert_array_equal(x, x_ref)
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_stage_order(max_workers, monkeypatch):
+    events = []
+    lock = threading.Lock()
+
+    def _stage(stage):
+        def run(self):
+            with lock:
+                events.append(('start', stage))
+            with lock:
+                events.append(('end', stage))
+            return stage
+        return run
+
+    for stage in STAGES:
+        monkeypatch.setattr(Pipeline, f'_{stage}', _stage(stage))
+    with Pipeline('data', 'PICKLE', T0, T0 + 60, max_workers=max_workers) as pipeline:
+        assert pipeline.run() == {stage: stage for stage in STAGES}
+    # Each stage starts after the stages it needs have ended, and runs once
+    assert sorted(stage for kind, stage in events if kind == 'start') == sorted(STAGES)
+    for stage, needs in NEEDS.items():
+        start = events.index(('start', stage))
+        assert all(events.index(('end', need)) < start for need in needs)
+
+
+@pytest.mark.parametrize('max_workers, concurrent', [(3, True), (1, False)])
+def test_concurrent_stages(max_workers, concurrent, monkeypatch):
+    # Audio and spectrograms both need the filtered data only; each waits for
+    # the other to start, which only works if they run at the same time
+    barrier = threading.Barrier(2, timeout=10 if concurrent else 0.5)
+
+    def _wait(self):
+        barrier.wait()
+        return 'done'
+
+    monkeypatch.setattr(Pipeline, '_audio', _wait)
+    monkeypatch.setattr(Pipeline, '_stft', _wait)
+    with Pipeline('data', 'PICKLE', T0, T0 + 60, max_workers=max_workers) as pipeline:
+        pipeline.results['filter'] = None
+        if concurrent:
+            results = pipeline.run(('audio', 'stft'))
+            assert results['audio'] == results['stft'] == 'done'
+        else:
+            with pytest.raises(threading.BrokenBarrierError):
+                pipeline.run(('audio', 'stft'))
@@ -0,0 +1,53 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from prefetch import prefetch  # noqa: E402
+
+
+def test_prefetch_order_and_errors():
+    def load(item):
+        time.sleep(0.01 * (item % 3))  # Out of step with the consumer
+        if item == 4:
+            raise RuntimeError('bad item')
+        return item * 10
+
+    results = []
+    with pytest.raises(RuntimeError, match='bad item'):
+        for item, loaded in prefetch(range(6), load, ahead=3):
+            results.append((item, loaded))
+    assert results == [(i, i * 10) for i in range(4)]
+
+
+@pytest.mark.parametrize('ahead, memory_budget, max_waiting', [(1, None, 0), (5, 2.5, 1)])
+def test_prefetch_bounds(ahead, memory_budget, max_waiting):
+    counts = dict(loaded=0, used=0)
+    waiting = []
+
+    def load(item):
+        waiting.append(counts['loaded'] - counts['used'])  # Before this one
+        counts['loaded'] += 1
+        return item
+
+    for item, _ in prefetch(range(8), load, ahead=ahead, memory_budget=memory_budget,
+                            nbytes=lambda _: 1):
+        counts['used'] += 1
+        time.sleep(0.02)  # Slow consumer, so the loader runs ahead
+    assert max(waiting) <= max_waiting + 1  # The item being used counts too
+
+
+def test_prefetch_release():
+    with pytest.raises(ValueError):
+        list(prefetch([1, 2], lambda x: x, ahead=0))
+
+    released = []
+    items = prefetch(range(5), lambda x: x, ahead=2, release=released.append)
+    next(items)
+    time.sleep(0.2)  # Let the loader fill up
+    items.close()
+    time.sleep(0.2)
+    assert released == [1, 2]
@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from psd_summary import build_summary, load_summary, loudest_windows  # noqa: E402
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 200
+
+
+@pytest.fixture
+def gappy_folder(tmp_path):
+    """
+    White noise over 00:00–00:40 and 00:54–01:30, twice as loud after the gap.
+    """
+
+    path = tmp_path / 'data'
+    path.mkdir()
+    rng = np.random.default_rng(0)
+    for start, end, std in [(0, 40, 1), (54, 90, 2)]:
+        tr = Trace(rng.normal(0, std, (end - start) * 60 * FS),
+                   header=dict(station='A', channel='HHZ', sampling_rate=FS,
+                               starttime=T0 + start * 60))
+        Stream([tr]).write(str(path / f'{start:02d}.pickle'), format='PICKLE')
+    return str(path), tr.id
+
+
+def test_build_summary_gap(gappy_folder, tmp_path):
+    path, tr_id = gappy_folder
+    build_summary(path, 'PICKLE', tmp_path / 'summary', T0, T0 + 90 * 60)
+    summary = load_summary(tmp_path / 'summary', tr_id, T0, T0 + 90 * 60)
+    np.testing.assert_allclose(summary['time'], T0.timestamp + 600 * np.arange(9))
+
+    # The window within the gap has no data; the one 60 % covered is
+    # summarized from its data alone, as loud as those fully covered
+    band = summary['bands'].index((1, 5))
+    rms = summary['rms'][:, band]
+    assert np.isnan(rms[4]) and np.isnan(summary['psd'][4]).all()
+    expected = np.sqrt(4 * 2 / FS) * np.array([1, 1, 1, 1, np.nan, 2, 2, 2, 2])
+    np.testing.assert_allclose(rms, expected, rtol=0.1)
+    assert np.nanmax(np.abs(np.diff(summary['psd'][5:], axis=0))) < 3  # [dB]
+
+    loudest = loudest_windows(tmp_path / 'summary', tr_id, T0, T0 + 90 * 60, (1, 5),
+                              num_windows=9)
+    assert sorted(start - T0 for start, *_ in loudest[:4]) == [3000, 3600, 4200, 4800]
+    assert np.isnan(loudest[-1][2])
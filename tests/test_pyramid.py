@@ -0,0 +1,58 @@
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pyramid import _read_columns, build_pyramid  # noqa: E402
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 20
+BURST = 3600 + 990  # [s] Center of a 10 s tone burst after T0
+
+
+def _write_folder(path, duration):
+    t = np.arange(int(duration * FS)) / FS
+    data = np.random.default_rng(0).normal(0, 0.01, t.size)
+    burst = np.abs(t - BURST) < 5
+    data[burst] += np.sin(2 * np.pi * 3 * t[burst])
+    tr = Trace(data, header=dict(station='A', channel='HHZ', sampling_rate=FS, starttime=T0))
+    Stream([tr]).write(str(path / 'data.pickle'), format='PICKLE')
+    return tr.id
+
+
+@pytest.mark.parametrize('quality, hop', [('publication', 2.5), ('draft', 5)])
+def test_pyramid_column_times(tmp_path, quality, hop):
+    (tmp_path / 'data').mkdir()
+    tr_id = _write_folder(tmp_path / 'data', 3 * 3600)
+    build_pyramid(str(tmp_path / 'data'), 'PICKLE', tmp_path / 'pyramid', T0, T0 + 3 * 3600,
+                  freqmin=1, freqmax=8, dtype='float16', quality=quality)
+    channel_dir = tmp_path / 'pyramid' / tr_id
+
+    meta = json.loads((channel_dir / 'meta.json').read_text())
+    assert meta['hop'] == hop
+
+    # The STFT columns are centered on the slots of the finest level
+    times, sxx_db = _read_columns(channel_dir, meta, 'minute', T0.timestamp, T0.timestamp + 7200)
+    has_data = ~np.isnan(sxx_db[0])
+    assert has_data[1:].all()  # The first column would need data before T0
+    np.testing.assert_allclose(times, T0.timestamp + hop * np.arange(times.size))
+    peak = times[np.nanargmax(sxx_db.max(axis=0))]
+    assert abs(peak - (T0.timestamp + BURST)) <= hop / 2
+
+    # Coarser columns are centered on the finer columns they average
+    times, sxx_db = _read_columns(channel_dir, meta, 'hour', T0.timestamp, T0.timestamp + 7200)
+    assert times[np.nanargmax(sxx_db.max(axis=0))] == T0.timestamp + BURST
+
+
+def test_pyramid_without_columns(tmp_path):
+    (tmp_path / 'data').mkdir()
+    tr = Trace(np.zeros(2 * FS), header=dict(station='A', channel='HHZ', sampling_rate=FS,
+                                              starttime=T0))
+    Stream([tr]).write(str(tmp_path / 'data' / 'data.pickle'), format='PICKLE')
+    assert build_pyramid(str(tmp_path / 'data'), 'PICKLE', tmp_path / 'pyramid', T0,
+                         T0 + 60, freqmin=1, freqmax=8) == []
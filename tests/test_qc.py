@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from qc import bad_ranges, clean_trace, scan  # noqa: E402
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 10
+CLIP = 100
+
+
+@pytest.fixture
+def report(tmp_path):
+    """
+    Report of two 100 s files with NaN, infinite and clipped samples, and the
+    merged trace with a boolean array of its bad samples.
+    """
+
+    path = tmp_path / 'data'
+    path.mkdir()
+    rng = np.random.default_rng(0)
+    traces = []
+    for start, bad in [(0, [(5, 8, np.nan), (500, 501, np.inf), (999, 1000, CLIP)]),
+                       (100, [(0, 3, -CLIP), (200, 201, np.nan)])]:
+        tr = Trace(rng.normal(size=100 * FS), header=dict(station='A', channel='HHZ',
+                                                          sampling_rate=FS,
+                                                          starttime=T0 + start))
+        for i0, i1, value in bad:
+            tr.data[i0:i1] = value
+        Stream([tr]).write(str(path / f'{start:03d}.pickle'), format='PICKLE')
+        traces.append(tr)
+    merged = Stream(traces).merge()[0]
+    is_bad = ~np.isfinite(merged.data) | (np.abs(merged.data) >= CLIP)
+
+    report = str(tmp_path / 'report.sqlite')
+    assert scan(report, [str(path)], 'PICKLE', clip=CLIP, max_workers=1) == (2, 0)
+    return report, merged, is_bad
+
+
+def test_bad_ranges(report):
+    report, merged, _ = report
+    ranges = bad_ranges(report, merged.id, T0, T0 + 200)
+    expected = [(0.5, 0.7), (50, 50), (99.9, 99.9), (100, 100.2), (120, 120)]
+    assert [(start - T0, end - T0) for start, end in ranges] == pytest.approx(expected)
+    # Only the ranges overlapping the interval
+    ranges = bad_ranges(report, merged.id, T0 + 60, T0 + 100.1)
+    assert [(start - T0, end - T0) for start, end in ranges] == pytest.approx(
+        [(99.9, 99.9), (100, 100.2)]
+    )
+    assert bad_ranges(report, 'XX.B..HHZ', T0, T0 + 200) == []
+
+
+@pytest.mark.parametrize('start, end', [(0, 200), (0.6, 100.1), (120, 120)])
+def test_clean_trace(report, start, end):
+    report, merged, is_bad = report
+    tr = merged.slice(T0 + start, T0 + end).copy()
+    i0 = int(round(start * FS))
+    expected = np.where(is_bad[i0:i0 + tr.stats.npts], 0, tr.data)
+    assert clean_trace(tr, report) == np.count_nonzero(is_bad[i0:i0 + tr.stats.npts])
+    np.testing.assert_array_equal(tr.data, expected)
+
+    # The same after shifting the trace, e.g. to local time
+    tr = merged.slice(T0 + start, T0 + end).copy()
+    tr.stats.starttime += 3600
+    clean_trace(tr, report, time_shift=3600)
+    np.testing.assert_array_equal(tr.data, expected)
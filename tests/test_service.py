@@ -0,0 +1,70 @@
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import service  # noqa: E402
+
+
+def _fake_job(kwargs, job_dir, key):
+    """
+    Stand-in for :func:`service._run_job` that counts its runs next to the
+    job directories and fails for `log=True`.
+    """
+
+    time.sleep(0.5)
+    with open(job_dir.parent / 'runs.txt', 'a') as f:
+        f.write(f'{job_dir.name}\n')
+    if kwargs['log']:
+        raise RuntimeError('render failed')
+    job_dir.mkdir(parents=True, exist_ok=True)
+    output = job_dir / 'out.mp4'
+    output.write_text('video')
+    return output
+
+
+@pytest.fixture
+def render_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(service, '_run_job', _fake_job)
+    render_service = service.RenderService(tmp_path / 'cache', max_workers=2, max_entries=2)
+    yield render_service
+    render_service.shutdown()
+
+
+def _params(tmp_path, **kwargs):
+    params = dict(path_data=str(tmp_path), format_in='PICKLE',
+                  starttime='2021-10-09T12:50:00', endtime='2021-10-09T13:00:00')
+    params.update(kwargs)
+    return params
+
+
+def test_coalescing_and_cache(tmp_path, render_service):
+    jid, future = render_service.submit(_params(tmp_path, speed_up_factor=200))
+    # Equivalent requests join the running job
+    jid2, future2 = render_service.submit(
+        _params(tmp_path, speed_up_factor=200.0, fps=1, endtime='2021-10-09 13:00')
+    )
+    assert (jid2, future2) == (jid, future)
+    assert render_service.status(jid)['status'] in ('queued', 'running')
+
+    future.result()
+    assert render_service.status(jid)['status'] == 'done'
+    assert render_service.submit(_params(tmp_path))[1] is None  # Cached
+    assert (tmp_path / 'cache' / 'runs.txt').read_text().split() == [jid]
+
+
+def test_failed_jobs_are_bounded(tmp_path, render_service):
+    jids = []
+    for speed_up_factor in 100, 200, 300:
+        jid, future = render_service.submit(
+            _params(tmp_path, speed_up_factor=speed_up_factor, log=True)
+        )
+        with pytest.raises(RuntimeError):
+            future.result()
+        assert render_service.status(jid)['status'] == 'failed'
+        jids.append(jid)
+    assert render_service.status(jids[0]) is None  # Forgotten, oldest first
+    assert len(render_service.failed) == 2
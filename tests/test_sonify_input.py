@@ -0,0 +1,240 @@
+import shutil
+import subprocess
+import sys
+import wave
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import Pipeline  # noqa: E402
+from sonify_input import (  # noqa: E402
+    AUDIO_SAMPLE_RATE,
+    _changed_frames,
+    _output_stem,
+    _resample_audio,
+    _save_frames_vfr,
+    sonify_audio_batch,
+    sonify_input,
+    sonify_variants,
+)
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 100
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs FFmpeg')
+
+
+def _read_wav(audio_file):
+    with wave.open(str(audio_file), 'rb') as f:
+        assert f.getframerate() == AUDIO_SAMPLE_RATE
+        channels = f.getnchannels()
+        frames = np.frombuffer(f.readframes(f.getnframes()), dtype='<i4')
+    return frames.reshape(-1, channels)
+
+
+def _frame_times(video_file, stream='v'):
+    """
+    Presentation times of the video (or audio) frames of a file [s].
+    """
+
+    out = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', str(video_file), '-map', f'0:{stream}', '-c', 'copy',
+         '-f', 'framemd5', '-'],
+        capture_output=True, text=True, check=True,
+    ).stdout.splitlines()
+    num, den = next(line for line in out if line.startswith('#tb 0:')).split()[-1].split('/')
+    pts = [int(line.split(',')[2]) for line in out if not line.startswith('#')]
+    return np.array(sorted(pts)) * int(num) / int(den)
+
+
+def _frames(video_file, width, height):
+    """
+    Decoded video frames of a file in grayscale, of shape (frames, height,
+    width).
+    """
+
+    out = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', str(video_file), '-map', '0:v', '-f', 'rawvideo',
+         '-pix_fmt', 'gray', '-'],
+        capture_output=True, check=True,
+    ).stdout
+    return np.frombuffer(out, dtype=np.uint8).reshape(-1, height, width).astype(float)
+
+
+@pytest.fixture(scope='module')
+def folders(tmp_path_factory):
+    """
+    Folders of 40 min of noise for the X, Y and Z components of a geophone,
+    Y twice and Z three times as loud as X.
+    """
+
+    root = tmp_path_factory.mktemp('data')
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=40 * 60 * FS)
+    paths = []
+    for gain, component in enumerate('XYZ', start=1):
+        path = root / component
+        path.mkdir()
+        tr = Trace(gain * data, header=dict(network='CS', station='G0', location='00',
+                                            channel=component, sampling_rate=FS,
+                                            starttime=T0))
+        Stream([tr]).write(str(path / 'data.pickle'), format='PICKLE')
+        paths.append(str(path))
+    return paths
+
+
+def test_audio_only(folders, tmp_path):
+    audio_file = sonify_input(folders[0], 'PICKLE', T0 + 300, T0 + 900, speed_up_factor=100,
+                              output_dir=tmp_path, audio_only=True)
+    assert audio_file.suffix == '.wav'
+    assert sorted(tmp_path.iterdir()) == [audio_file]  # No figure or video
+
+    with Pipeline(folders[0], 'PICKLE', T0 + 300, T0 + 900, speed_up_factor=100) as pipeline:
+        tr_audio = _resample_audio(pipeline.run('filter')['filter'].trims[0], 100)
+    tr_audio.write(str(tmp_path / 'ref.wav'), format='WAV', framerate=AUDIO_SAMPLE_RATE,
+                   width=4, rescale=True)
+    frames, ref = _read_wav(audio_file), _read_wav(tmp_path / 'ref.wav')
+    assert frames.shape == ref.shape
+    assert np.abs(frames.astype(np.int64) - ref).max() <= 1  # Rounding
+
+
+def test_audio_batch(folders, tmp_path):
+    intervals = [(T0 + 300, T0 + 900), (T0 + 1200, T0 + 1500)]
+    audio_files = sonify_audio_batch(folders[0], 'PICKLE', intervals,
+                                     speed_up_factors=(100, 200), output_dir=tmp_path)
+    assert [f.name for f in audio_files] == [
+        'CS_G0_00_X_01-Jan-2021 at 00.05.00_100x.wav',
+        'CS_G0_00_X_01-Jan-2021 at 00.20.00_100x.wav',
+        'CS_G0_00_X_01-Jan-2021 at 00.05.00_200x.wav',
+        'CS_G0_00_X_01-Jan-2021 at 00.20.00_200x.wav',
+    ]
+    for audio_file, speed_up_factor, (start, end) in zip(
+        audio_files, (100, 100, 200, 200), intervals * 2
+    ):
+        # Played back speed_up_factor times faster
+        duration = _read_wav(audio_file).shape[0] / AUDIO_SAMPLE_RATE
+        assert duration == pytest.approx((end - start) / speed_up_factor, abs=1e-3)
+
+
+@pytest.mark.parametrize(
+    'ids, stem',
+    [
+        (['CS.G0.00.X'], 'CS_G0_00_X'),
+        (['CS.G0.00.X', 'CS.G0.00.Y', 'CS.G0.00.Z'], 'CS_G0_00_X-Y-Z'),
+        (['CS.G0.00.X', 'CS.G1.00.X'], 'CS_G0_00_X-G1_00_X'),
+        (['.G0..X', '.G0..Y'], 'G0_X-Y'),
+        (['CS.G0.00.X', 'CS.G0.00.X'], 'CS_G0_00_X-X'),
+    ],
+)
+def test_output_stem(ids, stem):
+    traces = []
+    for tr_id in ids:
+        network, station, location, channel = tr_id.split('.')
+        traces.append(Trace(header=dict(network=network, station=station, location=location,
+                                        channel=channel, starttime=T0)))
+    assert _output_stem(traces, 200) == f'{stem}_01-Jan-2021 at 00.00.00_200x'
+
+
+def test_multichannel_audio(folders, tmp_path):
+    audio_file = sonify_input(folders, 'PICKLE', T0 + 300, T0 + 900, speed_up_factor=100,
+                              output_dir=tmp_path, audio_only=True)
+    assert audio_file.name == 'CS_G0_00_X-Y-Z_01-Jan-2021 at 00.05.00_100x.wav'
+    frames = _read_wav(audio_file).astype(float)
+    assert frames.shape[1] == 3
+    # One scaling for all channels keeps their relative amplitudes
+    assert np.abs(frames).max() == pytest.approx(2**31 - 1, abs=1)
+    np.testing.assert_allclose(frames[:, 1], 2 * frames[:, 0], rtol=0, atol=2)
+    np.testing.assert_allclose(frames[:, 2], 3 * frames[:, 0], rtol=0, atol=3)
+
+
+def test_changed_frames():
+    fig, ax = plt.subplots(figsize=(4, 2))
+    times = [T0 + 0.05 * i for i in range(200)]
+    ax.set_xlim(times[0].matplotlib_date, times[-1].matplotlib_date)
+    cursor = ax.axvline(times[0].matplotlib_date)
+    text = ax.text(0.5, 0.5, '', transform=ax.transAxes)
+    dpi = 50
+
+    def _image(frame):
+        cursor.set_xdata([times[frame].matplotlib_date] * 2)
+        text.set_text(times[frame].strftime('%H:%M:%S'))
+        fig.set_dpi(dpi)
+        fig.canvas.draw()
+        return np.asarray(fig.canvas.buffer_rgba()).copy()
+
+    changed = _changed_frames(fig, ax, times, dpi)
+    assert changed[0] == 0 and 0 < changed.size < len(times)
+    # The frames left out are those identical to the frame held in their place
+    previous = _image(0)
+    for frame in range(1, len(times)):
+        image = _image(frame)
+        assert (frame in changed) == (not np.array_equal(image, previous))
+        previous = image
+    plt.close(fig)
+
+
+@needs_ffmpeg
+def test_save_frames_vfr(tmp_path):
+    fig, ax = plt.subplots(figsize=(2, 2))
+    cursor = ax.axvline(0)
+    ax.set_xlim(0, 8)
+
+    def _update(frame):
+        cursor.set_xdata([frame, frame])
+
+    frames = np.array([0, 3, 5])
+    _save_frames_vfr(fig, _update, [], frames, 8, 2, 50, tmp_path / 'video.mp4')
+    plt.close(fig)
+    # Each frame is shown at its time in the constant frame rate animation
+    np.testing.assert_allclose(_frame_times(tmp_path / 'video.mp4'), frames / 2)
+
+
+@needs_ffmpeg
+def test_renderers(folders, tmp_path):
+    frames = {}
+    for renderer in 'matplotlib', 'ffmpeg':
+        video_file = sonify_input(folders, 'PICKLE', T0 + 300, T0 + 900, speed_up_factor=100,
+                                  output_dir=tmp_path / renderer, renderer=renderer,
+                                  quality='draft')
+        assert video_file.name == 'CS_G0_00_X-Y-Z_01-Jan-2021 at 00.05.00_100x.mp4'
+        # 6 s of video at the 1 fps of the draft preset, with the soundtrack
+        np.testing.assert_allclose(_frame_times(video_file), np.arange(6))
+        assert _frame_times(video_file, 'a').size
+        frames[renderer] = _frames(video_file, 640, 360)
+
+    # The same picture up to antialiasing; compare 8 x 8 pixel blocks to
+    # average out the one-pixel shifts of the spectrogram cells
+    blocks = {
+        renderer: f.reshape(f.shape[0], 45, 8, 80, 8).mean(axis=(2, 4))
+        for renderer, f in frames.items()
+    }
+    assert np.abs(blocks['matplotlib'] - blocks['ffmpeg']).mean() < 8  # [gray levels]
+
+
+@needs_ffmpeg
+def test_variants(folders, tmp_path):
+    variants = [dict(speed_up_factor=100), dict(speed_up_factor=200, fps=2)]
+    video_files = sonify_variants(folders[0], 'PICKLE', T0 + 300, T0 + 900, variants,
+                                  output_dir=tmp_path / 'variants', max_workers=1,
+                                  quality='draft')
+    assert [f.name for f in video_files] == [
+        'CS_G0_00_X_01-Jan-2021 at 00.05.00_100x_crude_1fps.mp4',
+        'CS_G0_00_X_01-Jan-2021 at 00.05.00_200x_crude_2fps.mp4',
+    ]
+    np.testing.assert_allclose(_frame_times(video_files[0]), np.arange(6))
+    np.testing.assert_allclose(_frame_times(video_files[1]), np.arange(6) / 2)
+    assert sorted(f.name for f in (tmp_path / 'variants').glob('*.wav')) == [
+        'CS_G0_00_X_01-Jan-2021 at 00.05.00_100x.wav',
+        'CS_G0_00_X_01-Jan-2021 at 00.05.00_200x.wav',
+    ]
+
+    # The same as a render of its own
+    video_file = sonify_input(folders[0], 'PICKLE', T0 + 300, T0 + 900, speed_up_factor=100,
+                              output_dir=tmp_path / 'single', quality='draft')
+    diff = _frames(video_files[0], 640, 360) - _frames(video_file, 640, 360)
+    assert np.abs(diff).mean() < 1  # [gray levels]
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Trace, UTCDateTime
+from scipy import signal
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sonify_input import QUALITY_PRESETS, _compute_spectrogram  # noqa: E402
+from spectral import compute_spectrograms, power_spectrograms, stft_params  # noqa: E402
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 50
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_power_spectrograms_match_scipy(dtype):
+    data = np.random.default_rng(0).normal(size=(3, 20_000)).astype(dtype)
+    nperseg, noverlap, nfft = stft_params(FS, 5)
+    f, t, sxx = power_spectrograms(data, FS, nperseg, noverlap, nfft, workers=1)
+    for row, sxx_row in zip(data, sxx):
+        f_ref, t_ref, sxx_ref = signal.spectrogram(
+            row, FS, window='hann', nperseg=nperseg, noverlap=noverlap, nfft=nfft
+        )
+        np.testing.assert_allclose(f, f_ref)
+        np.testing.assert_allclose(t, t_ref)
+        assert sxx_row.dtype == sxx_ref.dtype
+        np.testing.assert_allclose(sxx_row, sxx_ref, rtol=1e-4 if dtype == np.float32 else 1e-10)
+
+
+@pytest.mark.parametrize('quality', QUALITY_PRESETS.keys())
+def test_compute_spectrograms_groups(quality):
+    rng = np.random.default_rng(0)
+    traces = [
+        Trace(rng.normal(size=10_000), header=dict(sampling_rate=FS, starttime=T0)),
+        Trace(rng.normal(size=10_000), header=dict(sampling_rate=FS, starttime=T0)),
+        Trace(rng.normal(size=8_000), header=dict(sampling_rate=FS, starttime=T0 + 10)),
+        Trace(rng.normal(size=5_000), header=dict(sampling_rate=2 * FS, starttime=T0)),
+    ]
+    preset = QUALITY_PRESETS[quality]
+    specs = compute_spectrograms(traces, 5, 1, workers=1, zero_pad=preset['zero_pad'],
+                                 overlap=preset['overlap'])
+    for tr, (f, t_mpl, sxx_db) in zip(traces, specs):
+        f_ref, t_ref, sxx_db_ref = _compute_spectrogram(tr, 5, 1, quality=quality)
+        np.testing.assert_allclose(f, f_ref)
+        np.testing.assert_allclose(t_mpl, t_ref, rtol=0, atol=1e-9)
+        np.testing.assert_allclose(sxx_db, sxx_db_ref, rtol=0, atol=1e-8)
@@ -0,0 +1,69 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from filtering import CausalFilter  # noqa: E402
+from sonify_input import (  # noqa: E402
+    QUALITY_PRESETS,
+    _compute_spectrogram,
+    _IncrementalSpectrogram,
+)
+from tail import _LiveTrace  # noqa: E402
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 50
+
+
+@pytest.mark.parametrize('quality', QUALITY_PRESETS.keys())
+@pytest.mark.parametrize('block_size', [100, 999, 30_000])
+def test_incremental_spectrogram(quality, block_size):
+    tr = Trace(np.random.default_rng(0).normal(size=30_000),
+               header=dict(sampling_rate=FS, starttime=T0))
+    spec = _IncrementalSpectrogram(FS, 5, T0, quality=quality)
+    for i in range(0, tr.stats.npts, block_size):
+        spec.extend(tr.data[i:i + block_size])
+    f, t_mpl, sxx_db = spec.between(T0, tr.stats.endtime + 1 / FS)
+
+    f_ref, t_ref, sxx_db_ref = _compute_spectrogram(tr, 5, 1, quality=quality)
+    np.testing.assert_allclose(f, f_ref)
+    np.testing.assert_allclose(t_mpl, t_ref, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(sxx_db, sxx_db_ref, rtol=0, atol=1e-8)
+
+
+def test_live_trace_gap():
+    """
+    Files with a short gap give the causally filtered, zero-filled merge of the
+    files; a gap longer than the window starts over.
+    """
+
+    rng = np.random.default_rng(0)
+    files = [
+        Trace(rng.normal(size=60 * FS), header=dict(station='A', channel='HHZ',
+                                                    sampling_rate=FS, starttime=T0 + start))
+        for start in (0, 60, 130, 190)  # 10 s gap before the third file
+    ]
+    live = _LiveTrace(files[0], 600, 200, 1, 10, 5)
+    for tr in files:
+        live.extend(Stream([tr]))
+
+    merged = Stream([tr.copy() for tr in files]).merge(method=0, fill_value=0)[0]
+    merged.data = CausalFilter(live.stages, FS)(merged.data.astype(np.float64))
+    assert live.starttime == T0
+    np.testing.assert_allclose(live.data, merged.data, rtol=0, atol=1e-10)
+    _, t_mpl, sxx_db = live.spec.between(T0, live.endtime)
+    _, t_ref, sxx_db_ref = _compute_spectrogram(merged, 5, 1, quality='standard')
+    np.testing.assert_allclose(t_mpl, t_ref, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(sxx_db, sxx_db_ref, rtol=0, atol=1e-8)
+
+    resets = []
+    tr = files[0].copy()
+    tr.stats.starttime = T0 + 2000
+    live.extend(Stream([tr]), before_reset=lambda: resets.append(live.num_unsent))
+    assert resets == [250 * FS]
+    assert live.starttime == tr.stats.starttime
+    np.testing.assert_allclose(live.data, CausalFilter(live.stages, FS)(tr.data))
@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from obspy import Stream, Trace, UTCDateTime
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from triggers import detect_events, merge_windows  # noqa: E402
+
+T0 = UTCDateTime(2021, 1, 1)
+FS = 50
+BURST = 90 * 60  # [s] Start of a 30 s burst after T0
+
+
+@pytest.fixture
+def gappy_folder(tmp_path):
+    """
+    Noise over 00:00–00:40 and 01:00–02:00 with a burst at 01:30.
+    """
+
+    rng = np.random.default_rng(0)
+    for start, end in [(0, 40 * 60), (60 * 60, 120 * 60)]:
+        t = start + np.arange((end - start) * FS) / FS
+        data = rng.normal(size=t.size)
+        burst = (t >= BURST) & (t < BURST + 30)
+        data[burst] *= 20
+        tr = Trace(data, header=dict(station='A', channel='HHZ', sampling_rate=FS,
+                                     starttime=T0 + start))
+        Stream([tr]).write(str(tmp_path / f'{start:05d}.pickle'), format='PICKLE')
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize('method', ['sta_lta', 'energy'])
+def test_detect_events_gap(gappy_folder, method):
+    # Neither the gap nor its edges trigger, only the burst
+    events = detect_events(gappy_folder, 'PICKLE', T0, T0 + 7200, method=method,
+                           freqmin=1, freqmax=20)
+    assert len(events) == 1
+    on, off = events[0]
+    assert abs(on - (T0 + BURST)) <= 10
+    assert T0 + BURST + 20 <= off <= T0 + BURST + 60
+
+
+def test_merge_windows():
+    events = [(T0 + 1000, T0 + 1010), (T0 + 1500, T0 + 1520), (T0 + 5000, T0 + 5001)]
+    assert merge_windows(events, pad=300, min_gap=600) == [
+        (T0 + 700, T0 + 1820), (T0 + 4700, T0 + 5301)
+    ]
@@ -0,0 +1,250 @@
+"""
+Event-triggered rendering: find the active intervals of a data folder and
+sonify only those, instead of every interval of an exhaustive sweep.
+
+The data is streamed once (see :func:`~batch.iter_windows`) with the same
+filters as :func:`~sonify_input.sonify_input` and reduced to the mean energy
+of short blocks. Blocks that are mostly gap have no energy, and the averages
+start over after each gap. An STA/LTA ratio (or the ratio to the median
+background energy) of the block energies triggers events, which are padded and merged
+into windows that are then passed to :func:`~prefetch.sonify_jobs`.
+"""
+
+import time
+
+import numpy as np
+from obspy import UTCDateTime
+from obspy.signal.trigger import trigger_onset
+
+from batch import iter_windows
+from prefetch import sonify_jobs
+
+CHUNK = 6 * 60 * 60  # [s] Data filtered at a time during detection
+
+
+def detect_events(
+    path_data,
+    format_in,
+    starttime,
+    endtime,
+    method='sta_lta',
+    sta=10,
+    lta=600,
+    thr_on=3.5,
+    thr_off=1.5,
+    block=1,
+    freqmin=None,
+    freqmax=None,
+    speed_up_factor=200,
+):
+    """
+    Find active intervals of a data folder.
+
+    Args:
+        path_data (str): Path to data files
+        format_in (str): Format of data files
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        method (str): `'sta_lta'` for the ratio of the short-term to the
+            long-term average energy, or `'energy'` for the ratio of the
+            short-term average energy to the median energy of the whole span
+        sta (int or float): Short-term average duration [s]
+        lta (int or float): Long-term average duration [s] (`'sta_lta'` only)
+        thr_on (float): Ratio that starts an event
+        thr_off (float): Ratio that ends an event
+        block (int or float): Duration of the energy blocks [s]; the time
+            resolution of the detection
+        freqmin (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        freqmax (int or float): See docstring for
+            :func:`~sonify_input.sonify_input`
+        speed_up_factor (int): Used for the default bandpass corners
+
+    Returns:
+        List of (`on`, `off`) tuples of
+        :class:`~obspy.core.utcdatetime.UTCDateTime`
+    """
+
+    if method not in ('sta_lta', 'energy'):
+        raise ValueError("Method must be 'sta_lta' or 'energy'")
+
+    # Mean energy per block, one chunk of filtered data at a time
+    energies, times = [], []
+    leftover, t_next = np.ma.masked_array(np.empty(0)), None
+    for _, _, tr, _ in iter_windows(
+        path_data,
+        format_in,
+        starttime,
+        endtime,
+        CHUNK,
+        freqmin=freqmin,
+        freqmax=freqmax,
+        speed_up_factor=speed_up_factor,
+        spec_win_dur=None,
+        masked=True,
+    ):
+        fs = tr.stats.sampling_rate
+        npts_block = int(round(block * fs))
+        # Gaps are filled in (and masked), but chunks before the first data
+        # are skipped; don't join blocks across them
+        if t_next is None or abs(tr.stats.starttime - t_next) > 0.5 / fs:
+            leftover = np.ma.masked_array(np.empty(0))
+        # Chunks share their edge sample; keep it in the next one only
+        new = tr.data[:int(round(CHUNK * fs))]
+        t_data = tr.stats.starttime - leftover.size / fs
+        t_next = tr.stats.starttime + new.size / fs
+        data = np.ma.concatenate([leftover, new])
+        num_blocks = data.size // npts_block
+        blocks = data[:num_blocks * npts_block].reshape(num_blocks, npts_block)
+        # Energy of the samples with data; none for blocks that are mostly gap
+        energy = np.ma.mean(blocks**2, axis=1).filled(np.nan)
+        energy[np.ma.count(blocks, axis=1) < npts_block / 2] = np.nan
+        energies.append(energy)
+        times.append(t_data.timestamp + np.arange(num_blocks) * npts_block / fs)
+        leftover = data[num_blocks * npts_block:]
+    if not energies:
+        return []
+
+    # Blocks on a regular grid, without energy (NaN) in gaps
+    times = np.concatenate(times)
+    t_first = UTCDateTime(times[0])
+    index = np.round((times - times[0]) / block).astype(int)
+    energy = np.full(index[-1] + 1, np.nan)
+    energy[index] = np.concatenate(energies)
+    if np.isnan(energy).all():
+        return []
+
+    # The averages start over after each gap, so that the zeros filled in do
+    # not pull the LTA down and trigger when the data resumes
+    nsta = max(int(round(sta / block)), 1)
+    nlta = max(int(round(lta / block)), nsta + 1)
+    background = max(np.nanmedian(energy), np.finfo(float).tiny)
+    cft = np.zeros(energy.size)
+    edges = np.flatnonzero(np.diff(np.r_[0, ~np.isnan(energy), 0]))
+    for i0, i1 in zip(edges[::2], edges[1::2]):
+        run = energy[i0:i1]
+        sta_energy = _moving_average(run, nsta)
+        if method == 'sta_lta':
+            lta_energy = np.maximum(_moving_average(run, nlta), np.finfo(float).tiny)
+            cft[i0:i1] = sta_energy / lta_energy
+            cft[i0:min(i0 + nlta, i1)] = 0  # LTA not settled yet
+        else:
+            cft[i0:i1] = sta_energy / background
+
+    events = [
+        (t_first + on * block, t_first + (off + 1) * block)
+        for on, off in trigger_onset(cft, thr_on, thr_off)
+    ]
+    print(f'{len(events)} events detected')
+    return events
+
+
+def merge_windows(events, pad=300, min_gap=600):
+    """
+    Pad events and merge those that overlap or are close into windows.
+
+    Args:
+        events (list): (`on`, `off`) tuples of
+            :class:`~obspy.core.utcdatetime.UTCDateTime`
+        pad (int or float): Time added before and after each event [s]
+        min_gap (int or float): Windows closer than this are merged [s]
+
+    Returns:
+        Sorted list of (`starttime`, `endtime`) tuples
+    """
+
+    windows = []
+    for on, off in sorted(events):
+        start, end = on - pad, off + pad
+        if windows and start - windows[-1][1] < min_gap:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def sonify_events(
+    path_data,
+    format_in,
+    starttime,
+    endtime,
+    pad=300,
+    min_gap=600,
+    interval=6 * 60 * 60,
+    detection=None,
+    **kwargs,
+):
+    """
+    Detect the active intervals of a data folder and sonify only those.
+
+    Prints a report comparing the rendered data duration with that of an
+    exhaustive sweep over `interval`-long windows.
+
+    Args:
+        path_data (str): Path to data files
+        format_in (str): Format of data files
+        starttime (:class:`~obspy.core.utcdatetime.UTCDateTime`): Start time
+        endtime (:class:`~obspy.core.utcdatetime.UTCDateTime`): End time
+        pad (int or float): See docstring for :func:`merge_windows`
+        min_gap (int or float): See docstring for :func:`merge_windows`
+        interval (int or float): Window duration of the exhaustive sweep
+            used for the report [s]
+        detection (dict): Keyword arguments of :func:`detect_events`
+        **kwargs: Passed to :func:`~prefetch.sonify_jobs` (the bandpass
+            arguments are also used for the detection)
+
+    Returns:
+        Dict with the `'windows'` rendered, their `'outputs'` and the
+        `'rendered'` and `'total'` data durations [s] and wall-clock
+        `'detect_time'` and `'render_time'` [s]
+    """
+
+    detection = dict(detection or {})
+    for name in 'freqmin', 'freqmax', 'speed_up_factor':
+        if name in kwargs:
+            detection.setdefault(name, kwargs[name])
+
+    t = time.time()
+    events = detect_events(path_data, format_in, starttime, endtime, **detection)
+    windows = [
+        (max(start, starttime), min(end, endtime))
+        for start, end in merge_windows(events, pad=pad, min_gap=min_gap)
+    ]
+    detect_time = time.time() - t
+
+    # The data of the next window is read while the current one renders
+    t = time.time()
+    outputs = sonify_jobs(
+        [(path_data, start, end) for start, end in windows], format_in, **kwargs
+    )
+    render_time = time.time() - t
+
+    total = endtime - starttime
+    rendered = sum(end - start for start, end in windows)
+    num_intervals = int(np.ceil(total / interval))
+    print(
+        f'Rendered {len(windows)} windows with {rendered / 3600:.1f} h of data '
+        f'instead of {num_intervals} intervals with {total / 3600:.1f} h '
+        f'({1 - rendered / total:.0%} less). Detection took {detect_time:.0f} s, '
+        f'rendering {render_time:.0f} s'
+    )
+    return dict(
+        windows=windows,
+        outputs=outputs,
+        rendered=rendered,
+        total=total,
+        detect_time=detect_time,
+        render_time=render_time,
+    )
+
+
+def _moving_average(x, n):
+    """
+    Trailing moving average over `n` samples (shorter at the start).
+    """
+
+    csum = np.cumsum(np.r_[0, x])
+    out = np.empty_like(x)
+    out[n:] = (csum[n + 1:] - csum[1:-n]) / n
+    out[:n] = csum[1:n + 1] / np.arange(1, min(n, x.size) + 1)
+    return out
@@ -2,7 +2,7 @@
 Generate audio and video from infrasound seismic data
 """
 
-from sonify_ext.sonify_input import sonify_input
+from sonify_ext.batch import sonify_windows
 from obspy import UTCDateTime
 from tqdm import tqdm
 
@@ -45,26 +45,26 @@ interval = 6 * 60 * 60  # In seconds
 Generate audio and video for every geophone and channel
 """
 # Process every source of data: geophone and channel
-for path_i in path_data:
-    # Date preprocessing
-    if starttime:
-        starttime = UTCDateTime(starttime)
-    if endtime:
-        endtime = UTCDateTime(endtime)
-
-    # Process every time interval
-    for i in tqdm(range(int(starttime.timestamp), int(endtime.timestamp) + 1, interval)):
-        sonify_input(
-            path_data=path_i,
-            format_in='PICKLE',
-            starttime=UTCDateTime(i),
-            endtime=UTCDateTime(i+interval-1),
-            freqmin=20/200,
-            freqmax=20000/200,
-            speed_up_factor=200,
-            fps=10,  # Use fps=60 to ~recreate the JHEPC entry (slow to save!)
-            output_dir='../results/audios',
-            spec_win_dur=8,
-            db_lim='smart',
-        )
+# Date preprocessing
+if starttime:
+    starttime = UTCDateTime(starttime)
+if endtime:
+    endtime = UTCDateTime(endtime)
 
+for path_i in tqdm(path_data):
+    # Every time interval in a single sweep over the files
+    sonify_windows(
+        path_data=path_i,
+        format_in='PICKLE',
+        starttime=starttime,
+        endtime=endtime + 1,
+        window=interval - 1,
+        step=interval,
+        freqmin=20/200,
+        freqmax=20000/200,
+        speed_up_factor=200,
+        fps=10,  # Use fps=60 to ~recreate the JHEPC entry (slow to save!)
+        output_dir='../results/audios',
+        spec_win_dur=8,
+        db_lim='smart',
+    )
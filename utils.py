@@ -43,55 +43,67 @@ def read_data_from_folder(path_data, format, starttime, endtime, verbose=True):
     return st
 
 
+def read_data_file(file, format):
+    """
+    Read a single data file, e.g. a file that has just been added to a folder.
+
+    Arguments
+    - file: Path of the data file.
+    - format: Format of the data file ('bz2' for a compressed pickled Stream).
+
+    Return: A sorted and merged (gaps filled with zeros) ObsPy Stream object.
+    """
+
+    if format.lower() == 'bz2':
+        st = read_stream_bz2_pickle(file)
+    else:
+        st = obspy.read(file, format=format)
+    st.sort(['starttime'])
+    st.merge(method=0, fill_value=0)
+    return st
+
+
+def index_ranges(mask, join=0):
+    """
+    Run-length encode a boolean array.
+
+    Arguments
+    - mask: 1-D boolean array.
+    - join: Runs separated by at most this many False values are joined into one.
+
+    Return: Integer array of shape (runs, 2) with the first and one past the last index of each run of True values.
+    """
+    padded = np.concatenate(([False], mask, [False]))
+    ranges = np.flatnonzero(padded[1:] != padded[:-1]).reshape(-1, 2)
+    if join and ranges.shape[0] > 1:
+        keep = ranges[1:, 0] - ranges[:-1, 1] > join
+        ranges = np.column_stack([ranges[np.r_[True, keep], 0], ranges[np.r_[keep, True], 1]])
+    return ranges
+
+
 def detect_anomalies(stream, abs_th):
-    # Detection of anomalous values
+    # Detection of anomalous values: not-a-number (NaN), infinite and very
+    # large values, reported as ranges of indexes
     for i, tr in enumerate(stream):
-        # Detection of not-a-number values
-        indnan = np.isnan(tr.data)
-        if any(indnan):
-            print(f'List of indexes containing a not-a-number value (NaN) in Trace {i}:')
-            print(f'Indexes: {np.where(indnan)}')
-        """
-        else:
-            print(f'Trace {i} does not contain not-a-number values (NaN)')
-        """
-
-        # Detection of infinite values
-        indinf = np.isinf(tr.data)
-        if any(indinf):
-            print(f'List of indexes containing a infinite value (inf) in Trace {i}:')
-            print(f'Indexes: {np.where(indinf)}')
-        """
-        else:
-            print(f'Trace {i} does not contain infinite values (inf)')
-        """
-
-        # Detection of very large values
-        indlarge = abs(tr.data) > abs_th
-        if any(indlarge):
-            print(f'Indexes: {np.where(indlarge)}')
-            print(f'Values: {tr.data[indlarge]}')
-        """
-        else:
-            print(f'Trace {i} does not contain large values')
-        """
-        #st[0].data[ind] = val
+        checks = [
+            ('not-a-number values (NaN)', np.isnan(tr.data)),
+            ('infinite values (inf)', np.isinf(tr.data)),
+            (f'values larger than {abs_th}', np.abs(tr.data) > abs_th),
+        ]
+        for name, mask in checks:
+            if mask.any():
+                ranges = index_ranges(mask)
+                print(f'Trace {i} contains {np.count_nonzero(mask)} {name} in {len(ranges)} ranges of indexes:')
+                print(', '.join(f'{start}' if stop - start == 1 else f'{start}-{stop - 1}'
+                                for start, stop in ranges))
 
 
 def correct_data_anomalies(stream, abs_th):
-    # Correction of anomalous values
+    # Correction of anomalous values: not-a-number, infinite and very large
+    # values are set to zero
     for i, tr in enumerate(stream):
-        # Correction of not-a-number values
-        indnan = np.isnan(tr.data)
-        tr.data[indnan] = 0
-
-        # Correction of infinite values
-        indinf = np.isinf(tr.data)
-        tr.data[indinf] = 0
-
-         # Correction of very large values
-        indlarge = abs(tr.data) > abs_th
-        tr.data[indlarge] = 0
+        bad = ~np.isfinite(tr.data) | (np.abs(tr.data) > abs_th)
+        tr.data[bad] = 0
 
     return stream
 